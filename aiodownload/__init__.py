@@ -2,18 +2,30 @@
 """
 
 from .aiodownload import AioDownload, AioDownloadBundle
-from .api import one, each, swarm
-from .strategy import BackOff, DownloadStrategy, Lenient, RequestStrategy
+from .api import aeach, aone, aswarm, one, each, pool_each, pool_swarm, swarm
+from .strategy import (
+    Adaptive, BackOff, ContentAddressedDownloadStrategy, DownloadStrategy, Lenient, MemoryDownloadStrategy,
+    RequestStrategy, ShardedDownloadStrategy
+)
 
 
 __all__ = (
+    'Adaptive',
     'AioDownload',
     'AioDownloadBundle',
     'BackOff',
+    'ContentAddressedDownloadStrategy',
     'DownloadStrategy',
     'Lenient',
+    'MemoryDownloadStrategy',
     'RequestStrategy',
+    'ShardedDownloadStrategy',
+    'aeach',
+    'aone',
+    'aswarm',
     'one',
     'each',
+    'pool_each',
+    'pool_swarm',
     'swarm'
 )
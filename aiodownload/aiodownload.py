@@ -6,18 +6,51 @@ This module contains the core classes.
 import aiohttp
 import asyncio
 import async_timeout
+import collections
+import enum
 import logging
-import os
 
+from .loops import get_event_loop, get_loop_factory
+from .scheduler import HostScheduler, RetryScheduler
 from .strategy import DownloadStrategy, Lenient
+from .tracing import AttemptTiming, make_trace_config
+from .util import get_netloc, get_range_start, get_retry_after, get_validator
 
 logger = logging.getLogger(__name__)
 
-STATUS_ATTEMPT = 'Download attempted'
-STATUS_CACHE = 'Cache hit'
-STATUS_DONE = 'File written'
-STATUS_FAIL = 'Download failed'
-STATUS_INIT = 'Initialized'
+
+class Status(enum.IntEnum):
+    """Status of a bundle (an int, so a million of them can be stored in an
+    array); ``str()`` gives the status message
+    """
+
+    INIT = 0
+    ATTEMPT = 1
+    CACHE = 2
+    DONE = 3
+    FAIL = 4
+
+    @property
+    def message(self):
+        return STATUS_MESSAGES[self]
+
+    def __str__(self):
+        return STATUS_MESSAGES[self]
+
+
+STATUS_MESSAGES = {
+    Status.INIT: 'Initialized',
+    Status.ATTEMPT: 'Download attempted',
+    Status.CACHE: 'Cache hit',
+    Status.DONE: 'File written',
+    Status.FAIL: 'Download failed'
+}
+
+STATUS_ATTEMPT = Status.ATTEMPT
+STATUS_CACHE = Status.CACHE
+STATUS_DONE = Status.DONE
+STATUS_FAIL = Status.FAIL
+STATUS_INIT = Status.INIT
 
 
 class AioDownloadBundle:
@@ -32,60 +65,158 @@ class AioDownloadBundle:
     :type info: dict
     :param params: (optional) params for a POST request
     :type params: dict
+    :param priority: (optional) priority of the requests (higher values are handed a request slot first)
+    :type priority: int
+    :param deadline: (optional) event loop time (ex. ``loop.time() + 5``) the request should start by, used to
+        order bundles of equal priority (earliest first)
+    :type deadline: float
     """
 
-    def __init__(self, url, info=None, params=None):
+    # No __dict__ per bundle (a run may hold millions of them)
+    __slots__ = (
+        'attempts', 'body', 'bytes_received', 'coalesced', 'deadline', 'digest', 'encoding', 'file_path', 'info',
+        'params', 'priority', 'results', 'retry_after', 'retry_wait', 'slot_wait', 'status', 'timings', 'url'
+    )
+
+    def __init__(self, url, info=None, params=None, priority=0, deadline=None):
 
         self.attempts = 0  # value to be incremented by AioDownload when a request is attempted
+        self.body = None  # response content kept in memory by MemoryDownloadStrategy
+        self.bytes_received = 0  # content bytes received over all attempts
+        self.coalesced = False  # whether the outcome was shared by a bundle in flight for the same URL or file path
+        self.deadline = deadline
+        self.digest = None  # content digest recorded by content addressed download strategies
+        self.encoding = None  # content encoding the body is stored with (None if uncompressed)
         self.file_path = None  # determined by DownloadStrategy.url_transform
         self.info = info
         self.params = params
+        self.priority = priority
+        self.results = None  # results of the chunk processors of the download strategy, by name
+        self.retry_after = None  # seconds asked for by the Retry-After header of the last response
+        self.retry_wait = 0  # seconds spent waiting out sleep times and open circuits
+        self.slot_wait = 0  # seconds spent waiting for a request slot (and a turn in the rate limits)
+        self.status = Status.INIT  # set by AioDownload depending of the where it is in the flow of execution
+        self.timings = None  # AttemptTiming of every attempt (when AioDownload traces requests)
         self.url = url
-        self._status_msg = STATUS_INIT  # set by AioDownload depending of the where it is in the flow of execution
+
+    def __str__(self):
+        return self.status_msg
 
     @property
     def status_msg(self):
         return '[URL: {}, File Path: {}, Attempts: {}, Status: {}]'.format(
-            self.url, self.file_path, self.attempts, self._status_msg
+            self.url, self.file_path, self.attempts, self.status.message
         )
 
+    @property
+    def _status_msg(self):
+        return self.status  # former name of the status
+
+    @_status_msg.setter
+    def _status_msg(self, status):
+        self.status = status
+
+    def share(self, bundle):
+        """Take the outcome of another bundle downloaded in place of this one
+
+        :param bundle: bundle in flight for the same URL or file path
+        :type bundle: :class:`AioDownloadBundle`
+
+        :return: None
+        """
+
+        for name in ('body', 'digest', 'encoding', 'file_path', 'results', 'status'):
+            setattr(self, name, getattr(bundle, name))
+        self.coalesced = True
+
 
 class AioDownload:
     """The core class responsible for the coordination of requests and downloads
 
+    The event loop is the one given, else a new loop made by ``loop_factory``,
+    else the running (or current) event loop.  The default client session is
+    created on the first request, on that loop.  A client session given for a
+    download strategy storing responses encoded (``store_encoded``) should be
+    created with ``auto_decompress=False``.
+
     :param client: (optional) client session, a default is instantiated if not provided
     :type client: :class:`aiohttp.ClientSession`
     :param download_strategy: (optional) download strategy, a default is instantiated if not provided
     :type download_strategy: :class:`aiodownload.DownloadStrategy`
     :param request_strategy: (optional) request strategy, a :class:`Lenient` strategy is instantiated if not provided
     :type request_strategy: :class:`aiodownload.RequestStrategy`
+    :param loop: (optional) event loop the downloads run on (the one the client session was created on)
+    :type loop: :class:`asyncio.AbstractEventLoop`
+    :param loop_factory: (optional) callable object returning a new event loop, or its name (ex. uvloop)
+    :type loop_factory: str or callable object
+    :param trace: (optional) record the timings of every attempt on the bundles (see :class:`AttemptTiming`)
+    :type trace: bool
+    :param metrics: (optional) registry aggregating counters and latency histograms (implies trace)
+    :type metrics: :class:`aiodownload.metrics.MetricsRegistry`
+    :param coalesce: (optional) share one download between bundles in flight for the same URL or file path
+    :type coalesce: bool
     """
 
-    def __init__(self, client=None, download_strategy=None, request_strategy=None):
-
-        if not client:
-            # Get the event loop and initialize a client session if not provided
-            self.loop = asyncio.get_event_loop()
-            self.client = aiohttp.ClientSession(loop=self.loop)
-        else:
-            # Or grab the event loop from the client session
-            self.loop = client._loop
-            self.client = client
+    def __init__(self, client=None, download_strategy=None, request_strategy=None, loop=None, loop_factory=None,
+                 trace=False, metrics=None, coalesce=True):
 
         # Configuration objects managing download and request strategies
         self._download_strategy = download_strategy or DownloadStrategy()  # chunk_size, home, skip_cached
-        self._request_strategy = request_strategy or Lenient()  # concurrent, max_attempts, timeout
+        self._request_strategy = request_strategy or Lenient()  # concurrent, max_attempts, timeout, ...
+
+        loop_factory = get_loop_factory(loop_factory)
+        self.loop = loop or (loop_factory() if loop_factory else get_event_loop())
+        self._client = client
+
+        # Per attempt timings (the connection phases are traced on the default client session only)
+        self.trace = trace or metrics is not None
+        self.metrics = metrics
+
+        # Host scheduler guards how many requests can run concurrently (globally and per host)
+        self._host_scheduler = HostScheduler(self._request_strategy)
 
-        # Bounded semaphore guards how many requests can run concurrently
-        self._main_semaphore = asyncio.BoundedSemaphore(self._request_strategy.concurrent)
+        # Bundles waiting out their sleep time between attempts (without holding a request slot)
+        self._retry_scheduler = RetryScheduler()
+
+        # Futures of the bundles in flight by URL and file path (duplicates wait for them instead of downloading)
+        self.coalesce = coalesce
+        self.duplicates = 0
+        self._in_flight = {}
+
+    @property
+    def client(self):
+        """Client session making the requests (the default one is created on
+        first use, which has to happen on the event loop of the instance)
+
+        :rtype: :class:`aiohttp.ClientSession`
+        """
+
+        if self._client is None:
+            self._client = aiohttp.ClientSession(
+                auto_decompress=not self._download_strategy.store_encoded,
+                connector=self._request_strategy.get_connector(loop=self.loop),
+                trace_configs=[make_trace_config()] if self.trace else None
+            )
+
+        return self._client
 
     async def main(self, bundle):
         """Main entry point for task creation with an asyncio event loop.
 
-        The number of concurrent requests is throttled using this async
-        method.  Depending on the download strategy used, the method will call
-        the request_and_download async method or immediately return the bundle
-        indicating that the file came from cache as the file existed.
+        The number of concurrent requests (in total and per host) is
+        throttled using this async method.  Depending on the download strategy
+        used, the method will call the request_and_download async method or
+        immediately return the bundle indicating that the file came from cache
+        as the file existed.
+
+        Sleeping between attempts happens in the retry scheduler, outside of
+        the host scheduler, so a bundle backing off does not hold a request
+        slot.
+
+        A bundle whose URL or file path is already in flight waits for that
+        download and shares its outcome instead of making a request (see
+        :meth:`AioDownloadBundle.share`); the number of such duplicates is
+        kept on ``duplicates``.
 
         :param bundle: bundle (generally one that has just been instantiated)
         :type bundle: :class:`aiodownload.AioDownloadBundle`
@@ -94,32 +225,141 @@ class AioDownload:
         :rtype bundle: :class:`aiodownload.AioDownloadBundle`
         """
 
-        with (await self._main_semaphore):
-
+        if bundle.file_path is None:  # unless planned ahead (see plan_file_paths)
             bundle.file_path = self._download_strategy.get_file_path(bundle)
-            file_exists = os.path.isfile(bundle.file_path)
 
-            if not (file_exists and self._download_strategy.skip_cached):
+        if not self.coalesce:
+            return await self._download(bundle)
+
+        keys = [('url', bundle.url)] if bundle.file_path is None else [('url', bundle.url), ('path', bundle.file_path)]
+
+        while True:
+
+            in_flight = next((self._in_flight[key] for key in keys if key in self._in_flight), None)
+            if in_flight is None:
+                break
+
+            # Shielded so a duplicate being cancelled doesn't cancel the download it waits for
+            shared = await asyncio.shield(in_flight)
+            if shared is not None:
+                return self._share(bundle, shared)
+            # else the download ended without an outcome (cancelled or raised): make the request after all
+
+        future = self.loop.create_future()
+        for key in keys:
+            self._in_flight[key] = future
+
+        try:
+            bundle = await self._download(bundle)
+        finally:
+            for key in keys:
+                del self._in_flight[key]
+            future.set_result(bundle if bundle.status > Status.ATTEMPT else None)
+
+        return bundle
+
+    def _share(self, bundle, shared):
+
+        bundle.share(shared)
+        self.duplicates += 1
+
+        if logger.isEnabledFor(logging.INFO):
+            logger.info('Coalesced {} with {}'.format(bundle.url, shared.url))
+        if self.metrics is not None:
+            self.metrics.inc('coalesced_total')
+
+        return bundle
+
+    async def _download(self, bundle):
+
+        host = get_netloc(bundle.url)
 
-                while bundle._status_msg in (STATUS_ATTEMPT, STATUS_INIT, ):
+        if not await self._download_strategy.is_cached(bundle):
 
-                    if bundle._status_msg == STATUS_ATTEMPT:
-                        logger.info(bundle.status_msg)
+            while bundle.status <= Status.ATTEMPT:  # INIT or ATTEMPT
 
-                    sleep_time = self._request_strategy.get_sleep_time(bundle)
+                if bundle.status == Status.ATTEMPT and logger.isEnabledFor(logging.INFO):
+                    logger.info(bundle.status_msg)
+
+                waited = self.loop.time()
+
+                sleep_time = self._request_strategy.get_sleep_time(bundle)
+                if logger.isEnabledFor(logging.DEBUG):
                     logger.debug('Sleeping {} seconds between requests'.format(sleep_time))
-                    await asyncio.sleep(sleep_time)
+                await self._retry_scheduler.wait(bundle, sleep_time)
+
+                bundle.retry_wait += self.loop.time() - waited
+
+                if not await self._acquire_slot(bundle, host):
+                    logger.warning('{} Circuit open for {}'.format(bundle.status_msg, host))
+                    await self._download_strategy.on_fail(bundle)
+                    bundle.status = Status.FAIL
+                    break
 
+                try:
                     bundle = await self.request_and_download(bundle)
+                finally:
+                    self._host_scheduler.release(host)
 
-            else:
+        else:
 
-                bundle._status_msg = STATUS_CACHE
+            bundle.status = Status.CACHE
 
+        if logger.isEnabledFor(logging.INFO):
             logger.info(bundle.status_msg)
 
+        if self.metrics is not None:
+            self.metrics.inc('downloads_total', status=bundle.status.name.lower())
+            self.metrics.observe('retry_wait_seconds', bundle.retry_wait)
+            self.metrics.observe('slot_wait_seconds', bundle.slot_wait)
+
         return bundle
 
+    async def _acquire_slot(self, bundle, host):
+
+        while True:
+
+            # The slot comes with a token of the rate limits, unless the circuit of the host is open (see HostScheduler)
+            waited = self.loop.time()
+            delay = await self._host_scheduler.acquire(host, bundle.priority, bundle.deadline)
+            bundle.slot_wait += self.loop.time() - waited
+
+            if delay == 0:
+                return True
+
+            # Wait without holding up other hosts (or give up when the circuit fails fast)
+            if delay is None:
+                return False
+            waited = self.loop.time()
+            await self._retry_scheduler.wait(bundle, delay)
+            bundle.retry_wait += self.loop.time() - waited
+
+    def plan_file_paths(self, bundles):
+        """Set the file paths of a batch of bundles before downloading them,
+        disambiguating collisions (see :meth:`DownloadStrategy.plan_file_paths`)
+
+        :param bundles: bundles
+        :type bundles: list
+
+        :return: bundles whose file path was disambiguated
+        :rtype: list
+        """
+
+        return self._download_strategy.plan_file_paths(bundles)
+
+    async def close(self, client=True):
+        """Close the client session and release the resources of the strategies
+
+        :param client: (optional) close the client session too (False to keep a session shared with other code open)
+        :type client: bool
+
+        :return: None
+        """
+
+        if client and self._client is not None:
+            await self._client.close()
+        await self._download_strategy.close()
+
     async def request_and_download(self, bundle):
         """Make an HTTP request and write it to disk.  Use the download and
         request strategies of the instance to implement how this is achieved.
@@ -131,42 +371,247 @@ class AioDownload:
         :rtype bundle: :class:`aiodownload.AioDownloadBundle`
         """
 
-        with async_timeout.timeout(self._request_strategy.timeout):
+        response = None
+        started = self.loop.time()
+        latency = None  # until the response headers
+        failed = False  # whether the request failed (connection error, timeout, interrupted transfer)
+        cancelled = False
+        timing = None
+        if self.trace:
+            timing = AttemptTiming(self.loop)
+            if bundle.timings is None:
+                bundle.timings = []
+            bundle.timings.append(timing)
 
-            try:
+        try:
+
+            async with async_timeout.timeout(self._request_strategy.timeout):
 
                 bundle.attempts += 1
+                bundle.retry_after = None
+
+                headers = await self._download_strategy.get_request_headers(bundle)
 
                 client_method = getattr(self.client, 'post' if bundle.params else 'get')
-                async with client_method(bundle.url) as response:
+                # A given session decompressing responses is overridden per request (which needs aiohttp 3.9)
+                options = {}
+                if self._download_strategy.store_encoded and getattr(self.client, 'auto_decompress', False):
+                    options['auto_decompress'] = False
+                if timing is not None:
+                    options['trace_request_ctx'] = timing
+                async with client_method(bundle.url, headers=headers, **options) as response:
+
+                    latency = self.loop.time() - started
+
+                    if timing is not None:
+                        timing.response_started(response.status)
+
+                    if response.status == 304:
+
+                        # Not modified since the validators sent by the download strategy
+                        bundle.status = Status.CACHE
+                        return bundle
 
                     try:
 
                         self._request_strategy.assert_response(response)
-                        await self._download_strategy.on_success(response, bundle)
-                        bundle._status_msg = STATUS_DONE
+
+                        segments = self._download_strategy.get_segments(response)
+                        if segments:
+                            await self.download_segments(response, bundle, segments)
+                        else:
+                            await self._download_strategy.on_success(response, bundle)
+
+                        bundle.status = Status.DONE
 
                     except AssertionError:
 
+                        bundle.retry_after = get_retry_after(response.headers)
                         if self._request_strategy.retry(response):
+                            await self._retry_or_fail(bundle)
+                        else:
+                            await self._download_strategy.on_fail(bundle)
+                            bundle.status = Status.FAIL
 
-                            if bundle.attempts >= self._request_strategy.max_attempts:
+        except ValueError as err:
 
-                                await self._download_strategy.on_fail(bundle)
-                                bundle._status_msg = STATUS_FAIL
+            bundle.status = Status.FAIL
+            logger.warning(' '.join([bundle.status_msg, str(err)]))
 
-                            else:
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
 
-                                bundle._status_msg = STATUS_ATTEMPT
+            # Connection errors, timeouts and interrupted transfers are retried
+            failed = True
+            logger.warning(' '.join([bundle.status_msg, repr(err)]))
+            await self._retry_or_fail(bundle)
 
-                        else:
+        except asyncio.CancelledError:
 
-                            await self._download_strategy.on_fail(bundle)
-                            bundle._status_msg = STATUS_FAIL
+            cancelled = True  # the caller gave up, which says nothing about the server
+            raise
 
-            except ValueError as err:
+        finally:
 
-                bundle._status_msg = STATUS_FAIL
-                logger.warning(' '.join([bundle.status_msg, str(err)]))
+            if cancelled:
+                self._request_strategy.on_cancel(get_netloc(bundle.url), started)
+            elif failed or response is not None:
+                self._request_strategy.on_attempt(
+                    get_netloc(bundle.url),
+                    None if failed else response.status,
+                    self.loop.time() - started if latency is None else latency
+                )
+            self._end_attempt(bundle, response, timing)
 
         return bundle
+
+    def _end_attempt(self, bundle, response, timing):
+
+        received = response.content.total_bytes if response is not None else 0
+        bundle.bytes_received += received
+
+        if timing is None:
+            return
+
+        timing.finish(received)
+
+        if self.metrics is not None:
+            self.metrics.inc('requests_total', status=timing.status or 'error')
+            self.metrics.inc('received_bytes_total', received)
+            for phase, seconds in timing.get_phases().items():
+                self.metrics.observe('phase_seconds', seconds, phase=phase)
+
+    async def download_segments(self, response, bundle, segments):
+        """Download a file as byte ranges fetched concurrently and written at
+        their offsets into a preallocated file.
+
+        The first segment is read from the response already in hand (using
+        the slot of the bundle).  Every other segment is a Range request made
+        by a helper that first takes an extra slot from the host scheduler, so
+        segments count against the concurrency budget.  The bundle's own slot
+        keeps working through the segments no helper picked up, so the
+        download completes even when no extra slot frees up.
+
+        :param response: response (status 200) to the request of the bundle
+        :type response: :class:`aiohttp.ClientResponse`
+        :param bundle: bundle with it's url and file_path set
+        :type bundle: :class:`aiodownload.AioDownloadBundle`
+        :param segments: list of (start, end) byte ranges (inclusive) covering the file
+        :type segments: list
+
+        :return: None
+        """
+
+        host = get_netloc(bundle.url)
+        queue = collections.deque(segments[1:])
+        validator = get_validator(response.headers)
+
+        await self._download_strategy.preallocate(bundle, segments[-1][1] + 1)
+
+        async def work(reserved=False):
+            while queue:
+                start, end = queue.popleft()
+                await self._download_segment(bundle, start, end, validator, reserved)
+                reserved = False
+
+        helping = [False] * (len(segments) - 1)
+
+        async def helper(i):
+            if await self._host_scheduler.acquire(host, bundle.priority, bundle.deadline) != 0:
+                return  # turned away by the circuit of the host (the slot of the bundle works through the segments)
+            helping[i] = True
+            try:
+                await work(reserved=True)  # the slot came with a turn in the rate limits
+            finally:
+                self._host_scheduler.release(host)
+
+        helpers = [asyncio.ensure_future(helper(i)) for i in range(0, len(helping))]
+
+        try:
+
+            start, end = segments[0]
+            await self._download_strategy.write_segment(response, bundle, start, end)
+            await work()
+
+            # Helpers still waiting for a slot have nothing left to do
+            for i, task in enumerate(helpers):
+                if not helping[i]:
+                    task.cancel()
+
+            for task in helpers:
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+
+        finally:
+
+            for task in helpers:
+                task.cancel()
+
+            # Helpers left running would keep writing into a file being discarded or retried (and hold their slots)
+            await asyncio.gather(*helpers, return_exceptions=True)
+
+        await self._download_strategy.after_write(response, bundle)
+
+    async def _download_segment(self, bundle, start, end, validator, reserved=False):
+
+        host = get_netloc(bundle.url)
+
+        # A segment is a request of its own for the rate limits (its turn is waited out on the slot it holds)
+        delay = 0 if reserved else self._request_strategy.reserve_rate(host)
+        if delay > 0:
+            waited = self.loop.time()
+            await self._retry_scheduler.wait(bundle, delay)
+            bundle.slot_wait += self.loop.time() - waited
+
+        headers = {'Range': 'bytes={}-{}'.format(start, end)}
+        if validator:
+            headers['If-Range'] = validator
+
+        started = self.loop.time()
+        status = None
+        failed = False
+        cancelled = False
+
+        try:
+
+            async with self.client.get(bundle.url, headers=headers) as response:
+
+                latency = self.loop.time() - started
+                status = response.status
+
+                if status != 206 or get_range_start(response.headers.get('Content-Range')) != start:
+                    raise aiohttp.ClientPayloadError('Segment {}-{} of {} was not served as a range'.format(
+                        start, end, bundle.url
+                    ))
+
+                try:
+                    await self._download_strategy.write_segment(response, bundle, start, end)
+                finally:
+                    bundle.bytes_received += response.content.total_bytes
+
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+
+            failed = True
+            raise
+
+        except asyncio.CancelledError:
+
+            cancelled = True
+            raise
+
+        finally:
+
+            # Fed back like the request of the bundle (see request_and_download)
+            if not cancelled and (failed or status is not None):
+                self._request_strategy.on_attempt(
+                    host, None if failed else status, self.loop.time() - started if status is None else latency
+                )
+
+    async def _retry_or_fail(self, bundle):
+
+        if bundle.attempts >= self._request_strategy.max_attempts:
+            await self._download_strategy.on_fail(bundle)
+            bundle.status = Status.FAIL
+        else:
+            bundle.status = Status.ATTEMPT
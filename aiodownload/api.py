@@ -5,70 +5,490 @@ benefits of asynchronous HTTP requests while dropping one of these functions
 into a synchronous code flow.  For basic usage, no prior knowledge of
 asynchronous programming or asyncio is required.  Simply import aiodownload
 and call the functions with some URLs.
+
+The coroutine counterparts (:func:`aone`, :func:`aswarm` and :func:`aeach`)
+run on the event loop they are awaited on, for use inside an asyncio
+application (ex. an aiohttp web service).
 """
 
 import asyncio
+import collections
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import zlib
+from concurrent.futures.process import BrokenProcessPool
 
 from . import AioDownloadBundle, AioDownload
+from .loops import get_loop_factory
+from .results import ResultTable
+from .util import get_netloc
+
+DEFAULT_WINDOW = 1000  # default maximum number of bundles in flight for each()
+WORKER_POLL_INTERVAL = 1  # seconds between checks of the worker processes of pool_each() while none reports
 
 
-def one(url_or_bundle, download=None):
+def one(url_or_bundle, download=None, loop_factory=None):
     """Make one HTTP request and download it
 
     :param url_or_bundle: a URL string or bundle
     :type url_or_bundle: str or :class:`AioDownloadBundle`
     :param download: (optional) your own customized download object
     :type download: :class:`AioDownload`
+    :param loop_factory: (optional) event loop factory (or its name, ex. uvloop) of the default download object
+    :type loop_factory: str or callable object
     :return: a bundle
     :rtype: :class:`AioDownloadBundle`
     """
 
-    return swarm([url_or_bundle], download=download)[0]
+    return swarm([url_or_bundle], download=download, loop_factory=loop_factory)[0]
 
 
-def swarm(iterable, download=None):
+def swarm(iterable, download=None, loop_factory=None, columnar=False, plan=False):
     """Make a swarm of requests and download them
 
     :param iterable: an iterable object (ex. list of URL strings)
     :type iterable: iterable object
     :param download: (optional) your own customized download object
     :type download: :class:`AioDownload`
-    :return: a list of bundles
+    :param loop_factory: (optional) event loop factory (or its name, ex. uvloop) of the default download object
+    :type loop_factory: str or callable object
+    :param columnar: (optional) return a :class:`aiodownload.results.ResultTable` instead of the bundles
+    :type columnar: bool
+    :param plan: (optional) plan every file path (disambiguating collisions) before the first request
+    :type plan: bool
+    :return: a list of bundles (or a result table)
     :rtype: list
     """
 
-    return [e for e in each(iterable, download=download)]
+    bundles = each(iterable, download=download, loop_factory=loop_factory, plan=plan)
+
+    if not columnar:
+        return [e for e in bundles]
+
+    table = ResultTable()
+    for bundle in bundles:
+        table.append(bundle)
 
+    return table
 
-def each(iterable, url_map=None, download=None):
+
+def each(iterable, url_map=None, download=None, window=DEFAULT_WINDOW, ordered=False, loop_factory=None,
+         plan=False):
     """For each iterable object, map it to a URL and request asynchronously
 
+    Objects are pulled from the iterable lazily so that no more than
+    ``window`` downloads are in flight (or waiting to be yielded) at a time.
+    Bundles are yielded as soon as they complete unless ``ordered`` is set.
+    With ``plan`` set, the whole iterable is mapped to bundles up front so
+    that their file paths can be planned together, colliding paths of
+    distinct URLs being disambiguated before any request is made.
+
     :param iterable: an iterable object (ex. list of objects)
     :type iterable: iterable object
     :param url_map: (optional) callable object mapping an object to a url or bundle
     :type url_map: callable object
     :param download: (optional) your own customized download object
     :type download: :class:`AioDownload`
+    :param window: (optional) maximum number of bundles held in memory at once
+    :type window: int
+    :param ordered: (optional) yield bundles in the order of the iterable instead of completion order
+    :type ordered: bool
+    :param loop_factory: (optional) event loop factory (or its name, ex. uvloop) of the default download object
+    :type loop_factory: str or callable object
+    :param plan: (optional) plan every file path (disambiguating collisions) before the first request
+    :type plan: bool
     :return: generator
     """
 
-    download = download or AioDownload()
-    url_map = url_map or (lambda x: str(x))
+    own_loop = download is None and loop_factory is not None  # closed once done
+    download = download or AioDownload(loop_factory=loop_factory)
+
+    # Batches of completed bundles, so the loop is entered once per batch rather than once per bundle
+    batches = _each_batch(iterable, url_map, download, window, ordered, plan)
+
+    try:
+
+        while True:
+            try:
+                yield from download.loop.run_until_complete(batches.__anext__())
+            except StopAsyncIteration:
+                break
+
+    finally:
+
+        # Cancels anything left in flight if the consumer stopped early
+        download.loop.run_until_complete(batches.aclose())
+
+        download.loop.run_until_complete(download.close())
+        if own_loop:
+            download.loop.close()
+
+
+async def aone(url_or_bundle, download=None, client=None):
+    """Make one HTTP request and download it, on the running event loop
+
+    :param url_or_bundle: a URL string or bundle
+    :type url_or_bundle: str or :class:`AioDownloadBundle`
+    :param download: (optional) your own customized download object (left open)
+    :type download: :class:`AioDownload`
+    :param client: (optional) client session of the default download object (left open)
+    :type client: :class:`aiohttp.ClientSession`
+    :return: a bundle
+    :rtype: :class:`AioDownloadBundle`
+    """
+
+    return (await aswarm([url_or_bundle], download=download, client=client))[0]
+
+
+async def aswarm(iterable, download=None, client=None, columnar=False, plan=False):
+    """Make a swarm of requests and download them, on the running event loop
+
+    :param iterable: an iterable or asynchronous iterable object (ex. list of URL strings)
+    :type iterable: iterable object
+    :param download: (optional) your own customized download object (left open)
+    :type download: :class:`AioDownload`
+    :param client: (optional) client session of the default download object (left open)
+    :type client: :class:`aiohttp.ClientSession`
+    :param columnar: (optional) return a :class:`aiodownload.results.ResultTable` instead of the bundles
+    :type columnar: bool
+    :param plan: (optional) plan every file path (disambiguating collisions) before the first request
+    :type plan: bool
+    :return: a list of bundles (or a result table)
+    :rtype: list
+    """
+
+    bundles = aeach(iterable, download=download, client=client, plan=plan)
+
+    if not columnar:
+        return [e async for e in bundles]
+
+    table = ResultTable()
+    async for bundle in bundles:
+        table.append(bundle)
+
+    return table
+
+
+async def aeach(iterable, url_map=None, download=None, client=None, window=DEFAULT_WINDOW, ordered=False,
+                plan=False):
+    """For each (asynchronous) iterable object, map it to a URL and request
+    it on the running event loop (see :func:`each`)
+
+    An asynchronous iterable is only advanced while there is room in the
+    window, which pushes back on its producer, and is waited on alongside the
+    downloads in flight so bundles are yielded as soon as they complete.
+
+    A download object passed in is left open for further use; the default
+    one is closed once done, except for the client session when one is
+    passed in.
+
+    :param iterable: an iterable or asynchronous iterable object (ex. list of objects)
+    :type iterable: iterable object
+    :param url_map: (optional) callable object mapping an object to a url or bundle
+    :type url_map: callable object
+    :param download: (optional) your own customized download object
+    :type download: :class:`AioDownload`
+    :param client: (optional) client session of the default download object
+    :type client: :class:`aiohttp.ClientSession`
+    :param window: (optional) maximum number of bundles held in memory at once
+    :type window: int
+    :param ordered: (optional) yield bundles in the order of the iterable instead of completion order
+    :type ordered: bool
+    :param plan: (optional) plan every file path (disambiguating collisions) before the first request
+    :type plan: bool
+    :return: asynchronous generator
+    """
+
+    own_download = download is None
+    download = download or AioDownload(client=client)
+
+    batches = _each_batch(iterable, url_map, download, window, ordered, plan)
+
+    try:
+        async for batch in batches:
+            for bundle in batch:
+                yield bundle
+    finally:
+        await batches.aclose()  # cancels anything left in flight if the consumer stopped early
+        if own_download:
+            await download.close(client=client is None)
+
+
+async def _each_batch(iterable, url_map, download, window, ordered, plan):
+
+    if plan:
+        if hasattr(iterable, '__aiter__'):
+            bundles = [_make_bundle(i, url_map) async for i in iterable]
+        else:
+            bundles = [_make_bundle(i, url_map) for i in iterable]
+        download.plan_file_paths(bundles)
+        iterable, url_map = bundles, _identity
+
+    if hasattr(iterable, '__aiter__'):
+        iterator, asynchronous = iterable.__aiter__(), True
+    else:
+        iterator, asynchronous = iter(iterable), False
+
+    tasks = collections.deque()  # in-flight tasks (kept in input order)
+    getter = None  # pending __anext__ of an asynchronous iterable
+    exhausted = False
+
+    try:
+
+        while True:
+
+            # Top up the window from the iterable
+            if not asynchronous:
+                for i in itertools.islice(iterator, max(window - len(tasks), 0)):
+                    tasks.append(asyncio.ensure_future(download.main(_make_bundle(i, url_map))))
+            elif getter is None and not exhausted and len(tasks) < window:
+                getter = asyncio.ensure_future(iterator.__anext__())
+
+            if not tasks and getter is None:
+                break
+
+            if ordered and tasks and tasks[0].done():
+                batch = []
+                while tasks and tasks[0].done():
+                    batch.append(tasks.popleft().result())
+                yield batch
+                continue
+
+            waited = {tasks[0]} if ordered and tasks else set(tasks)
+            done, _ = await asyncio.wait(waited | ({getter} if getter else set()), return_when=asyncio.FIRST_COMPLETED)
+
+            if getter in done:
+                done.discard(getter)
+                try:
+                    i = getter.result()
+                except StopAsyncIteration:
+                    exhausted = True
+                else:
+                    tasks.append(asyncio.ensure_future(download.main(_make_bundle(i, url_map))))
+                getter = None
+
+            if not ordered and done:
+                tasks = collections.deque(task for task in tasks if task not in done)
+                yield [task.result() for task in done]
+
+    finally:
+
+        # Cancel anything left in flight if the consumer stopped early
+        if getter is not None:
+            tasks.append(getter)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks)
+
+
+def pool_swarm(iterable, url_map=None, download_factory=None, processes=None, window=DEFAULT_WINDOW, context=None,
+               loop_factory=None):
+    """Make a swarm of requests and download them across worker processes
+    (see :func:`pool_each`)
+
+    :param iterable: an iterable object (ex. list of URL strings)
+    :type iterable: iterable object
+    :param url_map: (optional) callable object mapping an object to a url or bundle
+    :type url_map: callable object
+    :param download_factory: (optional) callable object returning the download object of a worker process
+    :type download_factory: callable object
+    :param processes: (optional) number of worker processes, defaults to the number of CPUs
+    :type processes: int
+    :param window: (optional) maximum number of bundles in flight in each worker process
+    :type window: int
+    :param context: (optional) multiprocessing context used to start the worker processes
+    :type context: :class:`multiprocessing.context.BaseContext`
+    :param loop_factory: (optional) event loop factory (or its name, ex. uvloop) of the worker processes
+    :type loop_factory: str or callable object
+    :return: a list of bundles (in completion order)
+    :rtype: list
+    """
+
+    return [e for e in pool_each(iterable, url_map, download_factory, processes, window, context, loop_factory)]
+
+
+def pool_each(iterable, url_map=None, download_factory=None, processes=None, window=DEFAULT_WINDOW, context=None,
+              loop_factory=None):
+    """For each iterable object, map it to a URL and request it in one of
+    several worker processes, each running its own event loop and
+    :class:`AioDownload` (and with it its own session).
+
+    Bundles are sharded across the workers by host, so connections to a host
+    are reused within one worker, and yielded as soon as a worker completes
+    them.  A feeder thread pulls from the iterable lazily as the workers make
+    room, so no more than ``window`` bundles per worker are in flight.
+
+    The download object can't be shared between processes: ``download_factory``
+    is called in every worker instead and has to be picklable when the
+    multiprocessing start method isn't fork (ex. a module level function or a
+    :func:`functools.partial` of :class:`AioDownload` and picklable strategies).
+    Bundles travel between processes pickled.  A worker process which exits
+    without reporting back (ex. killed or crashed) raises
+    :class:`concurrent.futures.process.BrokenProcessPool`.
+
+    :param iterable: an iterable object (ex. list of objects)
+    :type iterable: iterable object
+    :param url_map: (optional) callable object mapping an object to a url or bundle (called in this process)
+    :type url_map: callable object
+    :param download_factory: (optional) callable object returning the download object of a worker process
+    :type download_factory: callable object
+    :param processes: (optional) number of worker processes, defaults to the number of CPUs
+    :type processes: int
+    :param window: (optional) maximum number of bundles in flight in each worker process
+    :type window: int
+    :param context: (optional) multiprocessing context used to start the worker processes
+    :type context: :class:`multiprocessing.context.BaseContext`
+    :param loop_factory: (optional) event loop factory (or its name, ex. uvloop) of the worker processes
+    :type loop_factory: str or callable object
+    :return: generator
+    """
+
+    processes = processes or os.cpu_count() or 1
+    context = context or multiprocessing.get_context()
+
+    inboxes = [context.Queue(window) for _ in range(0, processes)]
+    outbox = context.Queue(processes * window)
+    stop = threading.Event()
+
+    workers = [
+        context.Process(target=_work, args=(download_factory, loop_factory, window, inbox, outbox), daemon=True)
+        for inbox in inboxes
+    ]
+    for worker in workers:
+        worker.start()
+
+    feeder = threading.Thread(target=_feed, args=(iterable, url_map, inboxes, outbox, stop), daemon=True)
+    feeder.start()
+
+    running = processes
+    reported = set()  # pids of the workers done
+    exited = set()  # pids of the workers found exited without having reported yet
+
+    try:
+
+        while running:
+
+            try:
+                kind, payload = outbox.get(timeout=WORKER_POLL_INTERVAL)
+            except queue.Empty:
+                # What a worker put before exiting is readable by the next poll, so a worker still silent then is dead
+                lost = set(w.pid for w in workers if w.exitcode is not None and w.pid not in reported)
+                if lost & exited:
+                    raise BrokenProcessPool('A worker process exited without reporting back (exit codes {})'.format(
+                        sorted(w.exitcode for w in workers if w.pid in lost & exited)
+                    ))
+                exited = lost
+                continue
+
+            if kind == 'bundle':
+                yield payload
+            elif kind == 'done':
+                reported.add(payload)
+                running -= 1
+            else:
+                raise payload
+
+    finally:
+
+        # Stop the feeder, and the workers if the consumer stopped early
+        stop.set()
+        for worker in workers:
+            if running:
+                worker.terminate()
+            worker.join()
+
+
+def _identity(i):
+    return i
+
+
+def _make_bundle(i, url_map):
+
+    bundle = (url_map or str)(i)
+    if not isinstance(bundle, AioDownloadBundle):
+        bundle = AioDownloadBundle(bundle)
+
+    if i != bundle.url:
+        bundle.info = i
+
+    return bundle
+
+
+def _get_shard(bundle, shards):
+
+    # crc32 rather than hash() which is salted differently in every process
+    return zlib.crc32(get_netloc(bundle.url).encode()) % shards
+
+
+def _put(q, item, stop):
+
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+
+    return False
+
+
+def _feed(iterable, url_map, inboxes, outbox, stop):
+
+    try:
+        for i in iterable:
+            bundle = _make_bundle(i, url_map)
+            if not _put(inboxes[_get_shard(bundle, len(inboxes))], bundle, stop):
+                return
+    except Exception as exc:
+        _put(outbox, ('error', exc), stop)
+    finally:
+        for inbox in inboxes:
+            _put(inbox, None, stop)  # no more bundles
+
+
+def _work(download_factory, loop_factory, window, inbox, outbox):
+
+    # Never reuse the event loop of the parent process (inherited when forked)
+    asyncio.set_event_loop((get_loop_factory(loop_factory) or asyncio.new_event_loop)())
+
+    download = download_factory() if download_factory else AioDownload()
+
+    try:
+        download.loop.run_until_complete(_work_async(download, window, inbox, outbox))
+    except Exception as exc:
+        outbox.put(('error', exc))
+    finally:
+        download.loop.run_until_complete(download.close())
+        outbox.put(('done', os.getpid()))
+
+
+async def _work_async(download, window, inbox, outbox):
 
-    tasks = []
-    for i in iterable:
+    loop = download.loop
+    tasks = set()
+    getter = None
+    exhausted = False
 
-        bundle = url_map(i)
-        if not isinstance(bundle, AioDownloadBundle):
-            bundle = AioDownloadBundle(bundle)
+    while tasks or not exhausted:
 
-        if i != bundle.url:
-            bundle.info = i
+        # Wait for the next bundle from the feeder in a thread while there is room
+        if getter is None and not exhausted and len(tasks) < window:
+            getter = loop.run_in_executor(None, inbox.get)
 
-        tasks.append(download.loop.create_task(download.main(bundle)))
+        done, _ = await asyncio.wait(tasks | ({getter} if getter else set()), return_when=asyncio.FIRST_COMPLETED)
 
-    for task_set in download.loop.run_until_complete(asyncio.wait(tasks)):
-        for task in task_set:
-            yield task.result()
+        if getter in done:
+            done.discard(getter)
+            bundle, getter = getter.result(), None
+            if bundle is None:
+                exhausted = True
+            else:
+                tasks.add(loop.create_task(download.main(bundle)))
 
-    download.client.close()
+        for task in done:
+            tasks.discard(task)
+            await loop.run_in_executor(None, outbox.put, ('bundle', task.result()))
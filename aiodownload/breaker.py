@@ -0,0 +1,149 @@
+"""Circuit Breaking
+
+This module contains a per host circuit breaker which can be attached to a
+:class:`aiodownload.RequestStrategy` so that a host which is down is probed
+now and then instead of being hit with every attempt of every bundle.
+"""
+
+import asyncio
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class _Circuit:
+
+    __slots__ = ('failures', 'opened', 'probing')
+
+    def __init__(self):
+        self.failures = 0  # consecutive failures
+        self.opened = None  # time the circuit opened (None while closed)
+        self.probing = None  # time the probe request was let through (None if there is none in flight)
+
+
+class CircuitBreaker:
+    """Circuit breakers for hosts.
+
+    A host's circuit opens after ``failures`` consecutive failed requests
+    (connection errors, timeouts or 5xx responses).  While it is open, the
+    bundles for the host wait (or fail right away with ``fast_fail``) rather
+    than making requests.  Once ``reset_timeout`` has passed, a single probe
+    request is let through (half-open): its success closes the circuit and
+    its failure opens it for another ``reset_timeout``.  No other probe is let
+    through until the outcome of the probe is recorded (or the probe is
+    cancelled, see :meth:`cancel`), however long it takes.
+
+    :param failures: (optional) consecutive failures opening the circuit of a host
+    :type failures: int
+    :param reset_timeout: (optional) seconds the circuit stays open before a probe request
+    :type reset_timeout: float
+    :param fast_fail: (optional) fail the bundles of an open circuit instead of holding them back
+    :type fast_fail: bool
+    :param poll_interval: (optional) seconds between checks of bundles waiting for the outcome of a probe
+    :type poll_interval: float
+    """
+
+    def __init__(self, failures=5, reset_timeout=30, fast_fail=False, poll_interval=1):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.fast_fail = fast_fail
+        self.poll_interval = poll_interval
+        self._circuits = {}
+
+    def get_state(self, host, now=None):
+        """Returns the state of the circuit of the host
+
+        :param host: host (netloc) of the request
+        :type host: str
+        :param now: (optional) current time, defaults to the event loop's clock
+        :type now: float
+
+        :return: closed, open or half-open
+        :rtype: str
+        """
+
+        circuit = self._circuits.get(host)
+        if circuit is None or circuit.opened is None:
+            return CLOSED
+
+        if now is None:
+            now = asyncio.get_event_loop().time()
+
+        return OPEN if now - circuit.opened < self.reset_timeout else HALF_OPEN
+
+    def get_delay(self, host, now=None, claim=True):
+        """Check whether a request for the host may be made (letting the
+        probe request through once the circuit is half-open)
+
+        :param host: host (netloc) of the request
+        :type host: str
+        :param now: (optional) current time, defaults to the event loop's clock
+        :type now: float
+        :param claim: (optional) take the probe when the request may be made (else only check)
+        :type claim: bool
+
+        :return: 0 if the request may be made, else seconds to wait before checking again (None to fail fast)
+        :rtype: float
+        """
+
+        circuit = self._circuits.get(host)
+        if circuit is None or circuit.opened is None:
+            return 0
+
+        if now is None:
+            now = asyncio.get_event_loop().time()
+
+        reopen = circuit.opened + self.reset_timeout
+        if now < reopen:
+            return None if self.fast_fail else reopen - now
+
+        if circuit.probing is None:
+            if claim:
+                circuit.probing = now
+            return 0
+
+        return None if self.fast_fail else self.poll_interval
+
+    def cancel(self, host, started):
+        """Let another probe through when the cancelled request was the probe
+        of the host (its outcome will never be recorded)
+
+        :param host: host (netloc) of the request
+        :type host: str
+        :param started: event loop time the request was started
+        :type started: float
+
+        :return: None
+        """
+
+        # The probe is the only request let through since the circuit went half-open
+        circuit = self._circuits.get(host)
+        if circuit is not None and circuit.probing is not None and started >= circuit.probing:
+            circuit.probing = None
+
+    def record(self, host, success, now=None):
+        """Record the outcome of a request for the host
+
+        :param host: host (netloc) of the request
+        :type host: str
+        :param success: whether the host answered (a response other than 5xx)
+        :type success: bool
+        :param now: (optional) current time, defaults to the event loop's clock
+        :type now: float
+
+        :return: None
+        """
+
+        if success:
+            self._circuits.pop(host, None)
+            return
+
+        circuit = self._circuits.get(host)
+        if circuit is None:
+            circuit = self._circuits[host] = _Circuit()
+
+        circuit.failures += 1
+        if circuit.opened is not None or circuit.failures >= self.failures:
+            circuit.opened = asyncio.get_event_loop().time() if now is None else now
+            circuit.probing = None
@@ -0,0 +1,118 @@
+"""Adaptive Concurrency
+
+This module contains an AIMD (additive increase, multiplicative decrease)
+concurrency limit used by :class:`aiodownload.Adaptive` to find how many
+requests a server takes before it slows down or starts refusing them.
+"""
+
+# Statuses telling the client to slow down (any other status is a healthy answer, even a 404)
+OVERLOAD_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+
+class AimdLimit:
+    """A concurrency limit which grows by ``increase`` for every round of
+    healthy responses (``limit`` of them) and shrinks by ``decrease`` on an
+    overload: an error status, a failed request (timeout, connection error)
+    or a latency above ``latency_factor`` times the fastest one seen from the
+    same host (hosts answer at their own pace, so a limit shared by several
+    hosts compares each one with itself).
+
+    The responses to the requests already in flight when the limit shrinks
+    can't reflect the new limit, so no further decrease happens until as
+    many responses as the new limit have come back.
+
+    :param limit: (optional) initial limit
+    :type limit: int
+    :param min_limit: (optional) lowest limit
+    :type min_limit: int
+    :param max_limit: (optional) highest limit
+    :type max_limit: int
+    :param increase: (optional) requests added to the limit per round of healthy responses
+    :type increase: float
+    :param decrease: (optional) factor applied to the limit on an overload
+    :type decrease: float
+    :param latency_factor: (optional) latency growth (over the fastest response) taken as an overload (None to ignore)
+    :type latency_factor: float
+    """
+
+    def __init__(self, limit=2, min_limit=1, max_limit=64, increase=1, decrease=0.5, latency_factor=3):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self._base_latencies = {}  # host -> fastest healthy response seen
+        self._limit = float(min(max(limit, min_limit), max_limit))
+        self._holdoff = 0  # responses to ignore for decreases (sent under a former limit)
+
+    @property
+    def limit(self):
+        """Current limit
+
+        :rtype: int
+        """
+
+        return int(self._limit)
+
+    def get_base_latency(self, host=None):
+        """Returns the fastest healthy response seen from the host
+
+        :param host: (optional) host (netloc) of the requests
+        :type host: str
+
+        :return: latency in seconds (None if there was none yet)
+        :rtype: float
+        """
+
+        return self._base_latencies.get(host)
+
+    def is_overload(self, status, latency, host=None):
+        """Whether a response (or failed request) says the server is overloaded
+
+        :param status: HTTP status (None if the request failed)
+        :type status: int
+        :param latency: seconds until the response headers (or the failure)
+        :type latency: float
+        :param host: (optional) host (netloc) of the request
+        :type host: str
+
+        :rtype: bool
+        """
+
+        if status is None or status in OVERLOAD_STATUSES:
+            return True
+
+        base_latency = self._base_latencies.get(host)
+
+        return bool(
+            self.latency_factor and base_latency and latency is not None and
+            latency > self.latency_factor * base_latency
+        )
+
+    def update(self, status, latency, host=None):
+        """Adjust the limit for the outcome of a request
+
+        :param status: HTTP status (None if the request failed)
+        :type status: int
+        :param latency: seconds until the response headers (or the failure)
+        :type latency: float
+        :param host: (optional) host (netloc) of the request
+        :type host: str
+
+        :return: None
+        """
+
+        if self._holdoff:
+            self._holdoff -= 1
+
+        if self.is_overload(status, latency, host):
+            if not self._holdoff:
+                self._limit = max(self._limit * self.decrease, self.min_limit)
+                self._holdoff = self.limit
+            return
+
+        base_latency = self._base_latencies.get(host)
+        if latency is not None and latency > 0 and (base_latency is None or latency < base_latency):
+            self._base_latencies[host] = latency
+
+        self._limit = min(self._limit + self.increase / self._limit, self.max_limit)
@@ -0,0 +1,299 @@
+"""File I/O
+
+This module contains an asynchronous file wrapper (and a few blocking file
+helpers meant to be run in an executor) used by the download strategies so
+that disk latency doesn't block the event loop (and with it every other
+download in flight).
+"""
+
+import asyncio
+import functools
+import json
+import os
+import shutil
+
+
+def _write_chunks(f, chunks):
+
+    for chunk in chunks:
+        f.write(chunk)
+
+    return sum(len(chunk) for chunk in chunks)
+
+
+def touch(file_path):
+    """Create (or truncate) an empty file
+
+    :param file_path: file path
+    :type file_path: str
+
+    :return: None
+    """
+
+    open(file_path, 'wb+').close()
+
+
+def preallocate(file_path, length):
+    """Create (or truncate) a file and extend it to a length
+
+    :param file_path: file path
+    :type file_path: str
+    :param length: length in bytes
+    :type length: int
+
+    :return: None
+    """
+
+    with open(file_path, 'wb') as f:
+        f.truncate(length)
+
+
+def file_size(file_path):
+    """Return the size of a file (0 if it doesn't exist)
+
+    :param file_path: file path
+    :type file_path: str
+
+    :return: size in bytes
+    :rtype: int
+    """
+
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+
+def read_json(file_path):
+    """Read a JSON file (None if it doesn't exist or can't be parsed)
+
+    :param file_path: file path
+    :type file_path: str
+
+    :return: parsed content
+    """
+
+    try:
+        with open(file_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(file_path, data):
+    """Write data to a JSON file
+
+    :param file_path: file path
+    :type file_path: str
+    :param data: JSON serializable data
+    :type data: object
+
+    :return: None
+    """
+
+    with open(file_path, 'w') as f:
+        json.dump(data, f)
+
+
+def remove(*file_paths):
+    """Remove files, ignoring the ones that don't exist
+
+    :param file_paths: file paths
+    :type file_paths: str
+
+    :return: None
+    """
+
+    for file_path in file_paths:
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+
+
+def store_object(temp_path, object_path):
+    """Move a temporary file to its content addressed path unless an object
+    with the same content is already stored there
+
+    :param temp_path: temporary file path
+    :type temp_path: str
+    :param object_path: content addressed file path
+    :type object_path: str
+
+    :return: True if the object is new
+    :rtype: bool
+    """
+
+    if os.path.isfile(object_path):
+        os.remove(temp_path)
+        return False
+
+    os.makedirs(os.path.dirname(object_path), exist_ok=True)
+    os.replace(temp_path, object_path)
+
+    return True
+
+
+def hardlink(source_path, link_path):
+    """Hardlink a file, replacing whatever is at the link path (the file is
+    copied where it can't be linked, ex. across file systems)
+
+    :param source_path: existing file path
+    :type source_path: str
+    :param link_path: file path of the link
+    :type link_path: str
+
+    :return: True if the link was made (False if the file was copied)
+    :rtype: bool
+    """
+
+    temp_path = link_path + '.link'
+    remove(temp_path)  # left by an interrupted run
+
+    try:
+        os.link(source_path, temp_path)
+        linked = True
+    except OSError:
+        shutil.copyfile(source_path, temp_path)
+        linked = False
+
+    os.replace(temp_path, link_path)
+
+    return linked
+
+
+class AsyncFile:
+    """A file whose blocking calls run in an executor.
+
+    Writes are queued and written behind the caller: :meth:`write` returns as
+    soon as the chunk is buffered and only waits for the disk when more than
+    ``max_buffer`` bytes are pending.  At most one write per file is handed to
+    the executor at a time so chunks land on disk in order.
+
+    :param file_path: file path
+    :type file_path: str
+    :param mode: (optional) mode the file is opened with
+    :type mode: str
+    :param executor: (optional) executor running the blocking calls (the loop's default if None)
+    :type executor: :class:`concurrent.futures.Executor`
+    :param max_buffer: (optional) number of bytes buffered before a write waits for the disk
+    :type max_buffer: int
+    :param opener: (optional) callable taking a file path and mode and returning a file object
+    :type opener: callable object
+    """
+
+    def __init__(self, file_path, mode='wb', executor=None, max_buffer=1048576, opener=open):
+        self.file_path = file_path
+        self.mode = mode
+        self.max_buffer = max_buffer
+        self._buffer = []
+        self._buffered = 0  # bytes not yet written to disk (buffered and in flight)
+        self._executor = executor
+        self._file = None
+        self._opener = opener
+        self._pending = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def open(self):
+        """Open the file
+
+        :return: None
+        """
+
+        self._file = await self._run(self._opener, self.file_path, self.mode)
+
+    async def write(self, data):
+        """Queue data to be written to the file
+
+        :param data: data to write
+        :type data: bytes
+
+        :return: None
+        """
+
+        if not data:
+            return
+
+        self._buffer.append(data)
+        self._buffered += len(data)
+
+        if self._pending is not None and (self._pending.done() or self._buffered > self.max_buffer):
+            await self._drain()
+
+        if self._pending is None:
+            self._submit()
+
+    async def read(self, size=-1):
+        """Wait for pending writes and read from the file
+
+        :param size: (optional) maximum number of bytes to read (-1 for the rest of the file)
+        :type size: int
+
+        :return: data read (empty at the end of the file)
+        :rtype: bytes
+        """
+
+        await self.flush()
+
+        return await self._run(self._file.read, size)
+
+    async def seek(self, offset):
+        """Wait for pending writes and move to an offset in the file
+
+        :param offset: offset from the start of the file
+        :type offset: int
+
+        :return: None
+        """
+
+        await self.flush()
+        await self._run(self._file.seek, offset)
+
+    async def flush(self):
+        """Wait until everything written so far has been handed to the file
+
+        :return: None
+        """
+
+        while self._pending is not None or self._buffer:
+            if self._pending is not None:
+                await self._drain()
+            if self._buffer:
+                self._submit()
+
+    async def close(self):
+        """Flush pending writes and close the file
+
+        :return: None
+        """
+
+        if self._file is None:
+            return
+
+        try:
+            await self.flush()
+        finally:
+            f, self._file = self._file, None
+            await self._run(f.close)
+
+    def _submit(self):
+
+        chunks, self._buffer = self._buffer, []
+        self._pending = asyncio.get_event_loop().run_in_executor(
+            self._executor, _write_chunks, self._file, chunks
+        )
+
+    async def _drain(self):
+
+        pending, self._pending = self._pending, None
+        self._buffered -= await pending
+
+    async def _run(self, func, *args):
+
+        return await asyncio.get_event_loop().run_in_executor(self._executor, functools.partial(func, *args))
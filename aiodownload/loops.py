@@ -0,0 +1,72 @@
+"""Event Loops
+
+This module contains the event loop factories :class:`AioDownload` and the
+API functions can run on (ex. ``loop_factory='uvloop'``).
+"""
+
+import asyncio
+import warnings
+
+
+def uvloop_factory():
+    """Returns a new uvloop event loop (requires the uvloop package)
+
+    :return: event loop
+    :rtype: :class:`uvloop.Loop`
+    """
+
+    import uvloop
+
+    return uvloop.new_event_loop()
+
+
+LOOP_FACTORIES = {
+    'asyncio': asyncio.new_event_loop,
+    'uvloop': uvloop_factory
+}
+
+
+def get_loop_factory(loop_factory):
+    """Resolve a loop factory given by name (see ``LOOP_FACTORIES``)
+
+    :param loop_factory: name or callable object returning a new event loop (or None)
+    :type loop_factory: str or callable object
+
+    :return: callable object returning a new event loop (or None)
+    :rtype: callable object
+    """
+
+    if loop_factory is None or callable(loop_factory):
+        return loop_factory
+
+    try:
+        return LOOP_FACTORIES[loop_factory]
+    except KeyError:
+        raise ValueError('Unknown event loop {} (expected one of {})'.format(
+            loop_factory, ', '.join(sorted(LOOP_FACTORIES))
+        ))
+
+
+def get_event_loop():
+    """Returns the running event loop, else the current event loop of the
+    thread (a new one is set if there is none)
+
+    :return: event loop
+    :rtype: :class:`asyncio.AbstractEventLoop`
+    """
+
+    loop = asyncio._get_running_loop()  # (asyncio.get_running_loop needs Python 3.7)
+    if loop is not None:
+        return loop
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)  # implicit loop creation is deprecated
+        try:
+            return asyncio.get_event_loop()
+        except RuntimeError:
+            pass
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    return loop
@@ -0,0 +1,188 @@
+"""Metrics
+
+This module contains a small registry of counters and latency histograms
+aggregated by :class:`AioDownload` across bundles (when given one), which can
+be exported in the Prometheus text exposition format while downloads run.
+"""
+
+import bisect
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # seconds
+
+
+class Histogram:
+    """Counts of observed values per bucket (upper bounds), with their sum
+
+    :param buckets: (optional) upper bounds of the buckets
+    :type buckets: tuple
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)  # per bucket, not cumulative (values above every bound aren't counted)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        """Record a value
+
+        :param value: value (ex. seconds)
+        :type value: float
+
+        :return: None
+        """
+
+        self.count += 1
+        self.sum += value
+
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            self.counts[i] += 1
+
+    def cumulative_counts(self):
+        """Returns the number of values less than or equal to each bucket bound
+
+        :rtype: list
+        """
+
+        counts = []
+        total = 0
+        for count in self.counts:
+            total += count
+            counts.append(total)
+
+        return counts
+
+
+class MetricsRegistry:
+    """Counters and histograms identified by a name and labels
+
+    :param prefix: (optional) prefix of the metric names when exported
+    :type prefix: str
+    :param buckets: (optional) upper bounds of the buckets of the histograms
+    :type buckets: tuple
+    """
+
+    def __init__(self, prefix='aiodownload', buckets=DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self._counters = {}  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> histogram
+
+    def inc(self, name, value=1, **labels):
+        """Increment a counter
+
+        :param name: name of the counter
+        :type name: str
+        :param value: (optional) increment
+        :type value: float
+        :param labels: labels of the counter
+
+        :return: None
+        """
+
+        key = _key(name, labels)
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Record a value in a histogram
+
+        :param name: name of the histogram
+        :type name: str
+        :param value: value (ex. seconds)
+        :type value: float
+        :param labels: labels of the histogram
+
+        :return: None
+        """
+
+        key = _key(name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def get_counter(self, name, **labels):
+        """Returns the value of a counter (0 if it was never incremented)
+
+        :param name: name of the counter
+        :type name: str
+        :param labels: labels of the counter
+
+        :rtype: float
+        """
+
+        return self._counters.get(_key(name, labels), 0)
+
+    def get_histogram(self, name, **labels):
+        """Returns a histogram (None if nothing was observed)
+
+        :param name: name of the histogram
+        :type name: str
+        :param labels: labels of the histogram
+
+        :rtype: :class:`Histogram`
+        """
+
+        return self._histograms.get(_key(name, labels))
+
+    def to_prometheus(self):
+        """Export the metrics in the Prometheus text exposition format
+
+        Safe to call from another thread than the one running the downloads
+        (ex. an HTTP handler), as the registry is only read.
+
+        :return: metrics
+        :rtype: str
+        """
+
+        lines = []
+
+        # Copies, the event loop thread may add metrics meanwhile
+        counters = sorted(list(self._counters.items()))
+        histograms = sorted(list(self._histograms.items()), key=lambda item: item[0])
+
+        typed = set()
+        for (name, labels), value in counters:
+            name = '{}_{}'.format(self.prefix, name)
+            if name not in typed:
+                lines.append('# TYPE {} counter'.format(name))
+                typed.add(name)
+            lines.append('{}{} {}'.format(name, _format_labels(labels), _format_value(value)))
+
+        for (name, labels), histogram in histograms:
+            name = '{}_{}'.format(self.prefix, name)
+            if name not in typed:
+                lines.append('# TYPE {} histogram'.format(name))
+                typed.add(name)
+            for bound, count in zip(histogram.buckets, histogram.cumulative_counts()):
+                bucket_labels = labels + (('le', _format_value(bound)),)
+                lines.append('{}_bucket{} {}'.format(name, _format_labels(bucket_labels), count))
+            lines.append('{}_bucket{} {}'.format(name, _format_labels(labels + (('le', '+Inf'),)), histogram.count))
+            lines.append('{}_sum{} {}'.format(name, _format_labels(labels), _format_value(histogram.sum)))
+            lines.append('{}_count{} {}'.format(name, _format_labels(labels), histogram.count))
+
+        return '\n'.join(lines) + '\n'
+
+
+def _key(name, labels):
+
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+def _format_labels(labels):
+
+    if not labels:
+        return ''
+
+    return '{' + ','.join('{}="{}"'.format(name, _escape(value)) for name, value in labels) + '}'
+
+
+def _escape(value):
+
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
@@ -0,0 +1,163 @@
+"""Chunk Processors
+
+This module contains processors which see the content of a response chunk by
+chunk as it is downloaded, so checksums, counts or incremental parsing happen
+in the same pass as the write instead of rereading the file afterwards.
+
+Processors are attached to a :class:`aiodownload.DownloadStrategy` as
+factories (ex. a class or a :func:`functools.partial`) as a new processor is
+needed for every response.  The result of :meth:`ChunkProcessor.finalize`
+is stored in ``bundle.results`` under the name of the processor.
+"""
+
+import hashlib
+
+import aiohttp
+
+
+class ChecksumError(aiohttp.ClientPayloadError):
+    """The content does not match the expected checksum (the download is
+    retried like any other broken transfer)
+    """
+
+
+class ChunkProcessor:
+    """Base class for chunk processors
+
+    :param name: (optional) key of the result in ``bundle.results``, defaults to the class attribute
+    :type name: str
+    """
+
+    name = 'processor'
+
+    def __init__(self, name=None):
+        self.bundle = None
+        if name:
+            self.name = name
+
+    def start(self, bundle):
+        """Start processing the content of a bundle
+
+        :param bundle: bundle the content belongs to
+        :type bundle: :class:`aiodownload.AioDownloadBundle`
+
+        :return: None
+        """
+
+        self.bundle = bundle
+
+    def update(self, chunk):
+        """Process the next chunk of content
+
+        :param chunk: chunk of content
+        :type chunk: bytes
+
+        :return: None
+        """
+
+        pass  # pragma: no cover
+
+    def finalize(self, bundle):
+        """Finish processing once all of the content has been seen
+
+        :param bundle: bundle the content belongs to
+        :type bundle: :class:`aiodownload.AioDownloadBundle`
+
+        :return: result stored in ``bundle.results``
+        """
+
+        return None  # pragma: no cover
+
+
+class HashProcessor(ChunkProcessor):
+    """Computes the hex digest of the content and optionally verifies it
+
+    :param algorithm: (optional) hashlib algorithm
+    :type algorithm: str
+    :param expected: (optional) callable object mapping a bundle to its expected hex digest (or None)
+    :type expected: callable object
+    :param name: (optional) key of the result in ``bundle.results``, defaults to the algorithm
+    :type name: str
+    """
+
+    def __init__(self, algorithm='sha256', expected=None, name=None):
+        super().__init__(name or algorithm)
+        self.expected = expected
+        self._hash = hashlib.new(algorithm)
+
+    def update(self, chunk):
+        self._hash.update(chunk)
+
+    def finalize(self, bundle):
+
+        digest = self._hash.hexdigest()
+
+        expected = self.expected(bundle) if self.expected else None
+        if expected and expected.lower() != digest:
+            raise ChecksumError('{} digest {} of {} does not match {}'.format(
+                self.name, digest, bundle.url, expected
+            ))
+
+        return digest
+
+
+class LineCounter(ChunkProcessor):
+    """Counts the lines (line feeds) of the content
+    """
+
+    name = 'lines'
+
+    def __init__(self, name=None):
+        super().__init__(name)
+        self._lines = 0
+
+    def update(self, chunk):
+        self._lines += chunk.count(b'\n')
+
+    def finalize(self, bundle):
+        return self._lines
+
+
+class LineProcessor(ChunkProcessor):
+    """Calls a function for every complete line of the content as soon as it
+    has been downloaded (for incremental parsing of line based formats)
+
+    :param callback: callable object taking the bundle and a line (bytes, without the line feed)
+    :type callback: callable object
+    :param name: (optional) key of the result (the number of lines) in ``bundle.results``
+    :type name: str
+    """
+
+    name = 'parsed_lines'
+
+    def __init__(self, callback, name=None):
+        super().__init__(name)
+        self.callback = callback
+        self._lines = 0
+        self._partial = []  # pieces of the line not ended yet (joined once it ends)
+
+    def update(self, chunk):
+
+        lines = chunk.split(b'\n')
+        end = lines.pop()
+
+        if lines and self._partial:
+            self._partial.append(lines[0])
+            lines[0] = b''.join(self._partial)
+            self._partial = []
+
+        if end:
+            self._partial.append(end)
+
+        for line in lines:
+            self.callback(self.bundle, line)
+        self._lines += len(lines)
+
+    def finalize(self, bundle):
+
+        if self._partial:
+            self.callback(self.bundle, b''.join(self._partial))
+            self._lines += 1
+            self._partial = []
+
+        return self._lines
@@ -0,0 +1,161 @@
+"""Rate Limiting
+
+This module contains a token bucket rate limiter which can be attached to a
+:class:`aiodownload.RequestStrategy` to pace requests globally and per host.
+"""
+
+import asyncio
+
+
+class TokenBucket:
+    """A token bucket refilling at ``rate`` tokens per second up to ``burst``
+    tokens.
+
+    Tokens are reserved rather than waited for: the balance may go negative
+    and the caller is told how long to wait until its token is available.
+
+    :param rate: tokens added per second
+    :type rate: float
+    :param burst: (optional) maximum number of tokens held by the bucket
+    :type burst: float
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = None
+
+    def reserve(self, now):
+        """Take a token from the bucket
+
+        :param now: current (monotonic) time in seconds
+        :type now: float
+
+        :return: seconds to wait before the reserved token is available
+        :rtype: float
+        """
+
+        self._refill(now)
+        self._tokens -= 1
+
+        return max(-self._tokens / self.rate, 0)
+
+    def get_delay(self, now):
+        """Returns how long until a token is available (without taking it)
+
+        :param now: current (monotonic) time in seconds
+        :type now: float
+
+        :return: seconds to wait
+        :rtype: float
+        """
+
+        self._refill(now)
+
+        # The tolerance keeps float rounding from asking for a wait of a few nanoseconds
+        return max((1 - self._tokens) / self.rate, 0) if self._tokens < 1 - 1e-9 else 0
+
+    def _refill(self, now):
+
+        if self._updated is not None:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class RateLimiter:
+    """Token bucket rate limiting for requests, with a global bucket and a
+    bucket per host.
+
+    :param rate: (optional) requests per second across all hosts (None for no limit)
+    :type rate: float
+    :param burst: (optional) number of requests allowed in a burst across all hosts
+    :type burst: int
+    :param rate_per_host: (optional) requests per second for each host (None for no limit)
+    :type rate_per_host: float
+    :param burst_per_host: (optional) number of requests allowed in a burst for each host
+    :type burst_per_host: int
+    """
+
+    def __init__(self, rate=None, burst=1, rate_per_host=None, burst_per_host=1):
+        self.rate_per_host = rate_per_host
+        self.burst_per_host = burst_per_host
+        self._bucket = TokenBucket(rate, burst) if rate else None
+        self._host_buckets = {}
+
+    def get_host_bucket(self, host):
+        """Returns the bucket for the host (created on first use)
+
+        :param host: host (netloc) of the request
+        :type host: str
+
+        :return: bucket or None when hosts are not rate limited
+        :rtype: :class:`TokenBucket`
+        """
+
+        if not self.rate_per_host:
+            return None
+
+        bucket = self._host_buckets.get(host)
+        if bucket is None:
+            bucket = self._host_buckets[host] = TokenBucket(self.rate_per_host, self.burst_per_host)
+
+        return bucket
+
+    def reserve(self, host, now=None):
+        """Reserve a request for the host from the global and host buckets
+
+        :param host: host (netloc) of the request
+        :type host: str
+        :param now: (optional) current time, defaults to the event loop's clock
+        :type now: float
+
+        :return: seconds to wait before making the request
+        :rtype: float
+        """
+
+        if now is None:
+            now = asyncio.get_event_loop().time()
+
+        delays = [0]
+        for bucket in (self._bucket, self.get_host_bucket(host)):
+            if bucket is not None:
+                delays.append(bucket.reserve(now))
+
+        return max(delays)
+
+    def get_delay(self, host, now=None):
+        """Returns how long until the global and host buckets both have a
+        token for a request to the host (without taking them)
+
+        :param host: host (netloc) of the request
+        :type host: str
+        :param now: (optional) current time, defaults to the event loop's clock
+        :type now: float
+
+        :return: seconds to wait (0 if the request may be reserved right away)
+        :rtype: float
+        """
+
+        if now is None:
+            now = asyncio.get_event_loop().time()
+
+        delays = [0]
+        for bucket in (self._bucket, self.get_host_bucket(host)):
+            if bucket is not None:
+                delays.append(bucket.get_delay(now))
+
+        return max(delays)
+
+    async def acquire(self, host):
+        """Wait until a request for the host is allowed
+
+        :param host: host (netloc) of the request
+        :type host: str
+
+        :return: None
+        """
+
+        delay = self.reserve(host)
+        if delay > 0:
+            await asyncio.sleep(delay)
@@ -0,0 +1,62 @@
+"""Results
+
+This module contains a columnar table of download results, a compact
+alternative to a list of bundles for runs of millions of URLs.
+"""
+
+import array
+import collections
+
+from .aiodownload import Status
+
+ResultRow = collections.namedtuple('ResultRow', ['url', 'file_path', 'status', 'size', 'attempts'])
+
+
+class ResultTable:
+    """Results of downloads stored as columns: lists of URLs and file paths
+    and arrays of statuses, sizes (bytes received) and attempts.  Bundles are
+    reduced to a row as they are appended and can be let go.
+    """
+
+    def __init__(self):
+        self.urls = []
+        self.file_paths = []
+        self.statuses = array.array('B')
+        self.sizes = array.array('q')
+        self.attempts = array.array('l')
+
+    def __len__(self):
+        return len(self.urls)
+
+    def __getitem__(self, i):
+        return ResultRow(self.urls[i], self.file_paths[i], Status(self.statuses[i]), self.sizes[i], self.attempts[i])
+
+    def __iter__(self):
+        for i in range(0, len(self)):
+            yield self[i]
+
+    def append(self, bundle):
+        """Append the result of a bundle
+
+        :param bundle: bundle
+        :type bundle: :class:`aiodownload.AioDownloadBundle`
+
+        :return: None
+        """
+
+        self.urls.append(bundle.url)
+        self.file_paths.append(bundle.file_path)
+        self.statuses.append(bundle.status)
+        self.sizes.append(bundle.bytes_received)
+        self.attempts.append(bundle.attempts)
+
+    def count(self, status):
+        """Returns the number of results with a status
+
+        :param status: status
+        :type status: :class:`aiodownload.aiodownload.Status`
+
+        :rtype: int
+        """
+
+        return self.statuses.count(status)
@@ -0,0 +1,349 @@
+"""Scheduling
+
+This module contains the scheduling primitives used by :class:`AioDownload`
+to decide when a bundle is allowed to make its next request.
+"""
+
+import asyncio
+import collections
+import heapq
+import itertools
+import math
+
+
+class RetryScheduler:
+    """A timer heap of bundles waiting to become eligible for another request.
+
+    Bundles park here (without holding a concurrency slot) for the sleep time
+    given by the request strategy.  A single timer is armed on the event loop
+    for the earliest eligibility time; when it fires, every bundle whose delay
+    has expired is re-admitted.
+    """
+
+    def __init__(self):
+        self._counter = itertools.count()  # tie breaker keeping the heap stable for equal times
+        self._heap = []
+        self._timer = None
+        self._timer_when = None
+
+    def __len__(self):
+        return len(self._heap)
+
+    @property
+    def waiting(self):
+        """Bundles currently waiting in the scheduler (earliest first)
+
+        :rtype: list
+        """
+
+        return [entry[3] for entry in sorted(self._heap)]
+
+    async def wait(self, bundle, delay):
+        """Wait until the bundle is eligible to make a request again
+
+        :param bundle: bundle to park
+        :type bundle: :class:`AioDownloadBundle`
+        :param delay: number of seconds to wait (non-positive values return immediately)
+        :type delay: float
+
+        :return: None
+        """
+
+        if delay <= 0:
+            return
+
+        loop = asyncio.get_event_loop()
+        waiter = loop.create_future()
+        heapq.heappush(self._heap, (loop.time() + delay, next(self._counter), waiter, bundle))
+        self._arm(loop)
+
+        await waiter
+
+    def _arm(self, loop):
+
+        when = self._heap[0][0]
+        if self._timer is not None:
+            if self._timer_when <= when:
+                return  # the armed timer fires first and will re-arm for this entry
+            self._timer.cancel()
+
+        self._timer = loop.call_at(when, self._wake, loop, when)
+        self._timer_when = when
+
+    def _wake(self, loop, when):
+
+        self._timer = None
+        self._timer_when = None
+
+        # The loop may run the timer a hair early (clock resolution)
+        now = max(loop.time(), when)
+        while self._heap and self._heap[0][0] <= now:
+            _, _, waiter, _ = heapq.heappop(self._heap)
+            if not waiter.done():  # skip bundles cancelled while waiting
+                waiter.set_result(None)
+
+        if self._heap:
+            self._arm(loop)
+
+
+class HostScheduler:
+    """Admission control for requests with a global and a per host cap.
+
+    The caps are read from the request strategy (``concurrent`` and
+    :meth:`RequestStrategy.get_host_concurrency`) every time a slot is handed
+    out.  Bundles that can't run right away wait in a priority queue for their
+    host (highest priority first, then earliest deadline, then first come).  A
+    freed slot goes to the most urgent waiter among the hosts that still have
+    room; hosts tied on urgency are served round robin, so one slow host can't
+    starve the others.
+
+    A slot is handed out together with a token of the request strategy's rate
+    limiter (see :meth:`RequestStrategy.get_rate_delay`).  Waiters held back
+    by the rate limits stay queued and a timer runs the dispatch again when
+    the next token is due, so every token goes to the most urgent waiter.
+
+    The circuit of the host (see :meth:`RequestStrategy.get_circuit_delay`) is
+    checked before a token is taken: while it is open, the waiters for the
+    host are handed its delay instead of a slot.
+
+    :param request_strategy: request strategy supplying the concurrency caps
+    :type request_strategy: :class:`aiodownload.RequestStrategy`
+    """
+
+    def __init__(self, request_strategy):
+        self._request_strategy = request_strategy
+        self._active = collections.Counter()  # number of running requests per host
+        self._counter = itertools.count()  # tie breaker keeping waiters of equal urgency first come first served
+        self._held_back = {}  # host -> time its next token of the rate limits is due (while it has none)
+        self._urgencies = collections.Counter()  # number of waiters per (-priority, deadline)
+        self._urgency_heap = []  # urgencies of the waiters (the ones no longer counted are dropped lazily)
+        self._urgency_heaped = set()  # urgencies in the heap
+        self._running = 0
+        self._timer = None  # dispatch run when the next token of the rate limits is due
+        self._timer_when = None
+        self._waiting = collections.OrderedDict()  # host -> heap of waiters (order is the round robin)
+
+    @property
+    def running(self):
+        """Number of requests holding a slot
+
+        :rtype: int
+        """
+
+        return self._running
+
+    @property
+    def waiting(self):
+        """Number of requests waiting for a slot
+
+        :rtype: int
+        """
+
+        return sum(len(waiters) for waiters in self._waiting.values())
+
+    def active(self, host):
+        """Number of requests holding a slot for the host
+
+        :param host: host (netloc) of the request
+        :type host: str
+
+        :rtype: int
+        """
+
+        return self._active[host]
+
+    async def acquire(self, host, priority=0, deadline=None):
+        """Wait for a request slot for the host
+
+        :param host: host (netloc) of the request
+        :type host: str
+        :param priority: (optional) priority of the request (higher values are handed a slot first)
+        :type priority: int
+        :param deadline: (optional) event loop time the request should start by (earlier deadlines go first)
+        :type deadline: float
+
+        :return: 0 once the slot is held, else the delay of the open circuit of the host (None to fail fast)
+        :rtype: float
+        """
+
+        # Waiters held back by the rate limits (the timer is armed) may be more urgent than this request
+        if host not in self._waiting and self._timer is None and self._has_capacity(host):
+            delay = self._request_strategy.get_circuit_delay(host, claim=False)
+            if delay != 0 or self._admit(host):
+                return delay
+
+        waiter = asyncio.get_event_loop().create_future()
+        entry = (-priority, math.inf if deadline is None else deadline, next(self._counter), waiter)
+        heapq.heappush(self._waiting.setdefault(host, []), entry)
+        self._count_urgency(entry[:2], 1)
+
+        if self._timer is not None:
+            self._dispatch()
+
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled() and waiter.result() == 0:
+                self.release(host)  # the slot was handed over just before the cancellation
+            else:
+                self._discard(host, waiter)
+            raise
+
+    def release(self, host):
+        """Give back a request slot for the host and hand out freed capacity
+
+        :param host: host (netloc) of the request
+        :type host: str
+
+        :return: None
+        """
+
+        self._running -= 1
+        self._active[host] -= 1
+        if not self._active[host]:
+            del self._active[host]
+
+        self._dispatch()
+
+    def _has_capacity(self, host):
+
+        host_limit = self._request_strategy.get_host_concurrency(host)
+
+        return self._running < self._request_strategy.concurrent and \
+            not (host_limit and self._active[host] >= host_limit)
+
+    def _admit(self, host):
+
+        if not self._has_capacity(host):
+            return False
+
+        # Known to have no token yet: the rate limits aren't asked again before it is due
+        now = asyncio.get_event_loop().time()
+        due = self._held_back.get(host, now)
+        if due > now:
+            self._arm(due - now)
+            return False
+
+        delay = self._request_strategy.get_rate_delay(host)
+        if delay > 0:
+            self._held_back[host] = now + delay
+            self._arm(delay)
+            return False
+
+        self._held_back.pop(host, None)
+        self._request_strategy.reserve_rate(host)
+        self._request_strategy.get_circuit_delay(host)  # claims the probe of a half-open circuit
+        self._take(host)
+
+        return True
+
+    def _arm(self, delay):
+
+        loop = asyncio.get_event_loop()
+        when = loop.time() + delay
+        if self._timer is not None:
+            if self._timer_when <= when:
+                return  # the armed timer fires first (and the dispatch re-arms it if need be)
+            self._timer.cancel()
+
+        self._timer = loop.call_at(when, self._wake)
+        self._timer_when = when
+
+    def _wake(self):
+
+        self._timer = None
+        self._timer_when = None
+        self._dispatch()
+
+        # Forget the hosts due by now which had no waiter left to admit
+        now = asyncio.get_event_loop().time()
+        for host in [host for host, due in self._held_back.items() if due <= now and host not in self._waiting]:
+            del self._held_back[host]
+
+    def _take(self, host):
+
+        self._running += 1
+        self._active[host] += 1
+
+    def _discard(self, host, waiter):
+
+        waiters = self._waiting.get(host)
+        if waiters is None:
+            return
+
+        for i, entry in enumerate(waiters):
+            if entry[3] is waiter:
+                waiters[i] = waiters[-1]
+                waiters.pop()
+                heapq.heapify(waiters)
+                self._count_urgency(entry[:2], -1)
+                break
+
+        if not waiters:
+            del self._waiting[host]
+
+    def _dispatch(self):
+
+        held_back = set()  # hosts without a token of the rate limits yet
+
+        while self._running < self._request_strategy.concurrent:
+
+            # Most urgent head of the hosts with room (the first in round robin order on a tie), the scan stops
+            # at the first host holding a waiter as urgent as any
+            most_urgent = self._get_most_urgent()
+            best = None
+            for host, waiters in self._waiting.items():
+                if host not in held_back and (best is None or waiters[0][:2] < self._waiting[best][0][:2]) and \
+                        self._has_capacity(host):
+                    best = host
+                    if waiters[0][:2] == most_urgent:
+                        break
+
+            if best is None:
+                break
+
+            waiters = self._waiting[best]
+            if waiters[0][3].done():  # cancelled while waiting
+                self._count_urgency(heapq.heappop(waiters)[:2], -1)
+                if not waiters:
+                    del self._waiting[best]
+                continue
+
+            # An open circuit turns the waiters for the host away (before they take a token)
+            delay = self._request_strategy.get_circuit_delay(best, claim=False)
+            if delay != 0:
+                for entry in waiters:
+                    self._count_urgency(entry[:2], -1)
+                    if not entry[3].done():
+                        entry[3].set_result(delay)
+                del self._waiting[best]
+                continue
+
+            if not self._admit(best):
+                held_back.add(best)
+                continue
+
+            entry = heapq.heappop(waiters)
+            self._count_urgency(entry[:2], -1)
+            if waiters:
+                self._waiting.move_to_end(best)  # back of the round robin
+            else:
+                del self._waiting[best]
+
+            entry[3].set_result(0)
+
+    def _count_urgency(self, urgency, n):
+
+        if urgency not in self._urgency_heaped:
+            heapq.heappush(self._urgency_heap, urgency)
+            self._urgency_heaped.add(urgency)
+        self._urgencies[urgency] += n
+        if not self._urgencies[urgency]:
+            del self._urgencies[urgency]
+
+    def _get_most_urgent(self):
+
+        while self._urgency_heap and self._urgency_heap[0] not in self._urgencies:
+            self._urgency_heaped.discard(heapq.heappop(self._urgency_heap))
+
+        return self._urgency_heap[0] if self._urgency_heap else None
@@ -0,0 +1,313 @@
+"""Stores
+
+This module contains small persistent key value stores kept alongside the
+downloads (ex. the validators used to revalidate cached files or the index
+of completed downloads).
+"""
+
+import json
+import os
+import threading
+
+from .util import make_dirs
+
+
+class ManifestStore:
+    """A dictionary persisted as an append-only manifest (of JSON lines by
+    default, see :meth:`encode` and :meth:`decode`).
+
+    The manifest is read once when the store is created, after which lookups
+    are plain dictionary lookups.  Every change is appended to the manifest
+    (the last line for a key wins); :meth:`compact` rewrites it with only the
+    current records.
+
+    Once an ``executor`` is set (ex. the I/O thread pool of a download
+    strategy), changes are written behind: the lines are queued and appended
+    in the executor, so event loop code never waits for the file system.
+    :meth:`flush`, :meth:`close` and :meth:`compact` wait for the queued lines.
+
+    :param file_path: file path of the manifest
+    :type file_path: str
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.executor = None  # executor the changes are written in (None to write them right away)
+        self._file = None
+        self._lock = threading.Lock()  # guards the queued lines and the writer
+        self._queued = []  # lines waiting for the writer
+        self._writer = None  # future of the writer while lines are queued
+        self._records = {}
+        self._torn = False  # whether the manifest ends with a line cut short
+        self.load()
+
+    def __contains__(self, key):
+        return key in self._records
+
+    def __len__(self):
+        return len(self._records)
+
+    def load(self):
+        """(Re)load the records from the manifest
+
+        :return: None
+        """
+
+        self._records = {}
+        self._torn = False
+
+        try:
+            with open(self.file_path) as f:
+                for line in f:
+                    self._torn = not line.endswith('\n')
+                    try:
+                        key, record = self.decode(line)
+                    except ValueError:
+                        continue  # a line cut short by an interrupted run
+                    if record is None:
+                        self._records.pop(key, None)
+                    else:
+                        self._records[key] = record
+        except FileNotFoundError:
+            pass
+
+    def decode(self, line):
+        """Decode a line of the manifest
+
+        :param line: line (including the line break)
+        :type line: str
+
+        :return: key and record (None if the key was deleted)
+        :rtype: tuple
+        """
+
+        key, record = json.loads(line)
+
+        return key, record
+
+    def encode(self, key, record):
+        """Encode a key and record as a line of the manifest
+
+        :param key: key
+        :type key: str
+        :param record: record (None if the key was deleted)
+        :type record: object
+
+        :return: line (including the line break)
+        :rtype: str
+        """
+
+        return json.dumps([key, record]) + '\n'
+
+    def get(self, key, default=None):
+        """Get the record for a key
+
+        :param key: key
+        :type key: str
+        :param default: (optional) value returned when there is no record
+        :type default: object
+
+        :return: record
+        """
+
+        return self._records.get(key, default)
+
+    def set(self, key, record):
+        """Set (and persist) the record for a key
+
+        :param key: key
+        :type key: str
+        :param record: JSON serializable record
+        :type record: object
+
+        :return: None
+        """
+
+        self._records[key] = record
+        self._append(key, record)
+
+    def delete(self, key):
+        """Delete (and persist the deletion of) the record for a key
+
+        :param key: key
+        :type key: str
+
+        :return: None
+        """
+
+        if self._records.pop(key, None) is not None:
+            self._append(key, None)
+
+    def compact(self):
+        """Rewrite the manifest with only the current records
+
+        :return: None
+        """
+
+        self.close()
+        make_dirs(self.file_path)
+
+        with open(self.file_path + '.tmp', 'w') as f:
+            for key, record in self._records.items():
+                f.write(self.encode(key, record))
+        os.replace(self.file_path + '.tmp', self.file_path)
+
+    def flush(self):
+        """Flush appended records to the manifest (waiting for the queued ones)
+
+        :return: None
+        """
+
+        self._wait()
+
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        """Close the manifest (flushing appended records)
+
+        :return: None
+        """
+
+        self._wait()
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _append(self, key, record):
+
+        line = self.encode(key, record)
+
+        if self.executor is None:
+            self._write([line])
+            return
+
+        with self._lock:
+            self._queued.append(line)
+            if self._writer is None:
+                self._writer = self.executor.submit(self._write_queued)
+
+    def _wait(self):
+
+        writer = self._writer
+        if writer is not None:
+            writer.result()  # a failed writer stays in place, so its error is raised by every flush
+
+    def _write_queued(self):
+
+        while True:
+            with self._lock:
+                lines, self._queued = self._queued, []
+                if not lines:
+                    self._writer = None
+                    return
+            self._write(lines)
+
+    def _write(self, lines):
+
+        if self._file is None:
+            make_dirs(self.file_path)
+            self._file = open(self.file_path, 'a')
+            if self._torn:
+                self._file.write('\n')  # don't append to a line cut short by an interrupted run
+                self._torn = False
+
+        self._file.writelines(lines)
+
+
+class ValidatorStore(ManifestStore):
+    """Store of the validators (ETag, Last-Modified and Content-Length) of
+    downloaded files, used to make conditional requests.
+    """
+
+    def get_validators(self, key):
+        """Get the validators recorded for a file
+
+        :param key: key of the file (file path relative to the download home)
+        :type key: str
+
+        :return: dict with etag, last_modified and content_length (or None)
+        :rtype: dict
+        """
+
+        return self.get(key)
+
+    def set_validators(self, key, response, content_length):
+        """Record the validators of a response written to a file
+
+        :param key: key of the file (file path relative to the download home)
+        :type key: str
+        :param response: response the file was written from
+        :type response: :class:`aiohttp.ClientResponse`
+        :param content_length: number of bytes written to the file
+        :type content_length: int
+
+        :return: None
+        """
+
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+
+        if etag or last_modified:
+            self.set(key, {'content_length': content_length, 'etag': etag, 'last_modified': last_modified})
+        else:
+            self.delete(key)  # nothing to revalidate with
+
+
+class CompletionIndex(ManifestStore):
+    """Index of completed downloads and their sizes, letting a run skip work
+    finished by an earlier run without checking the file system for every
+    file.
+
+    The manifest holds one tab separated ``size`` and ``key`` per line, which
+    keeps loading an index of millions of files fast.
+
+    :param file_path: file path of the manifest
+    :type file_path: str
+    :param verify_size: (optional) check the size of the file on disk against the index before skipping it
+    :type verify_size: bool
+    """
+
+    def __init__(self, file_path, verify_size=False):
+        self.verify_size = verify_size
+        super().__init__(file_path)
+
+    def decode(self, line):
+
+        size, key = line.rstrip('\n').split('\t', 1)
+
+        return key, None if size == '-' else int(size)
+
+    def encode(self, key, record):
+
+        if '\n' in key:
+            raise ValueError('Line breaks are not supported in the keys of a completion index')
+
+        return '{}\t{}\n'.format('-' if record is None else record, key)
+
+    def get_size(self, key):
+        """Get the size of a completed download
+
+        :param key: key of the file (file path relative to the download home)
+        :type key: str
+
+        :return: size in bytes (None if the download isn't complete)
+        :rtype: int
+        """
+
+        return self.get(key)
+
+    def mark_complete(self, key, size):
+        """Record a completed download
+
+        :param key: key of the file (file path relative to the download home)
+        :type key: str
+        :param size: size of the file in bytes
+        :type size: int
+
+        :return: None
+        """
+
+        if self.get(key) != size:
+            self.set(key, size)
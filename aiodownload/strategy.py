@@ -4,33 +4,348 @@ This module contains base class and sensible default class implementations
 for the request and download strategies used by :class:`AioDownload`
 """
 
+import aiohttp
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import hashlib
 import logging
 import os
+from urllib.parse import urlparse
+import uuid
+import zlib
 
-from .util import default_url_transform, make_dirs
+from .concurrency import AimdLimit
+from .fileio import AsyncFile, file_size, hardlink, preallocate, read_json, remove, store_object, touch, write_json
+from .store import ManifestStore, ValidatorStore
+from .util import (
+    clean_filename, default_url_transform, disambiguate_path, get_encoding_suffix, get_range_start, make_dirs
+)
 
 logger = logging.getLogger(__name__)
 
+VALIDATOR_STORE_NAME = '.aiodownload-validators.jsonl'  # manifest kept in the home directory when revalidating
+URL_INDEX_NAME = '.aiodownload-urls.jsonl'  # URL to file path manifest kept by ShardedDownloadStrategy
+DIGEST_INDEX_NAME = '.aiodownload-digests.jsonl'  # file path to digest manifest of ContentAddressedDownloadStrategy
+
 
 class DownloadStrategy:
     """DownloadStrategy is an injection class for AioDownload.  The purpose is
     to control download options for AioDownload.
 
+    Blocking file system calls are run in a dedicated thread pool and writes
+    are buffered behind the reads (see :class:`aiodownload.fileio.AsyncFile`)
+    so a slow disk doesn't stall the event loop.
+
     :param chunk_size: the incremental chunk size to read from the response
     :type chunk_size: (optional) int
     :param home: the base file path to use for writing response content to file
     :type honme: (optional) str
     :param skip_cached: indicates whether existing written files should be skipped
     :type skip_cached: bool
+    :param io_workers: (optional) number of threads in the file I/O thread pool
+    :type io_workers: int
+    :param max_buffer: (optional) number of bytes per file buffered in memory while waiting on the disk
+    :type max_buffer: int
+    :param resume: (optional) write to a partial file and resume interrupted downloads with a Range request
+    :type resume: bool
+    :param revalidate: (optional) revalidate existing files with a conditional request instead of refetching them
+    :type revalidate: bool
+    :param validator_store: (optional) store of the validators, defaults to a manifest in the home directory
+    :type validator_store: :class:`aiodownload.store.ValidatorStore`
+    :param segments: (optional) number of byte ranges a large file is split into and fetched concurrently
+    :type segments: int
+    :param segment_threshold: (optional) minimum Content-Length (in bytes) of a file to be segmented
+    :type segment_threshold: int
+    :param completion_index: (optional) index of completed downloads consulted instead of the file system
+    :type completion_index: :class:`aiodownload.store.CompletionIndex`
+    :param processors: (optional) factories of the chunk processors every response is streamed through
+    :type processors: list
+    :param store_encoded: (optional) store compressed responses as received (the file path gets a suffix per encoding)
+    :type store_encoded: bool
+    :param accept_encodings: (optional) encodings offered in the Accept-Encoding header when storing them encoded
+    :type accept_encodings: tuple
+    :param recompress: (optional) gzip uncompressed responses while writing them (the file path gets a .gz suffix)
+    :type recompress: bool
     """
 
-    def __init__(self, chunk_size=65536, home=None, skip_cached=False):
+    def __init__(self, chunk_size=65536, home=None, skip_cached=False, io_workers=4, max_buffer=1048576,
+                 resume=False, revalidate=False, validator_store=None, segments=1, segment_threshold=67108864,
+                 completion_index=None, processors=None, store_encoded=False, accept_encodings=('zstd', 'br', 'gzip'),
+                 recompress=False):
         self.chunk_size = chunk_size
         self.home = home or os.getcwd()
         self.skip_cached = skip_cached
+        self.io_workers = io_workers
+        self.max_buffer = max_buffer
+        self.resume = resume
+        self.revalidate = revalidate
+        self.validator_store = validator_store
+        self.segments = segments
+        self.segment_threshold = segment_threshold
+        self.completion_index = completion_index
+        self.processors = list(processors or [])
+        self.store_encoded = store_encoded
+        self.accept_encodings = accept_encodings
+        self.recompress = recompress
+        self._executor = None
+        self._made_dirs = set()  # directories known to exist (saves a makedirs call per file)
+
+        if resume and recompress:
+            raise ValueError('Recompressed downloads can not be resumed (ranges are uncompressed offsets)')
+
+        if revalidate and validator_store is None:
+            self.validator_store = ValidatorStore(os.path.sep.join([self.home, VALIDATOR_STORE_NAME]))
+
+    @property
+    def executor(self):
+        """Thread pool running the blocking file I/O (created on first use),
+        the writes of the stores included
+
+        :rtype: :class:`concurrent.futures.ThreadPoolExecutor`
+        """
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.io_workers)
+            for store in self.get_stores():
+                if store.executor is None:
+                    store.executor = self._executor
+
+        return self._executor
+
+    def get_stores(self):
+        """Returns the stores kept by the strategy
+
+        :rtype: list
+        """
+
+        return [store for store in (self.validator_store, self.completion_index) if store is not None]
+
+    async def run_io(self, func, *args):
+        """Run a blocking file system call in the I/O thread pool
+
+        :param func: callable object to run
+        :type func: callable object
+
+        :return: the result of the call
+        """
+
+        return await asyncio.get_event_loop().run_in_executor(self.executor, functools.partial(func, *args))
+
+    async def make_dirs(self, file_path):
+        """Make the directories for a file path (once per directory)
+
+        :param file_path: file path
+        :type file_path: str
+
+        :return: None
+        """
+
+        directory = os.path.dirname(file_path)
+
+        if directory not in self._made_dirs:
+            await self.run_io(make_dirs, file_path)
+            self._made_dirs.add(directory)
+
+    def open_file(self, file_path, mode='wb'):
+        """Returns an asynchronous file for the file path (use with ``async with``)
+
+        :param file_path: file path
+        :type file_path: str
+        :param mode: (optional) mode the file is opened with
+        :type mode: str
+
+        :return: file
+        :rtype: :class:`aiodownload.fileio.AsyncFile`
+        """
+
+        return AsyncFile(file_path, mode, executor=self.executor, max_buffer=self.max_buffer)
+
+    async def is_cached(self, bundle):
+        """Indicates whether the bundle can be skipped because it was already
+        downloaded
+
+        :param bundle: bundle (file_path should exist)
+        :type bundle: :class:`AioDownloadBundle`
+
+        :return: True if skip_cached is set and the content is stored (and can't be revalidated)
+        :rtype: bool
+        """
+
+        if (self.store_encoded or self.recompress) and (self.skip_cached or self.revalidate):
+            await self._find_encoded(bundle)
+
+        key = self.get_store_key(bundle)
+
+        if self.revalidate and self.validator_store.get_validators(key):
+            return False  # let the server tell whether it changed
+
+        if not self.skip_cached:
+            return False
+
+        content_path = self.get_content_path(bundle)
+
+        if self.completion_index is not None:
+            # Completed downloads are looked up in the index rather than the file system
+            size = self.completion_index.get_size(key)
+            if size is None or not self.completion_index.verify_size:
+                return size is not None
+            return content_path is not None and await self.run_io(file_size, content_path) == size
+
+        return content_path is not None and await self.run_io(os.path.isfile, content_path)
+
+    async def get_request_headers(self, bundle):
+        """Returns extra headers for the request of the bundle.  When resuming,
+        a partial file left by an earlier attempt is continued with a Range
+        request validated with If-Range (ETag or Last-Modified).
+
+        :param bundle: bundle (file_path should exist)
+        :type bundle: :class:`AioDownloadBundle`
+
+        :return: headers
+        :rtype: dict
+        """
+
+        headers = {}
+
+        if self.store_encoded:
+            headers['Accept-Encoding'] = ', '.join(self.accept_encodings)
+
+        if self.resume:
+
+            part_path = self.get_part_path(bundle)
+            offset = await self.run_io(file_size, part_path)
+            part_info = await self.run_io(read_json, part_path + '.json') or {}
+            validator = part_info.get('etag') or part_info.get('last_modified')
+            complete = part_info.get('length') is not None and offset >= part_info['length']
+
+            if offset and validator and not complete:
+                headers['Range'] = 'bytes={}-'.format(offset)
+                headers['If-Range'] = validator
+
+        if self.revalidate and 'Range' not in headers:
+
+            validators = self.validator_store.get_validators(self.get_store_key(bundle))
+            content_path = self.get_content_path(bundle)
+            if validators and content_path is not None and \
+                    await self.run_io(file_size, content_path) == validators['content_length']:
+                if validators['etag']:
+                    headers['If-None-Match'] = validators['etag']
+                if validators['last_modified']:
+                    headers['If-Modified-Since'] = validators['last_modified']
+
+        return headers
+
+    def get_store_key(self, bundle):
+        """Get the key of the bundle in the stores kept by the strategy
+
+        :param bundle: bundle (file_path should exist)
+        :type bundle: :class:`AioDownloadBundle`
+
+        :return: file path relative to the home directory
+        :rtype: str
+        """
+
+        return os.path.relpath(bundle.file_path, self.home)
+
+    def get_content_path(self, bundle):
+        """Get the path of the file holding the downloaded content of the bundle
+
+        :param bundle: bundle (file_path should exist)
+        :type bundle: :class:`AioDownloadBundle`
+
+        :return: file path (None if the content is not known to be stored)
+        :rtype: str
+        """
+
+        return bundle.file_path
+
+    def get_part_path(self, bundle):
+        """Get the file path of the partial file written while resuming
+
+        :param bundle: bundle (file_path should exist)
+        :type bundle: :class:`AioDownloadBundle`
+
+        :return: partial file path
+        :rtype: str
+        """
+
+        return bundle.file_path + '.part'
+
+    def get_raw_encoding(self, response):
+        """Returns the content encoding of a response as it is read (None when
+        aiohttp decompresses it, i.e. unless store_encoded is set)
+
+        :param response: successful response from an HTTP response
+        :type response: :class:`aiohttp.ClientResponse`
+
+        :return: Content-Encoding header value or None
+        :rtype: str
+        """
+
+        if not self.store_encoded:
+            return None
+
+        encoding = response.headers.get('Content-Encoding', '').strip().lower()
+
+        return encoding if get_encoding_suffix(encoding) else None  # missing or identity
+
+    def get_stored_encoding(self, response):
+        """Returns the content encoding of a response as it is stored (the raw
+        encoding, or gzip when recompressing an uncompressed response)
+
+        :param response: successful response from an HTTP response
+        :type response: :class:`aiohttp.ClientResponse`
+
+        :return: content encoding or None
+        :rtype: str
+        """
+
+        return self.get_raw_encoding(response) or ('gzip' if self.recompress else None)
+
+    def set_encoding(self, bundle, encoding):
+        """Record the content encoding of a bundle, swapping the encoding
+        suffix of its file path
+
+        :param bundle: bundle
+        :type bundle: :class:`AioDownloadBundle`
+        :param encoding: content encoding (None for uncompressed content)
+        :type encoding: str
+
+        :return: None
+        """
+
+        if bundle.file_path is not None:
+            if bundle.encoding:
+                bundle.file_path = bundle.file_path[:-len(get_encoding_suffix(bundle.encoding))]
+            if encoding:
+                bundle.file_path += get_encoding_suffix(encoding)
+
+        bundle.encoding = encoding
+
+    async def _find_encoded(self, bundle):
+
+        if bundle.encoding is not None:
+            return
+
+        encodings = list(self.accept_encodings) if self.store_encoded else []
+        if self.recompress and 'gzip' not in encodings:
+            encodings.append('gzip')
+
+        # A file stored encoded by an earlier run has the suffix of its encoding
+        for encoding in encodings:
+            file_path = bundle.file_path + get_encoding_suffix(encoding)
+            if self.completion_index is not None:
+                found = self.completion_index.get_size(os.path.relpath(file_path, self.home)) is not None
+            else:
+                found = await self.run_io(os.path.isfile, file_path)
+            if found:
+                self.set_encoding(bundle, encoding)
+                return
 
     async def on_fail(self, bundle):
-        """Write an empty file
+        """Write an empty file (when resuming, the partial file is kept
+        instead so a later run can continue it)
 
         :param bundle: bundle (file_path should exist)
         :type bundle: :class:`AioDownloadBundle`
@@ -38,8 +353,17 @@ class DownloadStrategy:
         :return: None
         """
 
-        make_dirs(bundle.file_path)
-        open(bundle.file_path, 'wb+').close()
+        if self.revalidate:
+            self.validator_store.delete(self.get_store_key(bundle))
+
+        if self.completion_index is not None:
+            self.completion_index.delete(self.get_store_key(bundle))
+
+        if self.resume:
+            return
+
+        await self.make_dirs(bundle.file_path)
+        await self.run_io(touch, bundle.file_path)
 
     async def on_success(self, response, bundle):
         """Write the response to the file path indicated in the bundle
@@ -52,14 +376,225 @@ class DownloadStrategy:
         :return: None
         """
 
-        make_dirs(bundle.file_path)
+        self.set_encoding(bundle, self.get_stored_encoding(response))
+        await self.make_dirs(bundle.file_path)
+
+        if self.resume:
+            await self._resume(response, bundle)
+        else:
+            async with self.open_file(bundle.file_path, 'wb+') as f:
+                await self.stream_content(response, bundle, f.write)
+
+        await self.after_write(response, bundle)
+
+    async def after_write(self, response, bundle):
+        """Bookkeeping once the response has been written to the file path of
+        the bundle (records the validators when revalidating and the size in
+        the completion index)
+
+        :param response: successful response from an HTTP response
+        :type response: :class:`aiohttp.ClientResponse`
+        :param bundle: bundle (file_path should exist)
+        :type bundle: :class:`AioDownloadBundle`
+
+        :return: None
+        """
+
+        if not (self.revalidate or self.completion_index is not None):
+            return
+
+        key = self.get_store_key(bundle)
+        size = await self.run_io(file_size, self.get_content_path(bundle))
+
+        if self.revalidate:
+            self.validator_store.set_validators(key, response, size)
+
+        if self.completion_index is not None:
+            self.completion_index.mark_complete(key, size)
+
+    def get_segments(self, response):
+        """Returns the byte ranges to fetch concurrently for a response, if it
+        should be segmented: the server accepts byte ranges and advertises a
+        Content-Length (of an unencoded body) above the segment threshold.
+
+        :param response: successful response from an HTTP response
+        :type response: :class:`aiohttp.ClientResponse`
+
+        :return: list of (start, end) byte ranges (inclusive) or None
+        :rtype: list
+        """
+
+        if self.segments < 2 or self.resume or self.processors or self.recompress or response.status != 200:
+            return None  # processors need the content in order
+
+        headers = response.headers
+        if headers.get('Accept-Ranges') != 'bytes' or 'Content-Encoding' in headers:
+            return None
+
+        try:
+            length = int(headers['Content-Length'])
+        except (KeyError, ValueError):
+            return None
+
+        if length < max(self.segment_threshold, self.segments):
+            return None
+
+        size = -(-length // self.segments)  # ceiling division
+
+        return [(start, min(start + size, length) - 1) for start in range(0, length, size)]
+
+    async def preallocate(self, bundle, length):
+        """Create the file for a segmented download at its full length
+
+        :param bundle: bundle (file_path should exist)
+        :type bundle: :class:`AioDownloadBundle`
+        :param length: file length in bytes
+        :type length: int
+
+        :return: None
+        """
+
+        await self.make_dirs(bundle.file_path)
+        await self.run_io(preallocate, bundle.file_path, length)
+
+    async def write_segment(self, response, bundle, start, end):
+        """Write a byte range of the content at its offset in the file
+
+        :param response: response holding the range (only end - start + 1 bytes are read)
+        :type response: :class:`aiohttp.ClientResponse`
+        :param bundle: bundle (file_path should exist and be preallocated)
+        :type bundle: :class:`AioDownloadBundle`
+        :param start: offset of the first byte
+        :type start: int
+        :param end: offset of the last byte
+        :type end: int
+
+        :return: None
+        """
+
+        remaining = end - start + 1
 
-        with open(bundle.file_path, 'wb+') as f:
-            while True:
-                chunk = await response.content.read(self.chunk_size)
+        async with self.open_file(bundle.file_path, 'r+b') as f:
+            await f.seek(start)
+            while remaining > 0:
+                chunk = await response.content.read(min(self.chunk_size, remaining))
                 if not chunk:
-                    break
-                f.write(chunk)
+                    raise aiohttp.ClientPayloadError('Segment {}-{} of {} ended early'.format(
+                        start, end, bundle.file_path
+                    ))
+                await f.write(chunk)
+                remaining -= len(chunk)
+
+    def get_processors(self, bundle):
+        """Returns new chunk processors for the content of a bundle
+
+        :param bundle: bundle
+        :type bundle: :class:`AioDownloadBundle`
+
+        :return: chunk processors
+        :rtype: list
+        """
+
+        return [factory() for factory in self.processors]
+
+    async def stream_content(self, response, bundle, write, prefix_path=None):
+        """Read the response content chunk by chunk, feeding every chunk to the
+        chunk processors before passing it to ``write``.  The results of the
+        processors are stored in ``bundle.results`` once the content is read.
+
+        Processors see the content as it is read: encoded when store_encoded
+        is set, uncompressed when it is recompressed on the way to ``write``.
+
+        :param response: successful response from an HTTP response
+        :type response: :class:`aiohttp.ClientResponse`
+        :param bundle: bundle
+        :type bundle: :class:`AioDownloadBundle`
+        :param write: coroutine function taking a chunk
+        :type write: callable object
+        :param prefix_path: (optional) file holding the content preceding the response (when resuming)
+        :type prefix_path: str
+
+        :return: None
+        """
+
+        processors = self.get_processors(bundle)
+        for processor in processors:
+            processor.start(bundle)
+
+        if processors and prefix_path:
+            async with AsyncFile(prefix_path, 'rb', executor=self.executor) as f:
+                while True:
+                    chunk = await f.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    for processor in processors:
+                        processor.update(chunk)
+
+        compressor = None
+        if self.recompress and self.get_raw_encoding(response) is None:
+            compressor = zlib.compressobj(wbits=31)  # gzip container
+
+        while True:
+            chunk = await response.content.read(self.chunk_size)
+            if not chunk:
+                break
+            for processor in processors:
+                processor.update(chunk)
+            await write(compressor.compress(chunk) if compressor else chunk)
+
+        if compressor:
+            await write(compressor.flush())
+
+        if processors:
+            bundle.results = {processor.name: processor.finalize(bundle) for processor in processors}
+
+    async def _resume(self, response, bundle):
+
+        part_path = self.get_part_path(bundle)
+
+        if response.status == 206:
+
+            # Continue the partial file (the server honoured the Range request)
+            offset = await self.run_io(file_size, part_path)
+            if get_range_start(response.headers.get('Content-Range')) != offset:
+                await self.run_io(remove, part_path, part_path + '.json')
+                raise aiohttp.ClientPayloadError('Content-Range does not continue {}'.format(part_path))
+            mode = 'ab'
+
+        else:
+
+            # Start over, recording the validators needed to resume later on
+            etag = response.headers.get('ETag')
+            await self.run_io(write_json, part_path + '.json', {
+                'etag': etag if etag and not etag.startswith('W/') else None,  # If-Range needs a strong ETag
+                'last_modified': response.headers.get('Last-Modified'),
+                'length': int(response.headers['Content-Length']) if 'Content-Length' in response.headers else None
+            })
+            mode = 'wb'
+
+        async with self.open_file(part_path, mode) as f:
+            await self.stream_content(response, bundle, f.write, part_path if mode == 'ab' else None)
+
+        await self.run_io(os.replace, part_path, bundle.file_path)
+        await self.run_io(remove, part_path + '.json')
+
+    async def close(self):
+        """Release the resources held by the strategy (stores and the I/O thread pool)
+
+        :return: None
+        """
+
+        loop = asyncio.get_event_loop()
+
+        for store in self.get_stores():
+            # Closing waits for the lines queued in the I/O thread pool (so it can't run in that pool)
+            await loop.run_in_executor(None, store.close)
+            if store.executor is self._executor:
+                store.executor = None
+
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await loop.run_in_executor(None, executor.shutdown)
 
     def get_file_path(self, bundle):
         """Get the file path for the bundle
@@ -76,6 +611,282 @@ class DownloadStrategy:
             default_url_transform(bundle.url)       # transforms the URL into a relative file path
         ])
 
+    def plan_file_paths(self, bundles):
+        """Set the file paths of a batch of bundles ahead of any request,
+        disambiguating distinct URLs which map to the same file path (or to a
+        directory of another file path) with a hash of the URL.  The first
+        bundle of a file path keeps it.
+
+        :param bundles: bundles (the ones with a file path already are left alone)
+        :type bundles: list
+
+        :return: bundles whose file path was disambiguated
+        :rtype: list
+        """
+
+        owners = {}  # file path -> URL
+        for bundle in bundles:
+            if bundle.file_path is None:
+                bundle.file_path = self.get_file_path(bundle)
+            if bundle.file_path is not None:
+                owners.setdefault(bundle.file_path, bundle.url)
+
+        directories = set()
+        for file_path in owners:
+            directory = os.path.dirname(file_path)
+            while directory not in directories and directory != os.path.dirname(directory):
+                directories.add(directory)
+                directory = os.path.dirname(directory)
+
+        collisions = []
+        for bundle in bundles:
+            file_path = bundle.file_path
+            if file_path is None or (owners[file_path] == bundle.url and file_path not in directories):
+                continue
+            bundle.file_path = disambiguate_path(file_path, bundle.url)
+            collisions.append(bundle)
+
+        if collisions:
+            logger.warning('Disambiguated {} colliding file paths'.format(len(collisions)))
+
+        return collisions
+
+
+class ShardedDownloadStrategy(DownloadStrategy):
+    """Download strategy spreading files over a fan-out of directories named
+    after a hash of the URL (ex. ``home/3f/a2/3fa2...9c.html`` with a depth and
+    width of 2), keeping any single directory small for crawls of millions of
+    files.  The URL to file path mapping is recorded in a side index.
+
+    :param depth: (optional) number of directory levels
+    :type depth: int
+    :param width: (optional) number of hex digits of the hash per directory level
+    :type width: int
+    :param algorithm: (optional) hashlib algorithm hashing the URL
+    :type algorithm: str
+    :param url_index: (optional) store of URL to file path, defaults to a manifest in the home directory
+    :type url_index: :class:`aiodownload.store.ManifestStore`
+    :param kwargs: (optional) :class:`DownloadStrategy` keyword arguments
+    """
+
+    def __init__(self, depth=2, width=2, algorithm='sha1', url_index=None, **kwargs):
+        super().__init__(**kwargs)
+        self.depth = depth
+        self.width = width
+        self.algorithm = algorithm
+        self.url_index = url_index or ManifestStore(os.path.sep.join([self.home, URL_INDEX_NAME]))
+
+    def get_file_path(self, bundle):
+        """Get the file path for the bundle: the hash of the URL (keeping the
+        extension of the URL path) under its hash prefix directories
+
+        :param bundle: bundle (generally, it's file_path should be None)
+        :type bundle: :class:`AioDownloadBundle`
+
+        :return: full file_path for the bundle
+        :rtype: str
+        """
+
+        digest = hashlib.new(self.algorithm, bundle.url.encode('utf-8')).hexdigest()
+        extension = clean_filename(os.path.splitext(urlparse(bundle.url).path)[1])[:16]
+
+        return os.path.sep.join(
+            [self.home] +
+            [digest[i * self.width:(i + 1) * self.width] for i in range(0, self.depth)] +
+            [digest + extension]
+        )
+
+    async def after_write(self, response, bundle):
+
+        await super().after_write(response, bundle)
+
+        key = self.get_store_key(bundle)
+        if self.url_index.get(bundle.url) != key:
+            self.url_index.set(bundle.url, key)
+
+    def get_stores(self):
+        return super().get_stores() + [self.url_index]
+
+
+class ContentAddressedDownloadStrategy(DownloadStrategy):
+    """Download strategy storing every unique body once, under its digest.
+
+    The body is hashed as it streams into a temporary file which then becomes
+    the object ``objects/<d0d1>/<d2d3>/<digest>`` (or is dropped when the
+    object is already stored).  The file path of the bundle is hardlinked to
+    the object (or gets a copy of it where it can't be linked, ex. across file
+    systems) and the digest is recorded on the bundle and in a digest index,
+    so disk usage scales with unique content rather than the number of URLs.
+
+    Bodies are hashed in order, so files aren't segmented or resumed.
+
+    :param algorithm: (optional) hashlib algorithm hashing the content
+    :type algorithm: str
+    :param objects: (optional) directory of the objects, defaults to .objects in the home directory
+    :type objects: str
+    :param link: (optional) hardlink the file path of the bundle to the object (else only index it)
+    :type link: bool
+    :param digest_index: (optional) store of file path to digest, defaults to a manifest in the home directory
+    :type digest_index: :class:`aiodownload.store.ManifestStore`
+    :param kwargs: (optional) :class:`DownloadStrategy` keyword arguments
+    """
+
+    def __init__(self, algorithm='sha256', objects=None, link=True, digest_index=None, **kwargs):
+        super().__init__(**kwargs)
+        self.algorithm = algorithm
+        self.objects = objects or os.path.sep.join([self.home, '.objects'])
+        self.link = link
+        self.digest_index = digest_index or ManifestStore(os.path.sep.join([self.home, DIGEST_INDEX_NAME]))
+
+    def get_object_path(self, digest):
+        """Get the file path of the object holding the content with the digest
+
+        :param digest: hex digest of the content
+        :type digest: str
+
+        :return: object file path
+        :rtype: str
+        """
+
+        return os.path.sep.join([self.objects, digest[0:2], digest[2:4], digest])
+
+    def get_content_path(self, bundle):
+
+        if self.link:
+            return bundle.file_path
+
+        # Nothing is written at the file path: the content is the object of the digest indexed for it
+        digest = bundle.digest or self.digest_index.get(self.get_store_key(bundle))
+
+        return self.get_object_path(digest) if digest else None
+
+    def get_segments(self, response):
+        return None
+
+    async def on_fail(self, bundle):
+
+        # Unlink first: truncating the file path in place would truncate the object it links to
+        await self.run_io(remove, bundle.file_path)
+        await super().on_fail(bundle)
+
+    async def on_success(self, response, bundle):
+        """Hash the response while writing it to a temporary file, store it as
+        an object (unless already stored) and link the file path to it
+
+        :param response: successful response from an HTTP response
+        :type response: :class:`aiohttp.ClientResponse`
+        :param bundle: bundle (file_path should exist)
+        :type bundle: :class:`AioDownloadBundle`
+
+        :return: None
+        """
+
+        self.set_encoding(bundle, self.get_stored_encoding(response))
+
+        temp_path = os.path.sep.join([self.objects, 'tmp', uuid.uuid4().hex])
+        await self.make_dirs(temp_path)
+
+        hasher = hashlib.new(self.algorithm)
+        try:
+            async with self.open_file(temp_path, 'wb') as f:
+
+                async def write(chunk):
+                    hasher.update(chunk)
+                    await f.write(chunk)
+
+                await self.stream_content(response, bundle, write)
+        except BaseException:
+            await self.run_io(remove, temp_path)
+            raise
+
+        bundle.digest = hasher.hexdigest()
+        object_path = self.get_object_path(bundle.digest)
+
+        if not await self.run_io(store_object, temp_path, object_path):
+            logger.debug('Duplicate content {} for {}'.format(bundle.digest, bundle.url))
+
+        if self.link:
+            await self.make_dirs(bundle.file_path)
+            if not await self.run_io(hardlink, object_path, bundle.file_path):
+                logger.debug('Copied {} to {} (could not hardlink it)'.format(object_path, bundle.file_path))
+
+        key = self.get_store_key(bundle)
+        if self.digest_index.get(key) != bundle.digest:
+            self.digest_index.set(key, bundle.digest)
+
+        await self.after_write(response, bundle)
+
+    def get_stores(self):
+        return super().get_stores() + [self.digest_index]
+
+
+class MemoryDownloadStrategy(DownloadStrategy):
+    """Download strategy keeping response content in memory (as a bytearray
+    on ``bundle.body``) instead of writing it to disk.  No file path is
+    determined and nothing is cached.
+
+    The buffer is allocated up front when the response has a Content-Length
+    (of an unencoded body); responses larger than ``max_size`` fail.
+
+    :param max_size: (optional) maximum number of bytes kept for a response
+    :type max_size: int
+    :param kwargs: (optional) :class:`DownloadStrategy` keyword arguments
+    """
+
+    def __init__(self, max_size=67108864, **kwargs):
+        super().__init__(**kwargs)
+        self.max_size = max_size
+
+    def get_file_path(self, bundle):
+        return None
+
+    def get_segments(self, response):
+        return None
+
+    async def is_cached(self, bundle):
+        return False
+
+    async def on_fail(self, bundle):
+        bundle.body = None
+
+    async def on_success(self, response, bundle):
+        """Read the response content into ``bundle.body``
+
+        :param response: successful response from an HTTP response
+        :type response: :class:`aiohttp.ClientResponse`
+        :param bundle: bundle
+        :type bundle: :class:`AioDownloadBundle`
+
+        :return: None
+        """
+
+        self.set_encoding(bundle, self.get_stored_encoding(response))
+
+        length = None
+        if 'Content-Encoding' not in response.headers or self.get_raw_encoding(response):  # else it's the encoded size
+            try:
+                length = int(response.headers['Content-Length'])
+            except (KeyError, ValueError):
+                pass
+
+        if length is not None and length > self.max_size:
+            raise ValueError('Content-Length {} exceeds the maximum size of {}'.format(length, self.max_size))
+
+        body = bytearray(length or 0)
+        size = 0
+
+        async def write(chunk):
+            nonlocal size
+            if size + len(chunk) > self.max_size:
+                raise ValueError('Content exceeds the maximum size of {}'.format(self.max_size))
+            body[size:size + len(chunk)] = chunk
+            size += len(chunk)
+
+        await self.stream_content(response, bundle, write)
+
+        del body[size:]
+        bundle.body = body
+
 
 class RequestStrategy:
     """RequestStrategy is an injection class for AioDownload.  The purpose is
@@ -87,12 +898,156 @@ class RequestStrategy:
     :type max_attempts: int
     :param time_out: timeout for the client session
     :type time_out: int
+    :param concurrent_per_host: (optional) the number of concurrent requests allowed per host (None for no cap)
+    :type concurrent_per_host: int
+    :param keepalive_timeout: (optional) seconds an idle connection is kept alive in the pool
+    :type keepalive_timeout: float
+    :param limit_per_host: (optional) size of the connection pool per host (0 for no limit)
+    :type limit_per_host: int
+    :param ttl_dns_cache: (optional) seconds resolved DNS entries are cached (None to cache forever)
+    :type ttl_dns_cache: int
+    :param rate_limiter: (optional) rate limiter consulted before each request
+    :type rate_limiter: :class:`aiodownload.ratelimit.RateLimiter`
+    :param circuit_breaker: (optional) circuit breaker holding back the requests for hosts which are down
+    :type circuit_breaker: :class:`aiodownload.breaker.CircuitBreaker`
+    :param max_retry_after: (optional) longest Retry-After delay honored, in seconds (longer ones are capped)
+    :type max_retry_after: float
     """
 
-    def __init__(self, concurrent=2, max_attempts=0, timeout=60):
+    def __init__(self, concurrent=2, max_attempts=0, timeout=60, concurrent_per_host=None, keepalive_timeout=15,
+                 limit_per_host=0, ttl_dns_cache=10, rate_limiter=None, circuit_breaker=None, max_retry_after=300):
         self.concurrent = concurrent
         self.max_attempts = max_attempts
         self.timeout = timeout
+        self.concurrent_per_host = concurrent_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.limit_per_host = limit_per_host
+        self.ttl_dns_cache = ttl_dns_cache
+        self.rate_limiter = rate_limiter
+        self.circuit_breaker = circuit_breaker
+        self.max_retry_after = max_retry_after
+
+    def get_connector(self, loop=None):
+        """Returns the connector used by the default client session
+
+        The total connection limit is left open as the number of requests in
+        flight is already capped by :class:`AioDownload`.
+
+        :param loop: (optional) event loop the connector is bound to
+        :type loop: :class:`asyncio.AbstractEventLoop`
+
+        :return: connector
+        :rtype: :class:`aiohttp.TCPConnector`
+        """
+
+        return aiohttp.TCPConnector(
+            keepalive_timeout=self.keepalive_timeout,
+            limit=0,
+            limit_per_host=self.limit_per_host,
+            loop=loop,
+            ttl_dns_cache=self.ttl_dns_cache
+        )
+
+    def get_rate_delay(self, host):
+        """Returns how long until the rate limiter (when one is attached)
+        allows a request to the host, without reserving it
+
+        :param host: host (netloc) of the URL
+        :type host: str
+
+        :return: 0 if the request may be reserved right away, else seconds to wait
+        :rtype: float
+        """
+
+        return self.rate_limiter.get_delay(host) if self.rate_limiter else 0
+
+    def reserve_rate(self, host):
+        """Reserve a request to the host with the rate limiter (when one is
+        attached)
+
+        :param host: host (netloc) of the URL
+        :type host: str
+
+        :return: seconds to wait before the reserved request is due
+        :rtype: float
+        """
+
+        return self.rate_limiter.reserve(host) if self.rate_limiter else 0
+
+    def get_circuit_delay(self, host, claim=True):
+        """Returns how long to wait before checking again whether a request
+        to the host may be made (see :meth:`CircuitBreaker.get_delay`)
+
+        :param host: host (netloc) of the URL
+        :type host: str
+        :param claim: (optional) take the probe of a half-open circuit when the request may be made (else only check)
+        :type claim: bool
+
+        :return: 0 if the request may be made, else a delay in seconds (None to fail the bundle)
+        :rtype: float
+        """
+
+        return self.circuit_breaker.get_delay(host, claim=claim) if self.circuit_breaker else 0
+
+    def get_retry_after(self, bundle):
+        """Returns the delay asked for by the last response of the bundle
+        (Retry-After header), capped by max_retry_after
+
+        :param bundle: bundle
+        :type bundle: :class:`AioDownloadBundle`
+
+        :return: delay in seconds (None if none was asked for)
+        :rtype: float
+        """
+
+        if bundle.retry_after is None:
+            return None
+
+        return min(bundle.retry_after, self.max_retry_after)
+
+    def get_host_concurrency(self, host):
+        """Returns how many concurrent requests are allowed for the host
+
+        :param host: host (netloc) of the URL
+        :type host: str
+
+        :return: concurrency cap (None or 0 for no cap)
+        :rtype: int
+        """
+
+        return self.concurrent_per_host
+
+    def on_attempt(self, host, status, latency):
+        """Feedback on every request made (ex. to adapt the concurrency),
+        called before its request slot is released
+
+        :param host: host (netloc) of the URL
+        :type host: str
+        :param status: HTTP status of the response (None if the request failed)
+        :type status: int
+        :param latency: seconds until the response headers (or the failure)
+        :type latency: float
+
+        :return: None
+        """
+
+        if self.circuit_breaker:
+            self.circuit_breaker.record(host, status is not None and status < 500)
+
+    def on_cancel(self, host, started):
+        """Called instead of :meth:`on_attempt` for a request cancelled by the
+        caller (which says nothing about the server)
+
+        :param host: host (netloc) of the URL
+        :type host: str
+        :param started: event loop time the request was started
+        :type started: float
+
+        :return: None
+        """
+
+        if self.circuit_breaker:
+            self.circuit_breaker.cancel(host, started)
 
     def assert_response(self, response):
         """Assertion for the response
@@ -134,8 +1089,8 @@ class Lenient(RequestStrategy):
     times with a minute between each retry.
     """
 
-    def __init__(self, max_attempts=5):
-        RequestStrategy.__init__(self, max_attempts)
+    def __init__(self, max_attempts=5, **kwargs):
+        RequestStrategy.__init__(self, max_attempts=max_attempts, **kwargs)
 
     def retry(self, response):
         """Retry any unsuccessful HTTP response except a 404 (if they say
@@ -146,6 +1101,10 @@ class Lenient(RequestStrategy):
 
     def get_sleep_time(self, bundle):
 
+        retry_after = self.get_retry_after(bundle)
+        if retry_after is not None:
+            return retry_after
+
         # Retry pattern: 0.25, 60, 60, 60, 60
         return 0.25 if bundle.attempts == 0 else 60
 
@@ -156,10 +1115,113 @@ class BackOff(RequestStrategy):
     response is returned.
     """
 
-    def __init__(self, max_attempts=10):
-        RequestStrategy.__init__(self, max_attempts)
+    def __init__(self, max_attempts=10, **kwargs):
+        RequestStrategy.__init__(self, max_attempts=max_attempts, **kwargs)
 
     def get_sleep_time(self, bundle):
 
+        retry_after = self.get_retry_after(bundle)
+        if retry_after is not None:
+            return retry_after
+
         # Retry pattern: 0.25, 0.5, 1, 2, 4, 8, 16, 32, 60, 60
         return min(2**(bundle.attempts - 2), 60)
+
+
+class Adaptive(BackOff):
+    """Adaptive request strategy which finds the concurrency a server takes:
+    the limit grows while responses are healthy and is cut down on 429 / 5xx
+    responses, timeouts, connection errors or a growing latency (see
+    :class:`aiodownload.concurrency.AimdLimit`).  Failed responses other than
+    404 are retried with an exponential back off.
+
+    The limit is global unless ``per_host`` is set, in which case every host
+    gets its own (``concurrent`` then only caps the total).
+
+    :param concurrent: (optional) initial limit (the total cap when per_host is set)
+    :type concurrent: int
+    :param min_concurrent: (optional) lowest limit
+    :type min_concurrent: int
+    :param max_concurrent: (optional) highest limit
+    :type max_concurrent: int
+    :param per_host: (optional) adapt a limit for every host instead of a global one
+    :type per_host: bool
+    :param increase: (optional) requests added to the limit per round of healthy responses
+    :type increase: float
+    :param decrease: (optional) factor applied to the limit on an overload
+    :type decrease: float
+    :param latency_factor: (optional) latency growth (over the fastest response) taken as an overload (None to ignore)
+    :type latency_factor: float
+    """
+
+    def __init__(self, concurrent=2, min_concurrent=1, max_concurrent=64, per_host=False, increase=1, decrease=0.5,
+                 latency_factor=3, **kwargs):
+        self.per_host = per_host
+        self._limit_options = {
+            'decrease': decrease, 'increase': increase, 'latency_factor': latency_factor, 'limit': concurrent,
+            'max_limit': max_concurrent, 'min_limit': min_concurrent
+        }
+        self._limit = None if per_host else AimdLimit(**self._limit_options)
+        self._host_limits = {}
+        BackOff.__init__(self, concurrent=max_concurrent if per_host else concurrent, **kwargs)
+
+    @property
+    def concurrent(self):
+        """Current global limit (fixed when per_host is set)
+
+        :rtype: int
+        """
+
+        return self._concurrent if self._limit is None else self._limit.limit
+
+    @concurrent.setter
+    def concurrent(self, concurrent):
+        self._concurrent = concurrent
+
+    def get_limits(self):
+        """Returns the current limits, for monitoring
+
+        :return: global limit and the limit of every host seen (when per_host is set)
+        :rtype: dict
+        """
+
+        return {
+            'concurrent': self.concurrent,
+            'hosts': dict((host, limit.limit) for host, limit in self._host_limits.items())
+        }
+
+    def get_host_limit(self, host):
+        """Returns the adaptive limit of the host (created on first use)
+
+        :param host: host (netloc) of the URL
+        :type host: str
+
+        :return: limit or None when the limit is global
+        :rtype: :class:`aiodownload.concurrency.AimdLimit`
+        """
+
+        if not self.per_host:
+            return None
+
+        limit = self._host_limits.get(host)
+        if limit is None:
+            limit = self._host_limits[host] = AimdLimit(**self._limit_options)
+
+        return limit
+
+    def get_host_concurrency(self, host):
+
+        limit = self.get_host_limit(host)
+        if limit is None:
+            return self.concurrent_per_host
+
+        return min(limit.limit, self.concurrent_per_host or limit.limit)
+
+    def on_attempt(self, host, status, latency):
+
+        BackOff.on_attempt(self, host, status, latency)
+        (self.get_host_limit(host) or self._limit).update(status, latency, host)
+
+    def retry(self, response):
+
+        return response.status != 404
@@ -0,0 +1,165 @@
+"""Tracing
+
+This module contains the per attempt timings recorded on bundles by
+:class:`AioDownload` (``trace=True``) and the :class:`aiohttp.TraceConfig`
+feeding them the connection phases of the default client session.
+"""
+
+import aiohttp
+
+
+class AttemptTiming:
+    """Timings of one attempt (request) of a bundle, in seconds.  Phases that
+    didn't happen (ex. dns and connect on a reused connection) are None.
+
+    * queued: waiting for a connection from the connector's pool
+    * dns: resolving the host
+    * connect: opening the connection, TLS handshake included (dns excluded)
+    * ttfb: from the start of the attempt until the response headers arrived
+    * transfer: from the response headers until the content was written
+    * total: the whole attempt
+
+    Timings pickle without their event loop (ex. on bundles sent back by
+    the worker processes of :func:`aiodownload.pool_each`), so only a timing
+    made in the current process can go on recording phases.
+
+    :param loop: event loop the attempt runs on
+    :type loop: :class:`asyncio.AbstractEventLoop`
+    """
+
+    PHASES = ('queued', 'dns', 'connect', 'ttfb', 'transfer', 'total')
+
+    def __init__(self, loop):
+        self.bytes = 0  # content bytes received
+        self.connect = None
+        self.dns = None
+        self.queued = None
+        self.reused = False  # whether a pooled connection was reused
+        self.start = loop.time()
+        self.status = None  # response status (None if there was no response)
+        self.total = None
+        self.transfer = None
+        self.ttfb = None
+        self._begun = {}
+        self._loop = loop
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_begun'] = {}
+        state['_loop'] = None  # event loops don't pickle
+
+        return state
+
+    def begin(self, phase):
+        """Mark the beginning of a phase
+
+        :param phase: name of the phase
+        :type phase: str
+
+        :return: None
+        """
+
+        self._begun[phase] = self._loop.time()
+
+    def end(self, phase):
+        """Mark the end of a phase, adding its duration to the phase
+
+        :param phase: name of the phase
+        :type phase: str
+
+        :return: duration in seconds
+        :rtype: float
+        """
+
+        duration = self._loop.time() - self._begun.pop(phase, self._loop.time())
+        setattr(self, phase, (getattr(self, phase) or 0) + duration)
+
+        return duration
+
+    def response_started(self, status):
+        """Record the arrival of the response headers
+
+        :param status: response status
+        :type status: int
+
+        :return: None
+        """
+
+        self.status = status
+        self.ttfb = self._loop.time() - self.start
+
+    def finish(self, received):
+        """Record the end of the attempt
+
+        :param received: number of content bytes received
+        :type received: int
+
+        :return: None
+        """
+
+        self.bytes = received
+        self.total = self._loop.time() - self.start
+        if self.ttfb is not None:
+            self.transfer = self.total - self.ttfb
+
+    def get_phases(self):
+        """Returns the durations of the phases that happened
+
+        :return: phase name -> seconds
+        :rtype: dict
+        """
+
+        return dict((phase, getattr(self, phase)) for phase in self.PHASES if getattr(self, phase) is not None)
+
+
+def _on_phase_start(phase):
+
+    async def on_start(session, context, params):
+        if context.trace_request_ctx is not None:
+            context.trace_request_ctx.begin(phase)
+
+    return on_start
+
+
+def _on_phase_end(phase):
+
+    async def on_end(session, context, params):
+        if context.trace_request_ctx is not None:
+            context.trace_request_ctx.end(phase)
+
+    return on_end
+
+
+async def _on_connection_create_end(session, context, params):
+
+    timing = context.trace_request_ctx
+    if timing is not None:
+        timing.end('connect')
+        if timing.dns:
+            timing.connect = max(timing.connect - timing.dns, 0)  # the host is resolved while connecting
+
+
+async def _on_connection_reuseconn(session, context, params):
+
+    if context.trace_request_ctx is not None:
+        context.trace_request_ctx.reused = True
+
+
+def make_trace_config():
+    """Returns a trace config recording the connection phases of requests
+    made with an :class:`AttemptTiming` as ``trace_request_ctx``
+
+    :rtype: :class:`aiohttp.TraceConfig`
+    """
+
+    trace_config = aiohttp.TraceConfig()
+
+    trace_config.on_connection_queued_start.append(_on_phase_start('queued'))
+    trace_config.on_connection_queued_end.append(_on_phase_end('queued'))
+    trace_config.on_dns_resolvehost_start.append(_on_phase_start('dns'))
+    trace_config.on_dns_resolvehost_end.append(_on_phase_end('dns'))
+    trace_config.on_connection_create_start.append(_on_phase_start('connect'))
+    trace_config.on_connection_create_end.append(_on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(_on_connection_reuseconn)
+
+    return trace_config
@@ -4,19 +4,40 @@ This module contains some utility function used to help with the
 implementation of the default strategies
 """
 
+from email.utils import parsedate_to_datetime
 import errno
+import functools
+import hashlib
 import os
 import string
+import time
 import unicodedata
 from urllib.parse import urlparse
 
 
 REPLACEMENT_CHAR = {'&': '-', ',': '.', ';': '-', '=': '_'}
 
+ALLOWED_CHARS = '-_.() ' + string.ascii_letters + string.digits
 
+CLEAN_FILENAME_CACHE_SIZE = 65536  # cleaned segments kept (hosts and path segments repeat a lot in a crawl)
+
+# Translation tables: the replacements, the removal of disallowed ASCII characters and both at once
+_REPLACEMENT_TABLE = str.maketrans(REPLACEMENT_CHAR)
+_ALLOWED_TABLE = str.maketrans(dict((chr(i), None) for i in range(0, 128) if chr(i) not in ALLOWED_CHARS))
+_ASCII_TABLE = str.maketrans(dict(
+    (chr(i), REPLACEMENT_CHAR.get(chr(i), chr(i) if chr(i) in ALLOWED_CHARS else None)) for i in range(0, 128)
+))
+
+ENCODING_SUFFIX = {'br': '.br', 'compress': '.Z', 'deflate': '.zz', 'gzip': '.gz', 'x-gzip': '.gz', 'zstd': '.zst'}
+
+
+@functools.lru_cache(maxsize=CLEAN_FILENAME_CACHE_SIZE)
 def clean_filename(filename):
     """Return a sanitized filename (replace / strip out illegal characters)
 
+    ASCII filenames go through a single translation table; others are NFKD
+    normalized first so accented characters keep their base letter.
+
     :param filename: string used for a filename
     :type filename: str
 
@@ -24,13 +45,17 @@ def clean_filename(filename):
     :rtype: str
     """
 
-    return ''.join([
-        c for c in unicodedata.normalize(
-            'NFKD',
-            ''.join([REPLACEMENT_CHAR.get(c, c) for c in filename])
-        )
-        if not unicodedata.combining(c) and c in '-_.() {0}{1}'.format(string.ascii_letters, string.digits)
-    ])
+    try:
+        filename.encode('ascii')  # (str.isascii needs Python 3.7)
+    except UnicodeEncodeError:
+        pass
+    else:
+        return filename.translate(_ASCII_TABLE)
+
+    # Combining characters (and anything else outside of ASCII) are dropped after the decomposition
+    decomposed = unicodedata.normalize('NFKD', filename.translate(_REPLACEMENT_TABLE))
+
+    return decomposed.encode('ascii', 'ignore').decode('ascii').translate(_ALLOWED_TABLE)
 
 
 def make_dirs(file_path):
@@ -49,6 +74,122 @@ def make_dirs(file_path):
             raise  # pragma: no cover
 
 
+def get_netloc(url):
+    """Return the network location (host and port) of a URL
+
+    :param url: URL string
+    :type url: str
+
+    :return: netloc
+    :rtype: str
+    """
+
+    return urlparse(url).netloc
+
+
+def get_range_start(content_range):
+    """Return the first byte position of a Content-Range header value
+
+    :param content_range: header value (ex. bytes 100-199/200)
+    :type content_range: str
+
+    :return: first byte position (None if it can't be parsed)
+    :rtype: int
+    """
+
+    try:
+        unit, byte_range = content_range.split(' ', 1)
+        return int(byte_range.split('-', 1)[0]) if unit == 'bytes' else None
+    except (AttributeError, ValueError):
+        return None
+
+
+def get_validator(headers):
+    """Return the validator of a response usable in an If-Range header (a
+    strong ETag or else the Last-Modified date)
+
+    :param headers: response headers
+    :type headers: dict
+
+    :return: validator (None if there is none)
+    :rtype: str
+    """
+
+    etag = headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+
+    return headers.get('Last-Modified')
+
+
+def get_retry_after(headers, now=None):
+    """Return the delay asked for by the Retry-After header of a response
+    (given in seconds or as an HTTP date)
+
+    :param headers: response headers
+    :type headers: dict
+    :param now: (optional) current time (seconds since the epoch) an HTTP date is relative to
+    :type now: float
+
+    :return: delay in seconds (None if there is no valid header)
+    :rtype: float
+    """
+
+    value = headers.get('Retry-After')
+    if not value:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    return max(date.timestamp() - (time.time() if now is None else now), 0)
+
+
+def get_encoding_suffix(encoding):
+    """Return the file name suffix of a content encoding (a suffix for each
+    coding when several were applied, in the order they were applied)
+
+    :param encoding: Content-Encoding header value (ex. gzip or gzip, br)
+    :type encoding: str
+
+    :return: suffix (ex. .gz or .gz.br)
+    :rtype: str
+    """
+
+    suffixes = []
+    for coding in encoding.lower().split(','):
+        coding = coding.strip()
+        if coding and coding != 'identity':
+            suffixes.append(ENCODING_SUFFIX.get(coding) or '.' + clean_filename(coding))
+
+    return ''.join(suffixes)
+
+
+def disambiguate_path(file_path, url):
+    """Return a file path made unique for a URL by a short hash of the URL
+    inserted before the extension (ex. page.html -> page-1a2b3c4d.html)
+
+    :param file_path: file path shared with other URLs
+    :type file_path: str
+    :param url: URL string
+    :type url: str
+
+    :return: file path
+    :rtype: str
+    """
+
+    directory, filename = os.path.split(file_path)
+    root, extension = os.path.splitext(filename)
+
+    return os.path.join(directory, '{}-{}{}'.format(root, hashlib.sha1(url.encode()).hexdigest()[:8], extension))
+
+
 def default_url_transform(url):
     """URL path segments are transformed into directories along a file path
     with the last path segment representing the filename.
@@ -0,0 +1,6 @@
+"""aiodownload benchmarks
+
+Run a benchmark module from the repository root, for example::
+
+    $ python -m benchmarks.bench_slow_disk
+"""
@@ -0,0 +1,68 @@
+"""Event loop benchmark
+
+Compares the small file throughput of :class:`AioDownload` on each event
+loop implementation available (the default asyncio loop, uvloop when it is
+installed).  The server runs on its own loop in a background thread::
+
+    $ python -m benchmarks.bench_loops --urls 2000 --size 1024 --loops asyncio uvloop
+"""
+
+import argparse
+import json
+import tempfile
+import time
+
+from aiodownload import AioDownload, DownloadStrategy, MemoryDownloadStrategy, RequestStrategy, swarm
+from aiodownload.loops import get_loop_factory
+
+from .server import ServerThread
+
+
+def run(loop_name, server, args):
+
+    loop = get_loop_factory(loop_name)()
+
+    urls = [server.url('/bytes/{}?n={}'.format(args.size, i)) for i in range(0, args.urls)]
+
+    with tempfile.TemporaryDirectory() as home:
+
+        download = AioDownload(
+            download_strategy=MemoryDownloadStrategy() if args.memory else DownloadStrategy(home=home),
+            request_strategy=RequestStrategy(concurrent=args.concurrent),
+            loop=loop
+        )
+
+        start = time.perf_counter()
+        bundles = swarm(urls, download=download)
+        elapsed = time.perf_counter() - start
+
+    loop.close()
+
+    return {
+        'loop': loop_name,
+        'urls': len(bundles),
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(bundles) / elapsed, 1)
+    }
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--urls', type=int, default=2000, help='number of URLs to download')
+    parser.add_argument('--size', type=int, default=1024, help='response body size in bytes')
+    parser.add_argument('--concurrent', type=int, default=64, help='number of concurrent requests')
+    parser.add_argument('--memory', action='store_true', help='keep bodies in memory instead of writing files')
+    parser.add_argument('--loops', nargs='+', default=['asyncio', 'uvloop'], help='event loop implementations')
+    args = parser.parse_args()
+
+    with ServerThread() as server:
+        for loop_name in args.loops:
+            try:
+                print(json.dumps(run(loop_name, server, args)))
+            except ImportError as exc:
+                print(json.dumps({'loop': loop_name, 'error': str(exc)}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Slow disk benchmark
+
+Compares the download throughput of the default :class:`DownloadStrategy`
+(file I/O in a thread pool, writes buffered behind the reads) with writing
+on the event loop thread, while every open and write to disk is delayed to
+simulate a slow (network) file system::
+
+    $ python -m benchmarks.bench_slow_disk --urls 200 --size 262144 --latency 0.005
+"""
+
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+
+from aiodownload import AioDownload, DownloadStrategy, RequestStrategy, swarm
+from aiodownload.fileio import AsyncFile
+from aiodownload.util import make_dirs
+
+from .server import BenchmarkServer
+
+
+class SlowFile:
+    """File wrapper sleeping (blocking the calling thread) before each write
+    """
+
+    def __init__(self, f, latency):
+        self._f = f
+        self._latency = latency
+
+    def write(self, data):
+        time.sleep(self._latency)
+        return self._f.write(data)
+
+    def seek(self, offset):
+        return self._f.seek(offset)
+
+    def close(self):
+        self._f.close()
+
+
+def slow_opener(latency):
+
+    def opener(file_path, mode):
+        time.sleep(latency)
+        return SlowFile(open(file_path, mode), latency)
+
+    return opener
+
+
+class BlockingDownloadStrategy(DownloadStrategy):
+    """Writes on the event loop thread (the behaviour before the thread pool)
+    """
+
+    def __init__(self, latency, **kwargs):
+        super().__init__(**kwargs)
+        self.opener = slow_opener(latency)
+
+    async def on_success(self, response, bundle):
+
+        make_dirs(bundle.file_path)
+
+        f = self.opener(bundle.file_path, 'wb+')
+        try:
+            while True:
+                chunk = await response.content.read(self.chunk_size)
+                if not chunk:
+                    break
+                f.write(chunk)
+        finally:
+            f.close()
+
+
+class ThreadedDownloadStrategy(DownloadStrategy):
+    """The default strategy writing through the slow disk simulation
+    """
+
+    def __init__(self, latency, **kwargs):
+        super().__init__(**kwargs)
+        self.opener = slow_opener(latency)
+
+    def open_file(self, file_path, mode='wb'):
+        return AsyncFile(file_path, mode, executor=self.executor, max_buffer=self.max_buffer, opener=self.opener)
+
+
+def run(download_strategy, args):
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    server = BenchmarkServer()
+    loop.run_until_complete(server.start())
+
+    urls = [server.url('/bytes/{}?n={}'.format(args.size, i)) for i in range(0, args.urls)]
+    download = AioDownload(
+        download_strategy=download_strategy,
+        request_strategy=RequestStrategy(concurrent=args.concurrent)
+    )
+
+    start = time.perf_counter()
+    bundles = swarm(urls, download=download)
+    elapsed = time.perf_counter() - start
+
+    loop.run_until_complete(server.stop())
+    loop.close()
+
+    return {
+        'strategy': type(download_strategy).__name__,
+        'urls': len(bundles),
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(bundles) / elapsed, 1),
+        'megabytes_per_second': round(len(bundles) * args.size / elapsed / 1048576, 2)
+    }
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--urls', type=int, default=200, help='number of URLs to download')
+    parser.add_argument('--size', type=int, default=262144, help='response body size in bytes')
+    parser.add_argument('--latency', type=float, default=0.005, help='seconds added to every open and write')
+    parser.add_argument('--concurrent', type=int, default=16, help='number of concurrent requests')
+    parser.add_argument('--io-workers', type=int, default=8, help='threads in the file I/O thread pool')
+    args = parser.parse_args()
+
+    for strategy_class in (BlockingDownloadStrategy, ThreadedDownloadStrategy):
+        with tempfile.TemporaryDirectory() as home:
+            download_strategy = strategy_class(args.latency, home=home, io_workers=args.io_workers)
+            print(json.dumps(run(download_strategy, args)))
+
+
+if __name__ == '__main__':
+    main()
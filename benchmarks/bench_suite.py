@@ -0,0 +1,228 @@
+"""Benchmark suite
+
+Runs the API functions (``one``, ``each`` and ``swarm``) against a local
+benchmark server (in its own process) for a set of scenarios and URL counts,
+printing one JSON object per run (requests and bytes per second, p50 / p99
+latency of a download, peak RSS and event loop lag) for regression tracking::
+
+    $ python -m benchmarks.bench_suite --urls 1000 10000 --scenarios small errors --output results.jsonl
+
+Scenarios shape the responses of the server (see :mod:`benchmarks.server`):
+
+* small: 1 KiB bodies
+* large: 1 MiB bodies
+* latency: 1 KiB bodies after 50 ms
+* errors: 1 KiB bodies, 10% of the requests fail with a 503 (and are retried)
+* drip: 64 KiB bodies sent 4 KiB every 5 ms
+
+Every run happens in a fresh process so the peak RSS is the run's own.  Runs
+use a :class:`MemoryDownloadStrategy` unless ``--disk`` is given, and ``one``
+is run over at most ``--one-urls`` URLs (one download object per URL is slow).
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+from aiodownload import AioDownload, DownloadStrategy, MemoryDownloadStrategy, RequestStrategy, each, one, swarm
+from aiodownload.aiodownload import Status
+
+from .server import ServerProcess
+
+SCENARIOS = {
+    'small': {'size': 1024},
+    'large': {'size': 1048576},
+    'latency': {'size': 1024, 'latency': 0.05},
+    'errors': {'size': 1024, 'error_rate': 0.1},
+    'drip': {'size': 65536, 'drip': 0.005, 'chunk': 4096}
+}
+
+
+class Retrying(RequestStrategy):
+    """Retries failed responses right away (the default strategies sleep)
+    """
+
+    def retry(self, response):
+        return True
+
+    def get_sleep_time(self, bundle):
+        return 0
+
+
+class TimedDownload(AioDownload):
+    """AioDownload recording how long each download took
+    """
+
+    def __init__(self, latencies, **kwargs):
+        super().__init__(**kwargs)
+        self.latencies = latencies
+
+    async def main(self, bundle):
+
+        start = self.loop.time()
+        bundle = await super().main(bundle)
+        self.latencies.append(self.loop.time() - start)
+
+        return bundle
+
+
+class LagMonitor:
+    """Measures how late the event loop runs a callback scheduled every
+    ``interval`` seconds (time the loop was blocked)
+    """
+
+    def __init__(self, loop, interval=0.01):
+        self.loop = loop
+        self.interval = interval
+        self.lags = []
+        self._handle = None
+        self._expected = None
+
+    def start(self):
+        self._expected = self.loop.time() + self.interval
+        self._handle = self.loop.call_at(self._expected, self._tick)
+
+    def stop(self):
+        self._handle.cancel()
+
+    def _tick(self):
+        now = self.loop.time()
+        self.lags.append(max(now - self._expected, 0))
+        self._expected = now + self.interval
+        self._handle = self.loop.call_at(self._expected, self._tick)
+
+
+def percentile(values, fraction):
+
+    if not values:
+        return None
+
+    values = sorted(values)
+
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def get_peak_rss():
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def make_urls(prefix, scenario, count):
+
+    query = '&'.join('{}={}'.format(k, v) for k, v in sorted(scenario.items()) if k != 'size')
+
+    return [
+        '{}/bytes/{}?n={}{}'.format(prefix, scenario['size'], i, '&' + query if query else '') for i in range(count)
+    ]
+
+
+def run(api, scenario_name, count, prefix, args):
+
+    scenario = SCENARIOS[scenario_name]
+    urls = make_urls(prefix, scenario, min(count, args.one_urls) if api == 'one' else count)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    monitor = LagMonitor(loop)
+    latencies = []
+
+    with tempfile.TemporaryDirectory() as home:
+
+        def make_download():
+            return TimedDownload(
+                latencies,
+                download_strategy=DownloadStrategy(home=home) if args.disk else MemoryDownloadStrategy(),
+                request_strategy=Retrying(concurrent=args.concurrent, max_attempts=args.max_attempts),
+                loop=loop
+            )
+
+        monitor.start()
+        start = time.perf_counter()
+
+        # Bundles are counted as they come so that holding on to them doesn't add to the peak RSS
+        if api == 'one':
+            bundles = (one(url, download=make_download()) for url in urls)
+        elif api == 'each':
+            bundles = each(urls, download=make_download(), window=args.window)
+        else:
+            bundles = swarm(urls, download=make_download())
+
+        done = attempts = 0
+        for bundle in bundles:
+            done += bundle.status == Status.DONE
+            attempts += bundle.attempts
+
+        elapsed = time.perf_counter() - start
+        monitor.stop()
+
+    loop.close()
+    asyncio.set_event_loop(None)
+
+    return {
+        'api': api,
+        'scenario': scenario_name,
+        'urls': len(urls),
+        'done': done,
+        'attempts': attempts,
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(urls) / elapsed, 1),
+        'bytes_per_second': round(done * scenario['size'] / elapsed),
+        'latency_p50': percentile(latencies, 0.5),
+        'latency_p99': percentile(latencies, 0.99),
+        'peak_rss': get_peak_rss(),
+        'loop_lag_p99': percentile(monitor.lags, 0.99),
+        'loop_lag_max': max(monitor.lags) if monitor.lags else None,
+        'concurrent': args.concurrent,
+        'python': platform.python_version(),
+        'aiohttp': aiohttp.__version__,
+        'timestamp': time.time()
+    }
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--urls', type=int, nargs='+', default=[1000], help='URL counts (ex. 1000 10000 1000000)')
+    parser.add_argument('--apis', nargs='+', default=['one', 'each', 'swarm'], choices=['one', 'each', 'swarm'])
+    parser.add_argument('--scenarios', nargs='+', default=sorted(SCENARIOS), choices=sorted(SCENARIOS))
+    parser.add_argument('--concurrent', type=int, default=64, help='number of concurrent requests')
+    parser.add_argument('--max-attempts', type=int, default=3, help='attempts per URL')
+    parser.add_argument('--window', type=int, default=1000, help='window of each()')
+    parser.add_argument('--one-urls', type=int, default=200, help='maximum number of URLs run through one()')
+    parser.add_argument('--disk', action='store_true', help='write files instead of keeping bodies in memory')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the errors drawn by the server')
+    parser.add_argument('--output', help='file the JSON lines are appended to (besides stdout)')
+    args = parser.parse_args()
+
+    output = open(args.output, 'a') if args.output else None
+
+    try:
+        with ServerProcess(seed=args.seed) as prefix:
+            for scenario_name in args.scenarios:
+                for count in args.urls:
+                    for api in args.apis:
+                        with multiprocessing.Pool(1) as pool:
+                            result = pool.apply(run, (api, scenario_name, count, prefix, args))
+                        line = json.dumps(result, sort_keys=True)
+                        print(line)
+                        if output:
+                            output.write(line + '\n')
+                            output.flush()
+    finally:
+        if output:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""Benchmark server
+
+A local aiohttp server for benchmarks.  ``/bytes/{size}`` responds with
+``size`` bytes of content, shaped by optional query parameters:
+
+* ``latency``: seconds to wait before responding
+* ``error_rate``: fraction of requests answered with a 503 instead
+* ``drip``: seconds to wait between chunks of the body (a slow drip response)
+* ``chunk``: size of the chunks of a slow drip response (defaults to 4096)
+
+Errors are drawn from a random generator seeded by the server so that a run
+can be reproduced.
+"""
+
+import asyncio
+import multiprocessing
+import random
+import socket
+import threading
+
+from aiohttp import web
+
+
+class BenchmarkServer:
+    """Local HTTP server bound to an ephemeral port on the loopback interface
+
+    :param host: (optional) address to bind to
+    :type host: str
+    :param seed: (optional) seed of the random generator drawing the errors
+    :type seed: int
+    """
+
+    def __init__(self, host='127.0.0.1', seed=0):
+        self.app = web.Application()
+        self.app.router.add_get('/bytes/{size}', self.handle_bytes)
+        self.host = host
+        self.port = None
+        self.random = random.Random(seed)
+        self._runner = None
+
+    async def handle_bytes(self, request):
+
+        size = int(request.match_info['size'])
+        latency = float(request.query.get('latency', 0))
+        error_rate = float(request.query.get('error_rate', 0))
+        drip = float(request.query.get('drip', 0))
+        chunk = int(request.query.get('chunk', 4096))
+
+        if latency:
+            await asyncio.sleep(latency)
+
+        if error_rate and self.random.random() < error_rate:
+            return web.Response(status=503)
+
+        if not drip:
+            return web.Response(body=b'x' * size)
+
+        response = web.StreamResponse(headers={'Content-Length': str(size)})
+        await response.prepare(request)
+        for start in range(0, size, chunk):
+            await response.write(b'x' * min(chunk, size - start))
+            await asyncio.sleep(drip)
+        await response.write_eof()
+
+        return response
+
+    async def start(self):
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind((self.host, 0))
+        self.port = sock.getsockname()[1]
+
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.SockSite(self._runner, sock, backlog=1024).start()
+
+    async def stop(self):
+
+        await self._runner.cleanup()
+
+    def url(self, path):
+        return 'http://{}:{}{}'.format(self.host, self.port, path)
+
+
+class ServerThread:
+    """Runs a :class:`BenchmarkServer` on its own event loop in a background
+    thread (use with ``with``), so the server doesn't compete with the client
+    for the event loop being measured.
+    """
+
+    def __init__(self, server=None):
+        self.server = server or BenchmarkServer()
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self.server.start(), self.loop).result()
+        return self.server
+
+    def __exit__(self, *exc_info):
+        asyncio.run_coroutine_threadsafe(self.server.stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+def _serve(host, seed, ports, stop):
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    server = BenchmarkServer(host, seed)
+    loop.run_until_complete(server.start())
+    ports.put(server.port)
+
+    loop.run_until_complete(loop.run_in_executor(None, stop.wait))
+    loop.run_until_complete(server.stop())
+    loop.close()
+
+
+class ServerProcess:
+    """Runs a :class:`BenchmarkServer` in a separate process (use with
+    ``with``), so the server doesn't compete with the client for the CPU or
+    the GIL either.  Entering returns the URL prefix of the server.
+
+    :param host: (optional) address to bind to
+    :type host: str
+    :param seed: (optional) seed of the random generator drawing the errors
+    :type seed: int
+    """
+
+    def __init__(self, host='127.0.0.1', seed=0):
+        self.host = host
+        self._ports = multiprocessing.Queue()
+        self._stop = multiprocessing.Event()
+        self._process = multiprocessing.Process(target=_serve, args=(host, seed, self._ports, self._stop), daemon=True)
+
+    def __enter__(self):
+        self._process.start()
+        return 'http://{}:{}'.format(self.host, self._ports.get(timeout=30))
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._process.join()
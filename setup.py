@@ -55,7 +55,6 @@ setup(
         'License :: OSI Approved :: MIT License',
         'Operating System :: OS Independent',
 
-        'Programming Language :: Python :: 3.5',
         'Programming Language :: Python :: 3.6',
 
         'Topic :: Internet :: WWW/HTTP :: Dynamic Content',
@@ -80,14 +79,16 @@ setup(
     # https://packaging.python.org/en/latest/requirements.html
     install_requires=['aiohttp', 'async_timeout'],
 
+    # aeach() is an asynchronous generator
+    python_requires='>=3.6',
+
     # List additional groups of dependencies here (e.g. development
     # dependencies). You can install these using the following syntax,
     # for example:
     # $ pip install -e .[dev,test]
-    # extras_require={
-    #     'dev': ['check-manifest'],
-    #     'test': ['coverage'],
-    # },
+    extras_require={
+        'uvloop': ['uvloop'],
+    },
 
     # If there are data files included in your packages that need to be
     # installed, specify them here.  If using Python 2.6 or less, then these
@@ -1,4 +1,5 @@
 from aiohttp import web
+from aiohttp.test_utils import TestServer
 import pytest
 
 from aiodownload import AioDownloadBundle, BackOff, DownloadStrategy, Lenient, RequestStrategy
@@ -39,3 +40,30 @@ def response_ok():
 @pytest.fixture
 def response_not_found():
     return web.Response(**{'status': 404})
+
+
+class LocalServer:
+    """Local aiohttp server run on the current event loop for the duration
+    of an ``async with`` block.  ``routes`` maps a path to a request handler.
+    """
+
+    def __init__(self, routes):
+        self.app = web.Application()
+        for path, handler in routes.items():
+            self.app.router.add_route('*', path, handler)
+        self.server = TestServer(self.app)
+
+    async def __aenter__(self):
+        await self.server.start_server()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.server.close()
+
+    def url(self, path):
+        return str(self.server.make_url(path))
+
+
+@pytest.fixture
+def local_server():
+    return LocalServer
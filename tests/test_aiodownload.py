@@ -1,5 +1,25 @@
-from aiohttp import ClientSession
-from aiodownload.aiodownload import STATUS_INIT, AioDownload
+import asyncio
+import functools
+import gzip
+import hashlib
+import json
+import os
+import pickle
+
+from aiohttp import ClientSession, web
+import pytest
+
+from aiodownload import (
+    Adaptive, AioDownloadBundle, ContentAddressedDownloadStrategy, DownloadStrategy, Lenient, MemoryDownloadStrategy,
+    RequestStrategy
+)
+from aiodownload.aiodownload import STATUS_CACHE, STATUS_DONE, STATUS_FAIL, STATUS_INIT, AioDownload, Status
+from aiodownload.breaker import CircuitBreaker
+from aiodownload.metrics import MetricsRegistry
+from aiodownload.processor import HashProcessor, LineCounter
+from aiodownload.ratelimit import RateLimiter
+from aiodownload.store import CompletionIndex
+from aiodownload.util import get_netloc
 
 
 def test_aiodownloadbundle(bundle):
@@ -10,13 +30,51 @@ def test_aiodownloadbundle(bundle):
         'status': STATUS_INIT
     })
     assert bundle.status_msg == default_status_msg
+    assert str(bundle) == default_status_msg
+
+
+def test_aiodownloadbundle_compact(bundle):
+
+    assert not hasattr(bundle, '__dict__')
+    with pytest.raises(AttributeError):
+        bundle.unknown = True
+
+    bundle._status_msg = STATUS_DONE
+    assert bundle.status == Status.DONE == 3
+    assert str(bundle.status) == 'File written'
+    assert pickle.loads(pickle.dumps(bundle)).status_msg == bundle.status_msg
+
+
+@pytest.mark.asyncio
+async def test_aiodownload_init_client():
 
+    async with ClientSession() as client:
+        download = AioDownload(client=client)
 
-def test_aiodownload_init_client():
+        assert download.client is client
+        assert download.loop is asyncio.get_event_loop()
 
-    download = AioDownload(client=ClientSession())
 
-    assert isinstance(download.client, ClientSession)
+def test_aiodownload_init_loop_factory():
+
+    loops = []
+
+    def loop_factory():
+        loops.append(asyncio.new_event_loop())
+        return loops[-1]
+
+    download = AioDownload(loop_factory=loop_factory)
+    assert download.loop is loops[0]
+    assert download._client is None  # created on first use, on the loop
+
+    assert isinstance(download.loop.run_until_complete(asyncio.sleep(0, download.client)), ClientSession)
+    download.loop.run_until_complete(download.close())
+    download.loop.close()
+
+    loop = asyncio.new_event_loop()
+    assert AioDownload(loop=loop, loop_factory=loop_factory).loop is loop
+    assert len(loops) == 1
+    loop.close()
 
 
 def test_aiodownload_init_strategy(download_strategy, request_strategy):
@@ -32,6 +90,760 @@ def test_aiodownload_init_strategy(download_strategy, request_strategy):
     assert download._request_strategy.timeout == request_strategy.timeout
 
 
+class RetryOnce(RequestStrategy):
+
+    def __init__(self):
+        super().__init__(concurrent=1, max_attempts=2)
+
+    def retry(self, response):
+        return True
+
+    def get_sleep_time(self, bundle):
+        return 0 if bundle.attempts == 0 else 0.3
+
+
+@pytest.mark.asyncio
+async def test_aiodownload_retry_releases_slot(download_strategy, local_server):
+
+    hits = []
+
+    async def flaky(request):
+        hits.append('flaky')
+        return web.Response(status=500 if hits.count('flaky') == 1 else 200, body=b'flaky')
+
+    async def ok(request):
+        hits.append('ok')
+        return web.Response(body=b'ok')
+
+    async with local_server({'/flaky': flaky, '/ok': ok}) as server:
+
+        download = AioDownload(download_strategy=download_strategy, request_strategy=RetryOnce())
+
+        finished = []
+
+        async def run(url):
+            bundle = await download.main(AioDownloadBundle(url))
+            finished.append(bundle)
+
+        urls = [server.url('/flaky'), server.url('/ok')]
+        await asyncio.gather(*[run(url) for url in urls])
+        await download.client.close()
+
+    # The second bundle uses the only slot while the first one backs off
+    assert hits == ['flaky', 'ok', 'flaky']
+    assert [b.url for b in finished] == [urls[1], urls[0]]
+    assert all(b._status_msg == STATUS_DONE for b in finished)
+    assert finished[1].attempts == 2
+
+
+class RecordingAdaptive(Adaptive):
+
+    def __init__(self):
+        super().__init__(concurrent=4, max_attempts=2)
+        self.attempts = []
+
+    def on_attempt(self, host, status, latency):
+        self.attempts.append((host, status, latency))
+        super().on_attempt(host, status, latency)
+
+    def get_sleep_time(self, bundle):
+        return 0
+
+
+@pytest.mark.asyncio
+async def test_aiodownload_adaptive_feedback(download_strategy, local_server):
+
+    hits = []
+
+    async def overloaded(request):
+        hits.append(request.path)
+        return web.Response(status=503 if len(hits) == 1 else 200, body=b'ok')
+
+    async with local_server({'/overloaded': overloaded}) as server:
+
+        request_strategy = RecordingAdaptive()
+        download = AioDownload(download_strategy=download_strategy, request_strategy=request_strategy)
+        bundle = await download.main(AioDownloadBundle(server.url('/overloaded')))
+        await download.close()
+
+        host = get_netloc(server.url('/'))
+
+    assert bundle.status == Status.DONE
+    assert [(h, status) for h, status, _ in request_strategy.attempts] == [(host, 503), (host, 200)]
+    assert all(latency >= 0 for _, _, latency in request_strategy.attempts)
+    assert request_strategy.concurrent == 2
+
+
+@pytest.mark.asyncio
+async def test_aiodownload_cancel_gives_no_feedback(download_strategy, local_server):
+
+    started = asyncio.Event()
+
+    async def hang(request):
+        started.set()
+        await asyncio.sleep(10)
+        return web.Response(body=b'late')
+
+    async with local_server({'/hang': hang}) as server:
+
+        breaker = CircuitBreaker(failures=1)
+        request_strategy = Adaptive(concurrent=8, circuit_breaker=breaker)
+        download = AioDownload(download_strategy=download_strategy, request_strategy=request_strategy)
+        task = asyncio.ensure_future(download.main(AioDownloadBundle(server.url('/hang'))))
+        await started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await download.close()
+
+        host = get_netloc(server.url('/'))
+
+    assert request_strategy.concurrent == 8
+    assert breaker.get_state(host) == 'closed'
+
+
+@pytest.mark.asyncio
+async def test_aiodownload_rate_limit_under_slot_contention(download_strategy, local_server):
+
+    started = []
+
+    async def slow_start(request):
+        started.append(asyncio.get_event_loop().time())
+        await asyncio.sleep(0.1 if len(started) <= 6 else 0)  # slow for the first requests
+        return web.Response(body=b'ok')
+
+    async with local_server({'/data': slow_start}) as server:
+
+        download = AioDownload(
+            download_strategy=download_strategy,
+            request_strategy=RequestStrategy(concurrent=1, rate_limiter=RateLimiter(rate_per_host=20))
+        )
+        bundles = await asyncio.gather(*[
+            download.main(AioDownloadBundle(server.url('/data?{}'.format(i)))) for i in range(0, 16)
+        ])
+        await download.close()
+
+    gaps = [b - a for a, b in zip(started, started[1:])]
+
+    assert [b.status for b in bundles] == [Status.DONE] * 16
+    assert min(gaps) >= 0.04  # no burst of requests paced while they were queued for the slot
+
+
+@pytest.mark.asyncio
+async def test_aiodownload_retry_after(download_strategy, local_server):
+
+    hits = []
+
+    async def busy(request):
+        hits.append(request.path)
+        if len(hits) == 1:
+            return web.Response(status=503, headers={'Retry-After': '0'})
+        return web.Response(body=b'ok')
+
+    async with local_server({'/busy': busy}) as server:
+
+        download = AioDownload(download_strategy=download_strategy, request_strategy=Lenient())
+        started = download.loop.time()
+        bundle = await download.main(AioDownloadBundle(server.url('/busy')))
+        await download.close()
+
+    assert bundle.status == Status.DONE
+    assert bundle.attempts == 2
+    assert download.loop.time() - started < 30  # instead of the 60 seconds of Lenient
+
+
+@pytest.mark.asyncio
+async def test_aiodownload_circuit_breaker(download_strategy, local_server):
+
+    hits = []
+
+    async def down(request):
+        hits.append(request.path)
+        return web.Response(status=500)
+
+    async with local_server({'/down': down}) as server:
+
+        request_strategy = RetryImmediately()
+        request_strategy.circuit_breaker = CircuitBreaker(failures=2, fast_fail=True)
+        download = AioDownload(download_strategy=download_strategy, request_strategy=request_strategy)
+        bundles = [await download.main(AioDownloadBundle(server.url('/down?{}'.format(i)))) for i in range(0, 3)]
+        await download.close()
+
+    assert [b.status for b in bundles] == [Status.FAIL] * 3
+    assert [b.attempts for b in bundles] == [1, 1, 0]  # the circuit opened after two failures
+    assert len(hits) == 2
+
+
+@pytest.mark.asyncio
+async def test_aiodownload_circuit_breaker_queued_bundles(download_strategy, local_server):
+
+    hits = []
+
+    async def down(request):
+        hits.append(request.path)
+        await asyncio.sleep(0.01)
+        return web.Response(status=503)
+
+    async with local_server({'/down': down}) as server:
+
+        request_strategy = RequestStrategy(concurrent=2, circuit_breaker=CircuitBreaker(failures=3, fast_fail=True))
+        download = AioDownload(download_strategy=download_strategy, request_strategy=request_strategy)
+        bundles = await asyncio.gather(*[
+            download.main(AioDownloadBundle(server.url('/down?{}'.format(i)))) for i in range(0, 20)
+        ])
+        await download.close()
+
+    assert [b.status for b in bundles] == [Status.FAIL] * 20
+    assert len(hits) <= 4  # the failures opening the circuit and the requests in flight meanwhile
+
+
+@pytest.mark.asyncio
+async def test_aiodownload_circuit_polling_takes_no_tokens(download_strategy, local_server):
+
+    async def slow(request):
+        await asyncio.sleep(2)  # the probe hangs
+        return web.Response(status=503)
+
+    async def ok(request):
+        return web.Response(body=b'ok')
+
+    breaker = CircuitBreaker(failures=1, reset_timeout=1, poll_interval=0.01)
+
+    async with local_server({'/slow': slow}) as broken, local_server({'/ok': ok}) as healthy:
+
+        download = AioDownload(download_strategy=download_strategy, request_strategy=RequestStrategy(
+            concurrent=30, rate_limiter=RateLimiter(rate=50), circuit_breaker=breaker
+        ))
+        breaker.record(get_netloc(broken.url('/slow')), False, now=download.loop.time() - 1)  # half-open
+
+        polling = [
+            asyncio.ensure_future(download.main(AioDownloadBundle(broken.url('/slow?{}'.format(i)))))
+            for i in range(0, 10)
+        ]
+        await asyncio.sleep(0.05)
+
+        started = download.loop.time()
+        bundles = await asyncio.gather(*[
+            download.main(AioDownloadBundle(healthy.url('/ok?{}'.format(i)))) for i in range(0, 10)
+        ])
+        elapsed = download.loop.time() - started
+
+        for task in polling:
+            task.cancel()
+        await asyncio.gather(*polling, return_exceptions=True)
+        await download.close()
+
+    assert [b.status for b in bundles] == [Status.DONE] * 10
+    assert elapsed < 0.3  # 10 tokens at 50 per second: the bundles polling the circuit don't spend any
+
+
+@pytest.mark.asyncio
+async def test_aiodownload_circuit_slow_probe(download_strategy, local_server):
+
+    hits = []
+
+    async def slow(request):
+        hits.append(request.path_qs)
+        await asyncio.sleep(1)  # longer than the reset timeout
+        return web.Response(status=503)
+
+    breaker = CircuitBreaker(failures=1, reset_timeout=0.05, poll_interval=0.01)
+
+    async with local_server({'/slow': slow}) as server:
+
+        download = AioDownload(
+            download_strategy=download_strategy,
+            request_strategy=RequestStrategy(concurrent=10, circuit_breaker=breaker)
+        )
+        host = get_netloc(server.url('/slow'))
+        breaker.record(host, False, now=download.loop.time() - 0.05)  # half-open
+
+        tasks = [
+            asyncio.ensure_future(download.main(AioDownloadBundle(server.url('/slow?{}'.format(i)))))
+            for i in range(0, 10)
+        ]
+        await asyncio.sleep(0.3)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        delay = breaker.get_delay(host, claim=False)
+        await download.close()
+
+    assert len(hits) == 1  # the probe is waited on
+    assert delay == 0  # and let go once cancelled
+
+
+BODY = bytes(range(0, 256)) * 400
+
+
+def ranged_handler(hits):
+    """Serve BODY honouring Range requests validated by If-Range.  The first
+    response is cut off halfway through the body.
+    """
+
+    async def handler(request):
+
+        hits.append(request.headers.get('Range'))
+
+        if 'Range' in request.headers and request.headers.get('If-Range') == '"v1"':
+            start = int(request.headers['Range'][len('bytes='):-1])
+            return web.Response(status=206, body=BODY[start:], headers={
+                'Content-Range': 'bytes {}-{}/{}'.format(start, len(BODY) - 1, len(BODY)),
+                'ETag': '"v1"'
+            })
+
+        response = web.StreamResponse(headers={'Content-Length': str(len(BODY)), 'ETag': '"v1"'})
+        await response.prepare(request)
+        if len(hits) == 1:
+            await response.write(BODY[:len(BODY) // 2])
+            await asyncio.sleep(0.1)  # let the client read the first half before the connection drops
+            request.transport.close()
+            return response
+        await response.write(BODY)
+        return response
+
+    return handler
+
+
+class RetryImmediately(RequestStrategy):
+
+    def __init__(self):
+        super().__init__(max_attempts=3)
+
+
+@pytest.mark.asyncio
+async def test_aiodownload_resume(tmpdir, local_server):
+
+    hits = []
+    download_strategy = DownloadStrategy(home=tmpdir.strpath, resume=True)
+
+    async with local_server({'/big': ranged_handler(hits)}) as server:
+
+        download = AioDownload(download_strategy=download_strategy, request_strategy=RetryImmediately())
+        bundle = await download.main(AioDownloadBundle(server.url('/big')))
+        await download.close()
+
+    assert bundle._status_msg == STATUS_DONE
+    assert bundle.attempts == 2
+    assert hits[0] is None
+    assert hits[1] == 'bytes={}-'.format(len(BODY) // 2)
+
+    with open(bundle.file_path, 'rb') as f:
+        assert f.read() == BODY
+    assert not os.path.exists(bundle.file_path + '.part')
+    assert not os.path.exists(bundle.file_path + '.part.json')
+
+
+@pytest.mark.asyncio
+async def test_aiodownload_resume_range_ignored(tmpdir, local_server):
+
+    async def handler(request):
+        return web.Response(body=BODY, headers={'ETag': '"v2"'})
+
+    download_strategy = DownloadStrategy(home=tmpdir.strpath, resume=True)
+
+    async with local_server({'/big': handler}) as server:
+
+        bundle = AioDownloadBundle(server.url('/big'))
+        bundle.file_path = download_strategy.get_file_path(bundle)
+        os.makedirs(os.path.dirname(bundle.file_path))
+        with open(bundle.file_path + '.part', 'wb') as f:
+            f.write(b'stale')
+        with open(bundle.file_path + '.part.json', 'w') as f:
+            json.dump({'etag': '"v1"', 'last_modified': None, 'length': len(BODY)}, f)
+
+        download = AioDownload(download_strategy=download_strategy, request_strategy=RetryImmediately())
+        bundle = await download.main(bundle)
+        await download.close()
+
+    assert bundle._status_msg == STATUS_DONE
+
+    with open(bundle.file_path, 'rb') as f:
+        assert f.read() == BODY
+
+
+@pytest.mark.parametrize('strategy_factory', [
+    DownloadStrategy, functools.partial(ContentAddressedDownloadStrategy, link=False)
+])
+@pytest.mark.asyncio
+async def test_aiodownload_revalidate(tmpdir, local_server, strategy_factory):
+
+    conditions = []
+
+    async def handler(request):
+        conditions.append(request.headers.get('If-None-Match'))
+        if request.headers.get('If-None-Match') == '"v1"':
+            return web.Response(status=304)
+        return web.Response(body=b'data', headers={'ETag': '"v1"'})
+
+    async with local_server({'/data': handler}) as server:
+
+        for _ in range(0, 2):
+            download_strategy = strategy_factory(home=tmpdir.strpath, revalidate=True, skip_cached=True)
+            download = AioDownload(download_strategy=download_strategy, request_strategy=RetryImmediately())
+            bundle = await download.main(AioDownloadBundle(server.url('/data')))
+            await download.close()
+
+    assert conditions == [None, '"v1"']
+    assert bundle._status_msg == STATUS_CACHE
+
+    with open(download_strategy.get_content_path(bundle), 'rb') as f:
+        assert f.read() == b'data'
+
+
+def segment_handler(ranges):
+    """Serve BODY with byte range support (recording the requested ranges)
+    """
+
+    async def handler(request):
+
+        ranges.append(request.headers.get('Range'))
+        headers = {'Accept-Ranges': 'bytes', 'ETag': '"v1"'}
+
+        if 'Range' in request.headers:
+            start, end = [int(i) for i in request.headers['Range'][len('bytes='):].split('-')]
+            headers['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, len(BODY))
+            return web.Response(status=206, body=BODY[start:end + 1], headers=headers)
+
+        return web.Response(body=BODY, headers=headers)
+
+    return handler
+
+
+@pytest.mark.parametrize('concurrent', [1, 4])
+@pytest.mark.asyncio
+async def test_aiodownload_segments(tmpdir, local_server, concurrent):
+
+    ranges = []
+    download_strategy = DownloadStrategy(home=tmpdir.strpath, segments=4, segment_threshold=1024)
+
+    async with local_server({'/big': segment_handler(ranges)}) as server:
+
+        download = AioDownload(
+            download_strategy=download_strategy,
+            request_strategy=RequestStrategy(concurrent=concurrent)
+        )
+        bundle = await download.main(AioDownloadBundle(server.url('/big')))
+        await download.close()
+
+    assert bundle._status_msg == STATUS_DONE
+    assert sorted(ranges[1:]) == ['bytes=25600-51199', 'bytes=51200-76799', 'bytes=76800-102399']
+    assert download._host_scheduler.running == 0
+
+    with open(bundle.file_path, 'rb') as f:
+        assert f.read() == BODY
+
+
+@pytest.mark.asyncio
+async def test_aiodownload_segments_failure_stops_helpers(tmpdir, local_server):
+
+    class Tracking(DownloadStrategy):
+
+        writing = 0
+
+        async def write_segment(self, response, bundle, start, end):
+            self.writing += 1
+            try:
+                await super().write_segment(response, bundle, start, end)
+            finally:
+                await asyncio.sleep(0.05)  # e.g. a flush on the io executor
+                self.writing -= 1
+
+        async def on_fail(self, bundle):
+            writing.append(self.writing)
+            await super().on_fail(bundle)
+
+    writing = []
+
+    async def handler(request):
+
+        headers = {'Accept-Ranges': 'bytes', 'ETag': '"v1"'}
+        if 'Range' not in request.headers:
+            return web.Response(body=BODY, headers=headers)
+
+        start, end = [int(i) for i in request.headers['Range'][len('bytes='):].split('-')]
+        if start == 25600:
+            return web.Response(body=BODY, headers=headers)  # not served as a range
+
+        response = web.StreamResponse(status=206, headers=dict(headers, **{
+            'Content-Range': 'bytes {}-{}/{}'.format(start, end, len(BODY)), 'Content-Length': str(end - start + 1)
+        }))
+        await response.prepare(request)
+        for i in range(start, end + 1, 1024):
+            await response.write(BODY[i:min(i + 1024, end + 1)])
+            await asyncio.sleep(0.01)
+        return response
+
+    download_strategy = Tracking(home=tmpdir.strpath, segments=4, segment_threshold=1024)
+
+    async with local_server({'/big': handler}) as server:
+
+        download = AioDownload(download_strategy=download_strategy, request_strategy=RequestStrategy(concurrent=4))
+        bundle = await download.main(AioDownloadBundle(server.url('/big')))
+        running = download._host_scheduler.running
+        await download.close()
+
+    assert bundle.status == Status.FAIL
+    assert writing == [0]  # no helper left writing into the file being discarded
+    assert running == 0
+
+
+@pytest.mark.asyncio
+async def test_aiodownload_segments_rate_limit_and_feedback(tmpdir, local_server):
+
+    ranges = []
+    started = []
+    attempts = []
+
+    class Recording(RequestStrategy):
+
+        def on_attempt(self, host, status, latency):
+            attempts.append(status)
+            super().on_attempt(host, status, latency)
+
+    handler = segment_handler(ranges)
+
+    async def timed(request):
+        started.append(asyncio.get_event_loop().time())
+        return await handler(request)
+
+    async with local_server({'/big': timed}) as server:
+
+        download = AioDownload(
+            download_strategy=DownloadStrategy(home=tmpdir.strpath, segments=4, segment_threshold=1024),
+            request_strategy=Recording(concurrent=4, rate_limiter=RateLimiter(rate_per_host=20))
+        )
+        bundle = await download.main(AioDownloadBundle(server.url('/big')))
+        await download.close()
+
+    gaps = [b - a for a, b in zip(started, started[1:])]
+
+    assert bundle.status == Status.DONE
+    assert min(gaps) >= 0.04  # the Range requests of the segments are paced too
+    assert sorted(attempts) == [200, 206, 206, 206]
+
+
+@pytest.mark.asyncio
+async def test_aiodownload_completion_index(tmpdir, local_server):
+
+    hits = []
+
+    async def handler(request):
+        hits.append(request.path)
+        return web.Response(body=b'data')
+
+    index_path = os.path.sep.join([tmpdir.strpath, 'completed.tsv'])
+
+    async with local_server({'/data': handler}) as server:
+
+        for _ in range(0, 2):
+            download_strategy = DownloadStrategy(
+                home=tmpdir.strpath, skip_cached=True, completion_index=CompletionIndex(index_path)
+            )
+            download = AioDownload(download_strategy=download_strategy, request_strategy=RetryImmediately())
+            bundle = await download.main(AioDownloadBundle(server.url('/data')))
+            await download.close()
+
+    assert hits == ['/data']
+    assert bundle._status_msg == STATUS_CACHE
+
+
+@pytest.mark.asyncio
+async def test_aiodownload_memory(tmpdir, local_server):
+
+    async def sized(request):
+        return web.Response(body=BODY)
+
+    async def chunked(request):
+        response = web.StreamResponse()
+        response.enable_chunked_encoding()
+        await response.prepare(request)
+        for i in range(0, len(BODY), 1000):
+            await response.write(BODY[i:i + 1000])
+        return response
+
+    async with local_server({'/sized': sized, '/chunked': chunked}) as server:
+
+        download = AioDownload(
+            download_strategy=MemoryDownloadStrategy(chunk_size=4096, max_size=len(BODY)),
+            request_strategy=RetryImmediately()
+        )
+        bundles = [await download.main(AioDownloadBundle(server.url(path))) for path in ('/sized', '/chunked')]
+
+        download._download_strategy.max_size = len(BODY) - 1
+        too_large = await download.main(AioDownloadBundle(server.url('/chunked')))
+
+        await download.close()
+
+    assert [b._status_msg for b in bundles] == [STATUS_DONE, STATUS_DONE]
+    assert [bytes(b.body) for b in bundles] == [BODY, BODY]
+    assert bundles[0].file_path is None
+    assert too_large._status_msg == STATUS_FAIL
+    assert too_large.body is None
+    assert os.listdir(tmpdir.strpath) == []
+
+
+
+@pytest.mark.asyncio
+async def test_aiodownload_processors(tmpdir, local_server):
+
+    hits = []
+    digest = hashlib.sha256(BODY).hexdigest()
+    download_strategy = DownloadStrategy(home=tmpdir.strpath, resume=True, processors=[
+        functools.partial(HashProcessor, expected=lambda bundle: digest), LineCounter
+    ])
+
+    async with local_server({'/big': ranged_handler(hits)}) as server:
+
+        download = AioDownload(download_strategy=download_strategy, request_strategy=RetryImmediately())
+        bundle = await download.main(AioDownloadBundle(server.url('/big')))
+
+        # A mismatch is retried like a broken transfer, then fails
+        download_strategy.processors = [functools.partial(HashProcessor, expected=lambda bundle: '00')]
+        mismatch = await download.main(AioDownloadBundle(server.url('/big?other')))
+        await download.close()
+
+    assert bundle._status_msg == STATUS_DONE
+    assert bundle.attempts == 2  # the resumed part was hashed too
+    assert bundle.results == {'sha256': digest, 'lines': BODY.count(b'\n')}
+    assert mismatch._status_msg == STATUS_FAIL
+    assert mismatch.attempts == 3
+
+
+@pytest.mark.asyncio
+async def test_aiodownload_store_encoded(tmpdir, local_server):
+
+    accepted = []
+
+    async def gzipped(request):
+        accepted.append(request.headers.get('Accept-Encoding'))
+        return web.Response(body=gzip.compress(BODY), headers={'Content-Encoding': 'gzip'})
+
+    async def zstd(request):
+        return web.Response(body=b'not really zstd', headers={'Content-Encoding': 'zstd'})
+
+    async def plain(request):
+        return web.Response(body=BODY)
+
+    async with local_server({'/gzipped': gzipped, '/zstd': zstd, '/plain': plain}) as server:
+
+        urls = [server.url(path) for path in ('/gzipped', '/zstd', '/plain')]
+
+        download = AioDownload(
+            download_strategy=DownloadStrategy(home=tmpdir.strpath, store_encoded=True, recompress=True),
+            request_strategy=RetryImmediately()
+        )
+        bundles = [await download.main(AioDownloadBundle(url)) for url in urls]
+        decompressing = download.client.auto_decompress  # the default session leaves the content as received
+        await download.close()
+
+        download = AioDownload(
+            download_strategy=DownloadStrategy(home=tmpdir.strpath, skip_cached=True, store_encoded=True),
+            request_strategy=RetryImmediately()
+        )
+        cached = [await download.main(AioDownloadBundle(url)) for url in urls]
+        await download.close()
+
+        # A given session decompressing responses
+        async with ClientSession() as client:
+            download = AioDownload(
+                client=client,
+                download_strategy=DownloadStrategy(
+                    home=os.path.sep.join([tmpdir.strpath, 'given']), store_encoded=True
+                ),
+                request_strategy=RetryImmediately()
+            )
+            given = await download.main(AioDownloadBundle(urls[0]))
+            await download.close(client=False)
+
+    assert accepted == ['zstd, br, gzip'] * 2
+    assert [b._status_msg for b in bundles] == [STATUS_DONE] * 3
+    assert [b.encoding for b in bundles] == ['gzip', 'zstd', 'gzip']
+    assert [os.path.basename(b.file_path) for b in bundles] == ['gzipped.gz', 'zstd.zst', 'plain.gz']
+
+    with open(bundles[0].file_path, 'rb') as f:
+        assert gzip.decompress(f.read()) == BODY
+    with open(bundles[1].file_path, 'rb') as f:
+        assert f.read() == b'not really zstd'
+    with open(bundles[2].file_path, 'rb') as f:
+        assert gzip.decompress(f.read()) == BODY
+
+    # Files stored encoded by the first run are found under their suffixed names
+    assert [b._status_msg for b in cached] == [STATUS_CACHE] * 3
+    assert [b.file_path for b in cached] == [b.file_path for b in bundles]
+
+    assert not decompressing
+
+    with open(given.file_path, 'rb') as f:
+        assert gzip.decompress(f.read()) == BODY
+
+
+@pytest.mark.asyncio
+async def test_aiodownload_trace(tmpdir, local_server):
+
+    async def handler(request):
+        return web.Response(body=BODY)
+
+    metrics = MetricsRegistry()
+
+    async with local_server({'/data': handler}) as server:
+
+        download = AioDownload(
+            download_strategy=DownloadStrategy(home=tmpdir.strpath),
+            request_strategy=RequestStrategy(concurrent=1),
+            metrics=metrics
+        )
+        bundles = [await download.main(AioDownloadBundle(server.url('/data?{}'.format(i)))) for i in range(0, 2)]
+        await download.close()
+
+    first, second = [b.timings[0] for b in bundles]
+
+    assert [len(b.timings) for b in bundles] == [1, 1]
+    assert [b.bytes_received for b in bundles] == [len(BODY)] * 2
+    assert (first.status, first.bytes, first.reused) == (200, len(BODY), False)
+    assert first.connect is not None and first.ttfb <= first.total
+    assert second.reused and second.connect is None
+    assert first.get_phases()['total'] == first.total
+    assert pickle.loads(pickle.dumps(bundles[0])).timings[0].get_phases() == first.get_phases()
+
+    assert metrics.get_counter('requests_total', status=200) == 2
+    assert metrics.get_counter('received_bytes_total') == 2 * len(BODY)
+    assert metrics.get_counter('downloads_total', status='done') == 2
+    assert metrics.get_histogram('slot_wait_seconds').count == 2
+    assert 'aiodownload_phase_seconds_count{phase="connect"} 1' in metrics.to_prometheus()
+
+
+@pytest.mark.asyncio
+async def test_aiodownload_coalesce(tmpdir, local_server):
+
+    requests = []
+
+    async def handler(request):
+        requests.append(request.path_qs)
+        await asyncio.sleep(0.05)
+        return web.Response(body=BODY)
+
+    metrics = MetricsRegistry()
+
+    async with local_server({'/data': handler}) as server:
+
+        download = AioDownload(download_strategy=DownloadStrategy(home=tmpdir.strpath), metrics=metrics)
+        urls = [server.url('/data'), server.url('/data'), server.url('/data?a=1')]
+        bundles = [AioDownloadBundle(url) for url in urls]
+        bundles[2].file_path = download._download_strategy.get_file_path(bundles[0])  # same file, other URL
+
+        bundles = await asyncio.gather(*[download.main(bundle) for bundle in bundles])
+        await download.close()
+
+    assert requests == ['/data']
+    assert [b.status for b in bundles] == [Status.DONE] * 3
+    assert [b.coalesced for b in bundles] == [False, True, True]
+    assert bundles[1].attempts == 0
+    assert download.duplicates == 2
+    assert metrics.get_counter('coalesced_total') == 2
+    assert download._in_flight == {}
+
 # Running the following test below raises the following error:
 
 # >               async with client_method(bundle.url) as response:
@@ -0,0 +1,303 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from aiohttp import ClientSession, web
+
+from aiodownload import (
+    AioDownloadBundle, DownloadStrategy, aeach, aone, aswarm, each, pool_each, pool_swarm, swarm
+)
+from aiodownload.aiodownload import Status
+from aiodownload.tracing import AttemptTiming
+
+
+class MockClient:
+
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+class MockDownload:
+    """Stand-in for AioDownload that "downloads" by sleeping for the number
+    of milliseconds found at the end of the URL
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.client = MockClient()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def plan_file_paths(self, bundles):
+        self.planned = list(bundles)
+        return DownloadStrategy().plan_file_paths(bundles)
+
+    async def close(self):
+        await self.client.close()
+
+    async def main(self, bundle):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(int(bundle.url.rsplit('/', 1)[-1]) / 1000)
+        finally:
+            self.in_flight -= 1
+        return bundle
+
+
+@pytest.fixture
+def download():
+    download = MockDownload()
+    yield download
+    download.loop.close()
+
+
+def test_each_completion_order(download):
+
+    urls = ['http://test.example.com/{}'.format(ms) for ms in (90, 10, 50)]
+
+    bundles = list(each(urls, download=download))
+
+    assert [b.url for b in bundles] == [urls[1], urls[2], urls[0]]
+    assert download.client.closed
+
+
+def test_each_ordered(download):
+
+    urls = ['http://test.example.com/{}'.format(ms) for ms in (90, 10, 50)]
+
+    bundles = list(each(urls, download=download, ordered=True))
+
+    assert [b.url for b in bundles] == urls
+
+
+def test_each_window_bounds_in_flight(download):
+
+    urls = ('http://test.example.com/{}'.format(i % 5) for i in range(0, 50))
+
+    bundles = list(each(urls, download=download, window=4))
+
+    assert len(bundles) == 50
+    assert download.max_in_flight == 4
+
+
+def test_each_pulls_lazily(download):
+
+    pulled = []
+
+    def source():
+        for i in range(0, 100):
+            pulled.append(i)
+            yield 'http://test.example.com/{}'.format(i % 3)
+
+    generator = each(source(), download=download, window=5)
+    bundle = next(generator)
+    generator.close()
+
+    assert isinstance(bundle, AioDownloadBundle)
+    assert len(pulled) <= 6
+    assert download.client.closed
+
+
+def test_each_plan(download):
+
+    urls = ['http://test.example.com/{}'.format(ms) for ms in (30, 10, 20)]
+
+    bundles = list(each(urls, download=download, plan=True))
+
+    assert [b.url for b in download.planned] == urls
+    assert all(b.file_path for b in bundles)
+
+
+def test_swarm_plan_collisions(download):
+
+    urls = ['http://test.example.com/1', 'http://test.example.com/1/2']
+
+    bundles = swarm(urls, download=download, plan=True)
+
+    assert len(set(b.file_path for b in bundles)) == 2
+    assert sorted(b.url for b in bundles) == urls
+
+
+def test_each_url_map_info(download):
+
+    bundles = list(each([1, 2], url_map=lambda x: 'http://test.example.com/{}'.format(x), download=download))
+
+    assert sorted(b.info for b in bundles) == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_aeach_async_iterable_backpressure(download):
+
+    pulled = []
+
+    async def source():
+        for ms in (90, 10, 20, 0, 0, 0):
+            pulled.append(ms)
+            yield 'http://test.example.com/{}'.format(ms)
+
+    bundles = []
+    async for bundle in aeach(source(), download=download, window=2):
+        bundles.append(bundle)
+        assert len(pulled) - len(bundles) <= 2
+
+    assert [b.url.rsplit('/', 1)[-1] for b in bundles[:2]] == ['10', '20']  # completion order
+    assert len(bundles) == 6
+    assert download.max_in_flight == 2
+    assert not download.client.closed  # left open for the caller
+
+
+@pytest.mark.asyncio
+async def test_aeach_ordered_early_exit(download):
+
+    urls = ['http://test.example.com/{}'.format(ms) for ms in (30, 10, 5000)]
+
+    bundles = aeach(urls, download=download, ordered=True)
+    first = await bundles.__anext__()
+    second = await bundles.__anext__()
+    started = asyncio.get_event_loop().time()
+    await bundles.aclose()  # cancels the last download instead of waiting for it
+
+    assert [first.url, second.url] == urls[:2]
+    assert asyncio.get_event_loop().time() - started < 1
+    assert download.in_flight == 0  # the cancelled download is over too
+
+
+@pytest.mark.asyncio
+async def test_aswarm_aone_client(tmpdir, local_server, monkeypatch):
+
+    monkeypatch.chdir(tmpdir.strpath)  # home of the default download strategy
+
+    async def handler(request):
+        return web.Response(body=b'data')
+
+    async with local_server({'/data': handler}) as server, ClientSession() as client:
+
+        table = await aswarm([server.url('/data?{}'.format(i)) for i in range(0, 3)], client=client, columnar=True)
+        bundle = await aone(server.url('/data'), client=client)
+
+        assert not client.closed
+
+    assert table.count(Status.DONE) == 3
+    assert bundle.status == Status.DONE
+
+
+class PidDownload(MockDownload):
+    """MockDownload recording the worker process in the bundle info"""
+
+    async def main(self, bundle):
+        bundle = await super().main(bundle)
+        bundle.info = os.getpid()
+        return bundle
+
+
+def test_pool_swarm_shards_by_host():
+
+    urls = ['http://host{}.example.com/{}'.format(i % 7, i % 3) for i in range(0, 60)]
+
+    bundles = pool_swarm(urls, download_factory=PidDownload, processes=3, window=4)
+
+    assert sorted(b.url for b in bundles) == sorted(urls)
+    assert os.getpid() not in set(b.info for b in bundles)
+    assert len(set(b.info for b in bundles)) <= 3
+
+    pids = {}
+    for b in bundles:
+        assert pids.setdefault(b.url.split('/')[2], b.info) == b.info
+
+
+class TracedDownload(MockDownload):
+    """MockDownload recording an attempt timing on the bundles, as
+    AioDownload does with trace=True
+    """
+
+    async def main(self, bundle):
+        timing = AttemptTiming(self.loop)
+        bundle = await super().main(bundle)
+        timing.response_started(200)
+        timing.finish(0)
+        bundle.timings = [timing]
+        return bundle
+
+
+def test_pool_swarm_trace():
+
+    urls = ['http://host{}.example.com/{}'.format(i % 3, i % 5) for i in range(0, 12)]
+
+    bundles = pool_swarm(urls, download_factory=TracedDownload, processes=2, window=4)
+
+    assert sorted(b.url for b in bundles) == sorted(urls)
+    assert all(b.timings[0].status == 200 and b.timings[0].total >= 0 for b in bundles)
+
+
+def test_pool_each_url_map_and_errors():
+
+    def source():
+        yield 1
+        yield 2
+        raise ValueError('broken source')
+
+    url_map = lambda x: 'http://test.example.com/{}'.format(x)  # noqa: E731
+    generator = pool_each(source(), url_map=url_map, download_factory=MockDownload, processes=2)
+
+    with pytest.raises(ValueError):
+        list(generator)
+
+
+class CrashDownload(MockDownload):
+    """MockDownload whose worker process dies in the middle of a download"""
+
+    async def main(self, bundle):
+        if bundle.url.endswith('/crash'):
+            os._exit(1)
+        return await super().main(bundle)
+
+
+def test_pool_each_dead_worker(monkeypatch):
+
+    monkeypatch.setattr('aiodownload.api.WORKER_POLL_INTERVAL', 0.05)
+
+    urls = ['http://host{}.example.com/1'.format(i) for i in range(0, 4)] + ['http://host0.example.com/crash']
+
+    with pytest.raises(BrokenProcessPool):
+        list(pool_each(urls, download_factory=CrashDownload, processes=2, context=multiprocessing.get_context('fork')))
+
+
+def test_each_loop_factory(monkeypatch):
+
+    loops = []
+
+    class LoopDownload(MockDownload):
+
+        def __init__(self, loop_factory=None):
+            super().__init__()
+            self.loop.close()
+            self.loop = loop_factory()
+            loops.append(self.loop)
+
+    monkeypatch.setattr('aiodownload.api.AioDownload', LoopDownload)
+
+    bundles = list(each(['http://test.example.com/1'], loop_factory=asyncio.new_event_loop))
+
+    assert [b.url for b in bundles] == ['http://test.example.com/1']
+    assert loops[0].is_closed()
+
+
+def test_swarm_columnar(download):
+
+    urls = ['http://test.example.com/{}'.format(ms) for ms in (20, 10)]
+
+    table = swarm(urls, download=download, columnar=True)
+
+    assert len(table) == 2
+    assert table.urls == [urls[1], urls[0]]
+    assert list(table.statuses) == [Status.INIT] * 2
+    assert table.count(Status.INIT) == 2
+    assert table[0] == (urls[1], None, Status.INIT, 0, 0)
+    assert [row.url for row in table] == table.urls
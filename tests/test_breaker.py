@@ -0,0 +1,81 @@
+import pytest
+
+from aiodownload import RequestStrategy
+from aiodownload.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+def test_circuit_breaker_opens_after_consecutive_failures():
+
+    breaker = CircuitBreaker(failures=3, reset_timeout=10)
+
+    breaker.record('a', False, now=0)
+    breaker.record('a', False, now=0)
+    breaker.record('a', True, now=0)  # the streak is broken
+    breaker.record('a', False, now=0)
+    breaker.record('a', False, now=0)
+
+    assert breaker.get_state('a', now=0) == CLOSED
+    assert breaker.get_delay('a', now=0) == 0
+
+    breaker.record('a', False, now=1)
+
+    assert breaker.get_state('a', now=1) == OPEN
+    assert breaker.get_delay('a', now=2) == 9
+    assert breaker.get_delay('b', now=2) == 0  # other hosts are unaffected
+
+
+def test_circuit_breaker_probe():
+
+    breaker = CircuitBreaker(failures=1, reset_timeout=10, poll_interval=0.5)
+
+    breaker.record('a', False, now=0)
+
+    assert breaker.get_state('a', now=10) == HALF_OPEN
+    assert breaker.get_delay('a', now=10) == 0  # the probe
+    assert breaker.get_delay('a', now=11) == 0.5  # waiting on the probe
+
+    breaker.record('a', False, now=12)  # failed probe
+
+    assert breaker.get_state('a', now=12) == OPEN
+    assert breaker.get_delay('a', now=12) == 10
+    assert breaker.get_delay('a', now=22) == 0  # the next probe
+    assert breaker.get_delay('a', now=90) == 0.5  # a slow probe is waited on
+
+    breaker.cancel('a', started=21)  # an older request
+
+    assert breaker.get_delay('a', now=91) == 0.5
+
+    breaker.cancel('a', started=22)  # the probe
+
+    assert breaker.get_delay('a', now=92) == 0
+
+    breaker.record('a', True, now=93)
+
+    assert breaker.get_state('a', now=93) == CLOSED
+    assert breaker.get_delay('a', now=93) == 0
+
+
+def test_circuit_breaker_fast_fail():
+
+    breaker = CircuitBreaker(failures=1, reset_timeout=10, fast_fail=True)
+
+    breaker.record('a', False, now=0)
+
+    assert breaker.get_delay('a', now=5) is None
+    assert breaker.get_delay('a', now=10) == 0
+    assert breaker.get_delay('a', now=11) is None
+
+
+@pytest.mark.asyncio
+async def test_request_strategy_circuit_breaker():
+
+    request_strategy = RequestStrategy(circuit_breaker=CircuitBreaker(failures=2, fast_fail=True))
+
+    request_strategy.on_attempt('a', 503, 0.1)
+    request_strategy.on_attempt('a', None, 60)
+    request_strategy.on_attempt('b', 404, 0.1)
+    request_strategy.on_attempt('b', 404, 0.1)
+
+    assert request_strategy.get_circuit_delay('a') is None
+    assert request_strategy.get_circuit_delay('b') == 0
+    assert RequestStrategy().get_circuit_delay('a') == 0
@@ -0,0 +1,109 @@
+import pytest
+
+from aiodownload import Adaptive
+from aiodownload.concurrency import AimdLimit
+
+
+def test_aimd_limit_additive_increase():
+
+    limit = AimdLimit(limit=2, max_limit=4)
+
+    for _ in range(0, 2):
+        limit.update(200, 0.1)
+    assert limit.limit == 2  # one round (two responses) adds almost one
+
+    for _ in range(0, 3):
+        limit.update(200, 0.1)
+    assert limit.limit == 3
+
+    for _ in range(0, 100):
+        limit.update(200, 0.1)
+    assert limit.limit == 4
+    assert limit.get_base_latency() == 0.1
+
+
+def test_aimd_limit_multiplicative_decrease():
+
+    limit = AimdLimit(limit=16, min_limit=2)
+
+    limit.update(503, 0.1)
+    assert limit.limit == 8
+
+    for _ in range(0, 7):
+        limit.update(None, 5.0)  # in flight under the former limit
+    assert limit.limit == 8
+
+    limit.update(None, 5.0)
+    assert limit.limit == 4
+
+    for _ in range(0, 20):
+        limit.update(429, 0.1)
+    assert limit.limit == 2
+
+
+def test_aimd_limit_latency_growth():
+
+    limit = AimdLimit(limit=10, latency_factor=3)
+
+    limit.update(200, 0.1)
+    limit.update(404, 0.2)  # healthy, if not found
+    assert limit.limit == 10
+
+    limit.update(200, 0.5)
+    assert limit.limit == 5
+    assert not AimdLimit(latency_factor=None).is_overload(200, 100)
+
+
+def test_aimd_limit_latency_per_host():
+
+    limit = AimdLimit(limit=8, latency_factor=3)
+
+    for _ in range(0, 50):
+        limit.update(200, 0.002, 'fast')
+        limit.update(200, 0.02, 'slow')  # healthy for its own pace
+
+    grown = limit.limit
+
+    assert grown > 8
+    assert (limit.get_base_latency('fast'), limit.get_base_latency('slow')) == (0.002, 0.02)
+
+    limit.update(200, 0.1, 'slow')
+
+    assert limit.limit == grown // 2
+
+
+def test_adaptive_global_limit():
+
+    strategy = Adaptive(concurrent=4, max_concurrent=8)
+
+    strategy.on_attempt('a', 503, 0.1)
+
+    assert strategy.concurrent == 2
+    assert strategy.get_host_concurrency('a') is None
+    assert strategy.get_limits() == {'concurrent': 2, 'hosts': {}}
+
+
+def test_adaptive_per_host_limit():
+
+    strategy = Adaptive(concurrent=4, max_concurrent=8, per_host=True, concurrent_per_host=3)
+
+    strategy.on_attempt('a', None, 60)
+    for _ in range(0, 4):
+        strategy.on_attempt('b', 200, 0.1)
+
+    assert strategy.concurrent == 8
+    assert strategy.get_limits() == {'concurrent': 8, 'hosts': {'a': 2, 'b': 4}}
+    assert strategy.get_host_concurrency('a') == 2
+    assert strategy.get_host_concurrency('b') == 3  # capped by concurrent_per_host
+
+
+@pytest.mark.parametrize('status, retry', [(404, False), (429, True), (503, True)])
+def test_adaptive_retry(status, retry):
+
+    class Response:
+        pass
+
+    response = Response()
+    response.status = status
+
+    assert Adaptive().retry(response) is retry
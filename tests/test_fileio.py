@@ -0,0 +1,99 @@
+import errno
+import os
+
+import pytest
+
+from aiodownload.fileio import AsyncFile, hardlink, touch
+
+
+@pytest.mark.asyncio
+async def test_async_file_write(tmpdir):
+
+    file_path = os.path.sep.join([tmpdir.strpath, 'data'])
+
+    async with AsyncFile(file_path, max_buffer=8) as f:
+        for i in range(0, 100):
+            await f.write('{:03d}'.format(i).encode())
+        await f.write(b'')
+
+    with open(file_path, 'rb') as f:
+        assert f.read() == b''.join('{:03d}'.format(i).encode() for i in range(0, 100))
+
+
+@pytest.mark.asyncio
+async def test_async_file_seek(tmpdir):
+
+    file_path = os.path.sep.join([tmpdir.strpath, 'data'])
+
+    async with AsyncFile(file_path, 'wb+') as f:
+        await f.write(b'abcdef')
+        await f.seek(2)
+        await f.write(b'XY')
+
+    with open(file_path, 'rb') as f:
+        assert f.read() == b'abXYef'
+
+
+@pytest.mark.asyncio
+async def test_async_file_read(tmpdir):
+
+    file_path = os.path.sep.join([tmpdir.strpath, 'data'])
+
+    async with AsyncFile(file_path, 'wb+') as f:
+        await f.write(b'abcdef')
+        await f.seek(0)
+        assert await f.read(4) == b'abcd'
+        assert await f.read() == b'ef'
+        assert await f.read() == b''
+
+
+@pytest.mark.asyncio
+async def test_async_file_opener(tmpdir):
+
+    opened = []
+
+    def opener(file_path, mode):
+        opened.append((file_path, mode))
+        return open(file_path, mode)
+
+    file_path = os.path.sep.join([tmpdir.strpath, 'data'])
+
+    async with AsyncFile(file_path, 'ab', opener=opener) as f:
+        await f.write(b'data')
+
+    assert opened == [(file_path, 'ab')]
+
+
+def test_touch(tmpdir):
+
+    file_path = os.path.sep.join([tmpdir.strpath, 'empty'])
+
+    touch(file_path)
+
+    assert os.path.getsize(file_path) == 0
+
+
+def test_hardlink(tmpdir, monkeypatch):
+
+    source_path = os.path.sep.join([tmpdir.strpath, 'object'])
+    link_path = os.path.sep.join([tmpdir.strpath, 'file'])
+    with open(source_path, 'wb') as f:
+        f.write(b'data')
+    with open(link_path + '.link', 'wb') as f:
+        f.write(b'left by an interrupted run')
+
+    assert hardlink(source_path, link_path)
+    assert os.path.samefile(source_path, link_path)
+
+    def cross_device(source_path, link_path):
+        raise OSError(errno.EXDEV, 'Invalid cross-device link')
+
+    monkeypatch.setattr('os.link', cross_device)
+    os.remove(link_path)
+
+    assert not hardlink(source_path, link_path)  # copied instead
+    assert not os.path.samefile(source_path, link_path)
+    assert not os.path.exists(link_path + '.link')
+
+    with open(link_path, 'rb') as f:
+        assert f.read() == b'data'
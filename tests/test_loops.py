@@ -0,0 +1,25 @@
+import asyncio
+
+import pytest
+
+from aiodownload.loops import get_event_loop, get_loop_factory, uvloop_factory
+
+
+def test_get_loop_factory():
+
+    def factory():
+        return asyncio.new_event_loop()
+
+    assert get_loop_factory(None) is None
+    assert get_loop_factory(factory) is factory
+    assert get_loop_factory('asyncio') is asyncio.new_event_loop
+    assert get_loop_factory('uvloop') is uvloop_factory
+
+    with pytest.raises(ValueError):
+        get_loop_factory('twisted')
+
+
+@pytest.mark.asyncio
+async def test_get_event_loop_running():
+
+    assert get_event_loop() is asyncio.get_event_loop()
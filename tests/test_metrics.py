@@ -0,0 +1,40 @@
+from aiodownload.metrics import Histogram, MetricsRegistry
+
+
+def test_histogram():
+
+    histogram = Histogram(buckets=(1, 0.1))
+    for value in (0.05, 0.1, 0.5, 2):
+        histogram.observe(value)
+
+    assert histogram.buckets == (0.1, 1)
+    assert histogram.cumulative_counts() == [2, 3]
+    assert (histogram.count, histogram.sum) == (4, 2.65)
+
+
+def test_metrics_registry():
+
+    metrics = MetricsRegistry(buckets=(0.1, 1))
+
+    metrics.inc('requests_total', status=200)
+    metrics.inc('requests_total', 2, status=200)
+    metrics.inc('requests_total', status='say "hi"\n')
+    metrics.observe('phase_seconds', 0.5, phase='ttfb')
+
+    assert metrics.get_counter('requests_total', status=200) == 3
+    assert metrics.get_counter('requests_total', status=404) == 0
+    assert metrics.get_histogram('phase_seconds', phase='ttfb').count == 1
+    assert metrics.get_histogram('phase_seconds', phase='dns') is None
+
+    assert metrics.to_prometheus() == '\n'.join([
+        '# TYPE aiodownload_requests_total counter',
+        'aiodownload_requests_total{status="200"} 3',
+        'aiodownload_requests_total{status="say \\"hi\\"\\n"} 1',
+        '# TYPE aiodownload_phase_seconds histogram',
+        'aiodownload_phase_seconds_bucket{phase="ttfb",le="0.1"} 0',
+        'aiodownload_phase_seconds_bucket{phase="ttfb",le="1"} 1',
+        'aiodownload_phase_seconds_bucket{phase="ttfb",le="+Inf"} 1',
+        'aiodownload_phase_seconds_sum{phase="ttfb"} 0.5',
+        'aiodownload_phase_seconds_count{phase="ttfb"} 1',
+        ''
+    ])
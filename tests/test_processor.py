@@ -0,0 +1,53 @@
+import hashlib
+
+import pytest
+
+from aiodownload import AioDownloadBundle
+from aiodownload.processor import ChecksumError, HashProcessor, LineCounter, LineProcessor
+
+
+def feed(processor, chunks, bundle):
+
+    processor.start(bundle)
+    for chunk in chunks:
+        processor.update(chunk)
+
+    return processor.finalize(bundle)
+
+
+def test_hash_processor(bundle):
+
+    digest = hashlib.md5(b'all-the-data').hexdigest()
+
+    assert feed(HashProcessor('md5'), [b'all-', b'the-', b'data'], bundle) == digest
+    assert feed(HashProcessor('md5', expected=lambda b: digest.upper()), [b'all-the-data'], bundle) == digest
+
+    with pytest.raises(ChecksumError):
+        feed(HashProcessor('md5', expected=lambda b: '00'), [b'all-the-data'], bundle)
+
+
+def test_line_counter(bundle):
+
+    assert LineCounter().name == 'lines'
+    assert feed(LineCounter(), [b'a\nb', b'\nc\n', b''], bundle) == 3
+
+
+def test_line_processor():
+
+    bundle = AioDownloadBundle('https://test.example.com/lines')
+    lines = []
+
+    processor = LineProcessor(lambda b, line: lines.append((b.url, line)), name='rows')
+
+    assert processor.name == 'rows'
+    assert feed(processor, [b'one\ntw', b'o\n', b'thr', b'ee'], bundle) == 3
+    assert lines == [(bundle.url, b'one'), (bundle.url, b'two'), (bundle.url, b'three')]
+
+
+def test_line_processor_long_line(bundle):
+
+    lines = []
+    chunks = [b'x' * 1024] * 8192 + [b'\nshort\n', b'y' * 1024] + [b'y' * 1024] * 1023
+
+    assert feed(LineProcessor(lambda b, line: lines.append(line)), chunks, bundle) == 3
+    assert [len(line) for line in lines] == [8 * 1024 * 1024, 5, 1024 * 1024]
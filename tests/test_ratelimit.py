@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from aiodownload import RequestStrategy
+from aiodownload.ratelimit import RateLimiter, TokenBucket
+
+
+def test_token_bucket_reserve():
+
+    bucket = TokenBucket(rate=2, burst=2)
+
+    assert bucket.reserve(0) == 0
+    assert bucket.reserve(0) == 0
+    assert bucket.reserve(0) == 0.5
+    assert bucket.reserve(0) == 1.0
+
+
+def test_token_bucket_refill_capped_at_burst():
+
+    bucket = TokenBucket(rate=10, burst=1)
+
+    assert bucket.reserve(0) == 0
+    assert bucket.reserve(100) == 0  # idle time does not accumulate past the burst
+    assert bucket.reserve(100) == pytest.approx(0.1)
+
+
+def test_rate_limiter_host_buckets():
+
+    rate_limiter = RateLimiter(rate_per_host=1)
+
+    assert rate_limiter.reserve('a', now=0) == 0
+    assert rate_limiter.reserve('b', now=0) == 0
+    assert rate_limiter.reserve('a', now=0) == 1
+
+
+def test_rate_limiter_global_bucket():
+
+    rate_limiter = RateLimiter(rate=4, rate_per_host=1)
+
+    assert rate_limiter.reserve('a', now=0) == 0
+    assert rate_limiter.reserve('b', now=0) == 0.25
+    assert rate_limiter.reserve('a', now=0) == 1
+
+
+def test_rate_limiter_get_delay():
+
+    rate_limiter = RateLimiter(rate=4, rate_per_host=1)
+
+    assert rate_limiter.get_delay('a', now=0) == 0
+    assert rate_limiter.get_delay('a', now=0) == 0  # nothing is taken
+    assert rate_limiter.reserve('a', now=0) == 0
+    assert rate_limiter.get_delay('b', now=0) == 0.25
+    assert rate_limiter.get_delay('b', now=0.25) == 0
+    assert rate_limiter.get_delay('a', now=0.5) == 0.5
+
+
+def test_rate_limiter_unlimited():
+
+    rate_limiter = RateLimiter()
+
+    assert rate_limiter.get_host_bucket('a') is None
+    assert rate_limiter.reserve('a', now=0) == 0
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_acquire():
+
+    rate_limiter = RateLimiter(rate=20)
+    loop = asyncio.get_event_loop()
+
+    start = loop.time()
+    for _ in range(0, 3):
+        await rate_limiter.acquire('a')
+
+    assert loop.time() - start >= 0.09
+
+
+@pytest.mark.asyncio
+async def test_request_strategy_get_rate_delay():
+
+    assert RequestStrategy().get_rate_delay('a') == 0
+
+    request_strategy = RequestStrategy(rate_limiter=RateLimiter(rate_per_host=1))
+
+    assert request_strategy.get_rate_delay('a') == 0
+    assert request_strategy.reserve_rate('a') == 0
+    assert request_strategy.get_rate_delay('a') > 0
+    assert RequestStrategy().reserve_rate('a') == 0
@@ -0,0 +1,203 @@
+import asyncio
+
+import pytest
+
+from aiodownload import AioDownloadBundle, RequestStrategy
+from aiodownload.ratelimit import RateLimiter
+from aiodownload.scheduler import HostScheduler, RetryScheduler
+
+
+@pytest.mark.asyncio
+async def test_retry_scheduler_wakes_in_order():
+
+    scheduler = RetryScheduler()
+    woken = []
+
+    async def wait(name, delay):
+        await scheduler.wait(AioDownloadBundle(name), delay)
+        woken.append(name)
+
+    tasks = [asyncio.ensure_future(wait(name, delay)) for name, delay in (('c', 0.15), ('a', 0.05), ('b', 0.1))]
+    await asyncio.sleep(0)
+
+    assert len(scheduler) == 3
+    assert [b.url for b in scheduler.waiting] == ['a', 'b', 'c']
+
+    await asyncio.gather(*tasks)
+
+    assert woken == ['a', 'b', 'c']
+    assert len(scheduler) == 0
+
+
+@pytest.mark.asyncio
+async def test_retry_scheduler_no_delay():
+
+    scheduler = RetryScheduler()
+
+    await scheduler.wait(AioDownloadBundle('a'), -1)
+
+    assert len(scheduler) == 0
+
+
+@pytest.mark.asyncio
+async def test_retry_scheduler_cancelled_waiter():
+
+    scheduler = RetryScheduler()
+
+    cancelled = asyncio.ensure_future(scheduler.wait(AioDownloadBundle('a'), 0.01))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+
+    await scheduler.wait(AioDownloadBundle('b'), 0.02)
+
+    assert cancelled.cancelled()
+    assert len(scheduler) == 0
+
+
+@pytest.mark.asyncio
+async def test_host_scheduler_caps():
+
+    scheduler = HostScheduler(RequestStrategy(concurrent=3, concurrent_per_host=2))
+
+    await scheduler.acquire('a')
+    await scheduler.acquire('a')
+    blocked = asyncio.ensure_future(scheduler.acquire('a'))
+    await scheduler.acquire('b')
+    await asyncio.sleep(0)
+
+    assert scheduler.running == 3
+    assert scheduler.active('a') == 2
+    assert scheduler.waiting == 1
+    assert not blocked.done()
+
+    scheduler.release('b')  # frees a global slot, but 'a' is still at its cap
+    await asyncio.sleep(0)
+
+    assert not blocked.done()
+
+    scheduler.release('a')
+    await blocked
+
+    assert scheduler.active('a') == 2
+    assert scheduler.waiting == 0
+
+
+@pytest.mark.asyncio
+async def test_host_scheduler_round_robin():
+
+    scheduler = HostScheduler(RequestStrategy(concurrent=1))
+    order = []
+
+    async def run(host):
+        await scheduler.acquire(host)
+        order.append(host)
+        await asyncio.sleep(0)
+        scheduler.release(host)
+
+    await scheduler.acquire('x')
+    tasks = [asyncio.ensure_future(run(host)) for host in ('a', 'a', 'a', 'b', 'c')]
+    await asyncio.sleep(0)
+    scheduler.release('x')
+    await asyncio.gather(*tasks)
+
+    assert order == ['a', 'b', 'c', 'a', 'a']
+    assert scheduler.running == 0
+
+
+@pytest.mark.asyncio
+async def test_host_scheduler_cancelled_waiter():
+
+    scheduler = HostScheduler(RequestStrategy(concurrent=1))
+
+    await scheduler.acquire('a')
+    cancelled = asyncio.ensure_future(scheduler.acquire('a'))
+    waiting = asyncio.ensure_future(scheduler.acquire('b'))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    await asyncio.sleep(0)
+    scheduler.release('a')
+    await waiting
+
+    assert cancelled.cancelled()
+    assert scheduler.running == 1
+    assert scheduler.active('b') == 1
+
+
+@pytest.mark.asyncio
+async def test_host_scheduler_priority():
+
+    scheduler = HostScheduler(RequestStrategy(concurrent=1))
+    order = []
+
+    async def run(name, host, priority=0, deadline=None):
+        await scheduler.acquire(host, priority, deadline)
+        order.append(name)
+        await asyncio.sleep(0)
+        scheduler.release(host)
+
+    await scheduler.acquire('x')
+    tasks = [
+        asyncio.ensure_future(run(*args)) for args in (
+            ('bulk-a', 'a'), ('bulk-b', 'b'), ('late', 'b', 0, 10.0), ('soon', 'c', 0, 5.0), ('urgent', 'a', 10)
+        )
+    ]
+    await asyncio.sleep(0)
+    scheduler.release('x')
+    await asyncio.gather(*tasks)
+
+    assert order == ['urgent', 'soon', 'late', 'bulk-a', 'bulk-b']
+    assert scheduler.running == 0 and scheduler.waiting == 0
+
+
+@pytest.mark.asyncio
+async def test_host_scheduler_priority_host_cap():
+
+    scheduler = HostScheduler(RequestStrategy(concurrent=2, concurrent_per_host=1))
+
+    await scheduler.acquire('a')
+    await scheduler.acquire('b')
+    urgent = asyncio.ensure_future(scheduler.acquire('a', priority=10))  # 'a' is at its cap
+    bulk = asyncio.ensure_future(scheduler.acquire('b'))
+    await asyncio.sleep(0)
+
+    scheduler.release('b')
+    await bulk
+
+    assert not urgent.done()  # the freed slot goes to the host with room
+
+    scheduler.release('a')
+    await urgent
+
+    assert scheduler.waiting == 0
+
+
+@pytest.mark.asyncio
+async def test_host_scheduler_rate_limits():
+
+    checks = []
+
+    class Counting(RequestStrategy):
+
+        def get_rate_delay(self, host):
+            checks.append(host)
+            return super().get_rate_delay(host)
+
+    scheduler = HostScheduler(Counting(concurrent=8, rate_limiter=RateLimiter(rate=200)))
+    order = []
+
+    async def run(name, host, priority=0):
+        await scheduler.acquire(host, priority)
+        order.append((name, asyncio.get_event_loop().time()))
+        scheduler.release(host)
+
+    tasks = [asyncio.ensure_future(run('bulk', 'ab'[i % 2])) for i in range(0, 20)]
+    await asyncio.sleep(0)
+    tasks += [asyncio.ensure_future(run('urgent', 'ab'[i % 2], 10)) for i in range(0, 3)]
+    await asyncio.gather(*tasks)
+
+    gaps = [b[1] - a[1] for a, b in zip(order, order[1:])]
+
+    assert [name for name, _ in order[:5]] == ['bulk'] + ['urgent'] * 3 + ['bulk']
+    assert min(gaps) >= 0.004  # one waiter per token
+    assert len(checks) <= 3 * len(order)  # a check per token and host: waiters are woken, they don't poll
+    assert scheduler.running == 0 and scheduler.waiting == 0
@@ -0,0 +1,141 @@
+import os
+from concurrent.futures import Future
+
+from aiohttp import web
+
+from aiodownload.store import CompletionIndex, ManifestStore, ValidatorStore
+
+
+def test_manifest_store_persists(tmpdir):
+
+    file_path = os.path.sep.join([tmpdir.strpath, 'manifest', 'store.jsonl'])
+
+    store = ManifestStore(file_path)
+    store.set('a', {'n': 1})
+    store.set('b', {'n': 2})
+    store.set('a', {'n': 3})
+    store.delete('b')
+    store.delete('missing')
+    store.close()
+
+    reloaded = ManifestStore(file_path)
+
+    assert len(reloaded) == 1
+    assert reloaded.get('a') == {'n': 3}
+    assert 'b' not in reloaded
+
+
+class DeferredExecutor:
+    """Executor running the submitted calls when told to"""
+
+    def __init__(self):
+        self.calls = []
+
+    def submit(self, fn):
+        future = Future()
+        self.calls.append((fn, future))
+        return future
+
+    def run(self):
+        calls, self.calls = self.calls, []
+        for fn, future in calls:
+            future.set_result(fn())
+
+
+def test_manifest_store_writes_behind(tmpdir):
+
+    file_path = os.path.sep.join([tmpdir.strpath, 'store.jsonl'])
+    executor = DeferredExecutor()
+
+    store = ManifestStore(file_path)
+    store.executor = executor
+    store.set('a', {'n': 1})
+    store.set('b', {'n': 2})
+
+    assert store.get('a') == {'n': 1}
+    assert not os.path.exists(file_path)  # nothing written by the caller
+    assert len(executor.calls) == 1  # one writer for the queued lines
+
+    executor.run()
+    store.delete('a')
+    executor.run()
+    store.close()
+
+    reloaded = ManifestStore(file_path)
+
+    assert len(reloaded) == 1
+    assert reloaded.get('b') == {'n': 2}
+
+
+def test_manifest_store_skips_truncated_line(tmpdir):
+
+    file_path = os.path.sep.join([tmpdir.strpath, 'store.jsonl'])
+    with open(file_path, 'w') as f:
+        f.write('["a", {"n": 1}]\n["b", {"n"')
+
+    store = ManifestStore(file_path)
+
+    assert store.get('a') == {'n': 1}
+    assert store.get('b') is None
+
+
+def test_manifest_store_compact(tmpdir):
+
+    file_path = os.path.sep.join([tmpdir.strpath, 'store.jsonl'])
+
+    store = ManifestStore(file_path)
+    for i in range(0, 10):
+        store.set('a', {'n': i})
+    store.compact()
+
+    with open(file_path) as f:
+        assert f.readlines() == ['["a", {"n": 9}]\n']
+
+
+def test_validator_store(tmpdir):
+
+    store = ValidatorStore(os.path.sep.join([tmpdir.strpath, 'validators.jsonl']))
+
+    store.set_validators('a', web.Response(headers={'ETag': '"v1"'}), 10)
+
+    assert store.get_validators('a') == {'content_length': 10, 'etag': '"v1"', 'last_modified': None}
+
+    store.set_validators('a', web.Response(), 10)
+
+    assert store.get_validators('a') is None
+
+    store.close()
+
+
+def test_manifest_store_appends_after_truncated_line(tmpdir):
+
+    file_path = os.path.sep.join([tmpdir.strpath, 'store.jsonl'])
+    with open(file_path, 'w') as f:
+        f.write('["a", {"n": 1}]\n["b", {"n"')
+
+    store = ManifestStore(file_path)
+    store.set('c', {'n': 3})
+    store.close()
+
+    assert ManifestStore(file_path).get('c') == {'n': 3}
+
+
+def test_completion_index(tmpdir):
+
+    file_path = os.path.sep.join([tmpdir.strpath, 'completed.tsv'])
+
+    index = CompletionIndex(file_path)
+    index.mark_complete('host/a', 10)
+    index.mark_complete('host/b\twith tab', 20)
+    index.mark_complete('host/c', 30)
+    index.delete('host/c')
+    index.close()
+
+    with open(file_path) as f:
+        assert f.readline() == '10\thost/a\n'
+
+    reloaded = CompletionIndex(file_path)
+
+    assert reloaded.get_size('host/a') == 10
+    assert reloaded.get_size('host/b\twith tab') == 20
+    assert reloaded.get_size('host/c') is None
@@ -1,6 +1,16 @@
+import hashlib
+import json
 import os
 
+from aiohttp import ClientSession, web
 import pytest
+
+from aiodownload import (
+    AioDownloadBundle, ContentAddressedDownloadStrategy, DownloadStrategy, Lenient, RequestStrategy,
+    ShardedDownloadStrategy
+)
+from aiodownload.processor import LineCounter
+from aiodownload.store import CompletionIndex, ManifestStore
 # from unittest.mock import MagicMock
 
 
@@ -42,12 +52,245 @@ async def test_download_strategy_on_fail(bundle, download_strategy, tmpdir):
 #         assert len(f.read()) > 0
 
 
+@pytest.mark.asyncio
+async def test_download_strategy_on_success_local(bundle, download_strategy, local_server, tmpdir):
+
+    async def handler(request):
+        return web.Response(body=b'all-the-data' * 10000)
+
+    async with local_server({'/get-some-data': handler}) as server:
+        async with ClientSession() as client:
+            async with client.get(server.url('/get-some-data')) as response:
+                await download_strategy.on_success(response, bundle)
+
+    await download_strategy.close()
+
+    with open(os.path.sep.join([tmpdir.strpath, 'test.example.com', 'get-some-data']), 'rb') as f:
+        assert f.read() == b'all-the-data' * 10000
+
+
+@pytest.mark.asyncio
+async def test_download_strategy_is_cached(bundle, download_strategy):
+
+    assert await download_strategy.is_cached(bundle) is False
+
+    await download_strategy.on_fail(bundle)
+
+    assert await download_strategy.is_cached(bundle) is False
+
+    download_strategy.skip_cached = True
+
+    assert await download_strategy.is_cached(bundle) is True
+
+
+@pytest.mark.asyncio
+async def test_download_strategy_get_request_headers(bundle, tmpdir):
+
+    download_strategy = DownloadStrategy(home=tmpdir.strpath, resume=True)
+    part_path = download_strategy.get_part_path(bundle)
+
+    assert await download_strategy.get_request_headers(bundle) == {}
+
+    os.makedirs(os.path.dirname(part_path))
+    with open(part_path, 'wb') as f:
+        f.write(b'0123456789')
+    with open(part_path + '.json', 'w') as f:
+        json.dump({'etag': None, 'last_modified': 'Wed, 21 Oct 2015 07:28:00 GMT', 'length': 20}, f)
+
+    assert await download_strategy.get_request_headers(bundle) == {
+        'If-Range': 'Wed, 21 Oct 2015 07:28:00 GMT',
+        'Range': 'bytes=10-'
+    }
+
+    await download_strategy.close()
+
+
+def test_download_strategy_get_segments(tmpdir):
+
+    download_strategy = DownloadStrategy(home=tmpdir.strpath, segments=3, segment_threshold=10)
+    headers = {'Accept-Ranges': 'bytes', 'Content-Length': '10'}
+
+    assert download_strategy.get_segments(web.Response(headers=headers)) == [(0, 3), (4, 7), (8, 9)]
+    assert download_strategy.get_segments(web.Response(headers=dict(headers, **{'Content-Length': '9'}))) is None
+    assert download_strategy.get_segments(web.Response(headers={'Content-Length': '10'})) is None
+    assert DownloadStrategy(home=tmpdir.strpath).get_segments(web.Response(headers=headers)) is None
+
+    download_strategy.processors = [LineCounter]
+    assert download_strategy.get_segments(web.Response(headers=headers)) is None
+
+
+@pytest.mark.asyncio
+async def test_download_strategy_is_cached_completion_index(bundle, tmpdir):
+
+    completion_index = CompletionIndex(os.path.sep.join([tmpdir.strpath, 'completed.tsv']))
+    download_strategy = DownloadStrategy(home=tmpdir.strpath, skip_cached=True, completion_index=completion_index)
+
+    await download_strategy.on_fail(bundle)
+
+    assert await download_strategy.is_cached(bundle) is False  # the failed (empty) file is not complete
+
+    completion_index.mark_complete(download_strategy.get_store_key(bundle), 4)
+
+    assert await download_strategy.is_cached(bundle) is True
+
+    completion_index.verify_size = True
+
+    assert await download_strategy.is_cached(bundle) is False
+
+    await download_strategy.close()
+
+
 def test_download_strategy_get_file_path(bundle, download_strategy, tmpdir):
     test_file_path = os.path.sep.join([tmpdir.strpath, 'test.example.com', 'get-some-data'])
 
     assert download_strategy.get_file_path(bundle) == test_file_path
 
 
+@pytest.mark.asyncio
+async def test_sharded_download_strategy_get_file_path(tmpdir):
+
+    download_strategy = ShardedDownloadStrategy(depth=3, width=1, home=tmpdir.strpath)
+    bundle = AioDownloadBundle('http://test.example.com/some/page.html?a=1')
+    digest = hashlib.sha1(bundle.url.encode('utf-8')).hexdigest()
+
+    assert download_strategy.get_file_path(bundle) == os.path.sep.join(
+        [tmpdir.strpath, digest[0], digest[1], digest[2], digest + '.html']
+    )
+
+
+@pytest.mark.asyncio
+async def test_sharded_download_strategy_url_index(tmpdir, local_server):
+
+    async def handler(request):
+        return web.Response(body=b'data')
+
+    download_strategy = ShardedDownloadStrategy(home=tmpdir.strpath)
+
+    async with local_server({'/data': handler}) as server:
+        bundle = AioDownloadBundle(server.url('/data'))
+        bundle.file_path = download_strategy.get_file_path(bundle)
+        async with ClientSession() as client:
+            async with client.get(bundle.url) as response:
+                await download_strategy.on_success(response, bundle)
+
+    await download_strategy.close()
+
+    url_index = ManifestStore(os.path.sep.join([tmpdir.strpath, '.aiodownload-urls.jsonl']))
+
+    assert os.path.sep.join([tmpdir.strpath, url_index.get(bundle.url)]) == bundle.file_path
+    assert os.path.isfile(bundle.file_path)
+
+
+@pytest.mark.asyncio
+async def test_content_addressed_download_strategy(tmpdir, local_server):
+
+    async def handler(request):
+        return web.Response(body=b'same-data')
+
+    download_strategy = ContentAddressedDownloadStrategy(home=tmpdir.strpath)
+    bundles = []
+
+    async with local_server({'/a': handler, '/b': handler}) as server:
+        async with ClientSession() as client:
+            for path in ('/a', '/b'):
+                bundle = AioDownloadBundle(server.url(path))
+                bundle.file_path = download_strategy.get_file_path(bundle)
+                async with client.get(bundle.url) as response:
+                    await download_strategy.on_success(response, bundle)
+                bundles.append(bundle)
+
+    digest = hashlib.sha256(b'same-data').hexdigest()
+    object_path = download_strategy.get_object_path(digest)
+
+    assert [b.digest for b in bundles] == [digest, digest]
+    assert os.listdir(os.path.dirname(object_path)) == [digest]
+    assert os.listdir(os.path.sep.join([download_strategy.objects, 'tmp'])) == []
+    assert all(os.path.samefile(b.file_path, object_path) for b in bundles)
+
+    await download_strategy.on_fail(bundles[0])
+
+    with open(object_path, 'rb') as f:
+        assert f.read() == b'same-data'  # the object survives the failure of a linked file
+
+    await download_strategy.close()
+
+    digest_index = ManifestStore(os.path.sep.join([tmpdir.strpath, '.aiodownload-digests.jsonl']))
+
+    assert digest_index.get(download_strategy.get_store_key(bundles[1])) == digest
+
+
+@pytest.mark.asyncio
+async def test_content_addressed_download_strategy_unlinked(tmpdir, local_server):
+
+    async def handler(request):
+        return web.Response(body=b'same-data')
+
+    def make_strategy():
+        return ContentAddressedDownloadStrategy(
+            home=tmpdir.strpath, link=False, skip_cached=True,
+            completion_index=CompletionIndex(os.path.sep.join([tmpdir.strpath, 'completed.tsv']), verify_size=True)
+        )
+
+    download_strategy = make_strategy()
+
+    async with local_server({'/a': handler}) as server:
+        async with ClientSession() as client:
+            bundle = AioDownloadBundle(server.url('/a'))
+            bundle.file_path = download_strategy.get_file_path(bundle)
+            async with client.get(bundle.url) as response:
+                await download_strategy.on_success(response, bundle)
+
+    await download_strategy.close()
+
+    key = download_strategy.get_store_key(bundle)
+
+    assert not os.path.exists(bundle.file_path)
+    assert download_strategy.completion_index.get_size(key) == len(b'same-data')
+
+    download_strategy = make_strategy()
+    cached = AioDownloadBundle(bundle.url)
+    cached.file_path = download_strategy.get_file_path(cached)
+
+    assert await download_strategy.is_cached(cached)
+
+    os.remove(download_strategy.get_object_path(bundle.digest))
+
+    assert not await download_strategy.is_cached(cached)
+
+    await download_strategy.close()
+
+
+@pytest.mark.asyncio
+async def test_download_strategy_make_dirs_memoized(download_strategy, tmpdir, monkeypatch):
+
+    made = []
+    monkeypatch.setattr('aiodownload.strategy.make_dirs', made.append)
+
+    for name in ('a', 'b'):
+        await download_strategy.make_dirs(os.path.sep.join([tmpdir.strpath, 'dir', name]))
+
+    assert made == [os.path.sep.join([tmpdir.strpath, 'dir', 'a'])]
+
+    await download_strategy.close()
+
+
+@pytest.mark.asyncio
+async def test_request_strategy_get_connector():
+
+    request_strategy = RequestStrategy(keepalive_timeout=30, limit_per_host=4, ttl_dns_cache=300)
+    connector = request_strategy.get_connector()
+
+    assert connector.limit == 0
+    assert connector.limit_per_host == 4
+
+    await connector.close()
+
+
+def test_request_strategy_get_host_concurrency(request_strategy):
+    assert request_strategy.get_host_concurrency('test.example.com') is None
+    assert RequestStrategy(concurrent_per_host=2).get_host_concurrency('test.example.com') == 2
+
+
 def test_request_strategy_retry(request_strategy, response_ok):
     assert request_strategy.retry(response_ok) is False
 
@@ -56,6 +299,12 @@ def test_request_strategy_get_sleep_time(request_strategy, bundle):
     assert request_strategy.get_sleep_time(bundle) == -1
 
 
+def test_lenient_init(lenient):
+    assert lenient.concurrent == 2
+    assert lenient.max_attempts == 5
+    assert Lenient(concurrent_per_host=1).concurrent_per_host == 1
+
+
 def test_lenient_assert_response_ok(lenient, response_ok):
     assert lenient.assert_response(response_ok) is None
 
@@ -73,6 +322,19 @@ def test_lenient_retry_not_found(lenient, response_not_found):
     assert lenient.retry(response_not_found) is False
 
 
+def test_get_sleep_time_retry_after(lenient, back_off, bundle):
+
+    bundle.attempts = 1
+    bundle.retry_after = 5
+
+    assert lenient.get_sleep_time(bundle) == 5
+    assert back_off.get_sleep_time(bundle) == 5
+
+    bundle.retry_after = 3600
+
+    assert lenient.get_sleep_time(bundle) == lenient.max_retry_after
+
+
 def test_lenient_get_sleep_time(lenient, bundle):
     assert lenient.get_sleep_time(bundle) == 0.25
 
@@ -87,3 +349,58 @@ def test_back_off_get_sleep_time(back_off, bundle):
     for i in range(0, len(expected_back_off_sequence)):
         assert back_off.get_sleep_time(bundle) == expected_back_off_sequence[i]
         bundle.attempts += 1
+
+
+def test_download_strategy_plan_file_paths(tmpdir):
+
+    download_strategy = DownloadStrategy(home=tmpdir.strpath)
+    bundles = [
+        AioDownloadBundle('http://test.example.com/cafe.html'),
+        AioDownloadBundle('http://test.example.com/cafe.html'),     # same URL, same file
+        AioDownloadBundle('http://test.example.com/café.html'),     # same file path once cleaned, different URL
+        AioDownloadBundle('http://test.example.com/other.html'),
+    ]
+    file_path = download_strategy.get_file_path(bundles[0])
+
+    collisions = download_strategy.plan_file_paths(bundles)
+
+    assert collisions == [bundles[2]]
+    assert bundles[0].file_path == bundles[1].file_path == file_path
+    assert bundles[2].file_path not in (file_path, bundles[3].file_path)
+    assert bundles[2].file_path.endswith('.html')
+
+
+def test_download_strategy_plan_file_paths_directory(tmpdir):
+
+    download_strategy = DownloadStrategy(home=tmpdir.strpath)
+    bundles = [
+        AioDownloadBundle('http://test.example.com/a'),
+        AioDownloadBundle('http://test.example.com/a/b'),     # needs a/ to be a directory
+    ]
+    bundles[1].file_path = os.path.sep.join([tmpdir.strpath, 'planned'])
+
+    assert download_strategy.plan_file_paths(bundles) == []
+    assert bundles[1].file_path == os.path.sep.join([tmpdir.strpath, 'planned'])    # left alone
+
+    bundles[1].file_path = None
+    collisions = download_strategy.plan_file_paths(bundles)
+
+    assert collisions == [bundles[0]]
+    assert bundles[1].file_path == download_strategy.get_file_path(bundles[1])
+
+
+def test_download_strategy_set_encoding(bundle, download_strategy):
+
+    file_path = bundle.file_path
+
+    download_strategy.set_encoding(bundle, 'gzip')
+    assert bundle.file_path == file_path + '.gz'
+
+    download_strategy.set_encoding(bundle, 'br')
+    assert (bundle.encoding, bundle.file_path) == ('br', file_path + '.br')
+
+    download_strategy.set_encoding(bundle, None)
+    assert (bundle.encoding, bundle.file_path) == (None, file_path)
+
+    with pytest.raises(ValueError):
+        DownloadStrategy(resume=True, recompress=True)
@@ -1,6 +1,9 @@
 import os
 
-from aiodownload.util import clean_filename, make_dirs, default_url_transform
+from aiodownload.util import (
+    clean_filename, disambiguate_path, make_dirs, default_url_transform, get_encoding_suffix, get_netloc,
+    get_range_start, get_retry_after, get_validator
+)
 
 
 def test_clean_filename():
@@ -10,6 +13,23 @@ def test_clean_filename():
     assert sanitized_filename == 'francais.txt'
 
 
+def test_clean_filename_replacements():
+
+    assert clean_filename('a b/c?d=e;f,g.txt') == 'a bcd_e-f.g.txt'
+    assert clean_filename('ﬁle (1).txt') == 'file (1).txt'    # ligature decomposed by NFKD
+
+
+def test_disambiguate_path():
+
+    file_path = os.path.sep.join(['home', 'page.html'])
+    disambiguated = disambiguate_path(file_path, 'http://example.com/page.html?a=1')
+
+    assert disambiguated != file_path
+    assert disambiguated == disambiguate_path(file_path, 'http://example.com/page.html?a=1')
+    assert os.path.dirname(disambiguated) == 'home'
+    assert disambiguated.startswith(os.path.join('home', 'page-')) and disambiguated.endswith('.html')
+
+
 def test_make_dirs(tmpdir):
 
     test_path = os.path.sep.join([tmpdir.strpath, 'test', 'make', 'dir'])
@@ -38,3 +58,42 @@ def test_default_url_transformation_with_params():
     transformed_url = default_url_transform('http://test.example.com/admin/Servlet;jsessionid=01A2B3C4D5E6F7GH')
 
     assert transformed_url == os.path.sep.join(['test.example.com', 'admin', 'Servlet(jsessionid_01A2B3C4D5E6F7GH)'])
+
+
+def test_get_netloc():
+
+    assert get_netloc('http://test.example.com:8080/get-some-data?a=1') == 'test.example.com:8080'
+
+
+def test_get_range_start():
+
+    assert get_range_start('bytes 100-199/200') == 100
+    assert get_range_start('bytes */200') is None
+    assert get_range_start(None) is None
+
+
+def test_get_validator():
+
+    assert get_validator({'ETag': '"v1"', 'Last-Modified': 'Wed, 21 Oct 2015 07:28:00 GMT'}) == '"v1"'
+    assert get_validator({'ETag': 'W/"v1"', 'Last-Modified': 'Wed, 21 Oct 2015 07:28:00 GMT'}) == \
+        'Wed, 21 Oct 2015 07:28:00 GMT'
+    assert get_validator({}) is None
+
+
+def test_get_encoding_suffix():
+
+    assert get_encoding_suffix('gzip') == '.gz'
+    assert get_encoding_suffix('GZIP, br') == '.gz.br'
+    assert get_encoding_suffix('zstd') == '.zst'
+    assert get_encoding_suffix('x-custom') == '.x-custom'
+    assert get_encoding_suffix('identity') == ''
+    assert get_encoding_suffix('') == ''
+
+
+def test_get_retry_after():
+
+    assert get_retry_after({'Retry-After': '5'}) == 5
+    assert get_retry_after({'Retry-After': 'Thu, 01 Jan 1970 00:01:40 GMT'}, now=40) == 60
+    assert get_retry_after({'Retry-After': 'Thu, 01 Jan 1970 00:01:40 GMT'}, now=400) == 0
+    assert get_retry_after({'Retry-After': 'soon'}) is None
+    assert get_retry_after({}) is None